@@ -1,9 +1,6 @@
 #!/bin/sh
 set -e
 
-echo "📌 Génération des migrations..."
-python3 manage.py makemigrations  flashcroquisapi 
-
 echo "📌 Application des migrations..."
 python3 manage.py migrate --noinput
 
@@ -24,5 +21,5 @@ else:
     print("ℹ️ Superuser déjà existant")
 END
 
-echo "📌 Lancement du serveur Django..."
+echo "📌 Lancement du serveur..."
 exec "$@"
@@ -0,0 +1,44 @@
+import os
+import sys
+
+from django.apps import AppConfig
+
+
+SERVERS = ('gunicorn', 'uvicorn')
+
+
+def _is_serving():
+    """Vrai sous gunicorn, uvicorn ou `runserver` (processus rechargé)
+    
+    Les commandes de gestion (`manage.py`, `django-admin`), les scripts et
+    les tests ne démarrent ni QGIS, ni le nettoyage, ni l'ordonnanceur.
+    """
+    if 'pytest' in sys.modules:
+        return False
+    if any(server in sys.modules for server in SERVERS):
+        return True
+    return sys.argv[1:2] == ['runserver'] and (
+        os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+    )
+
+
+class FlashcroquisapiConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "flashcroquisapi"
+    verbose_name = "FlashCroquis API"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .qgis_manager import get_startup_config, warm_up
+        from .reaper import get_reaper_config, start_reaper
+        from .scheduler import get_job_scheduler
+
+        if not _is_serving():
+            return
+        if get_startup_config()['WARMUP']:
+            warm_up()
+        if get_reaper_config()['ENABLED']:
+            start_reaper()
+        # Reprendre les jobs `pending` et libérer ceux abandonnés par un
+        # processus arrêté sans attendre la prochaine soumission
+        get_job_scheduler().notify()
@@ -0,0 +1,179 @@
+"""
+Variantes asynchrones des points d'accès légers, servies sous /api/async/.
+
+Sous ASGI (`asgi.py`), ces vues attendent la base via l'ORM asynchrone et
+le pool QGIS via `arun_qgis_task` sans occuper de thread pendant l'attente :
+un seul processus peut ainsi suivre des milliers de clients qui interrogent
+le statut de leurs jobs pendant que les rendus s'exécutent dans les workers
+QGIS. Les réponses gardent l'enveloppe de `standard_response`.
+
+Ce sont de simples vues Django (DRF n'exécute pas de vues asynchrones) ;
+sous WSGI elles restent fonctionnelles, exécutées dans une boucle dédiée.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Sum
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import JSONParser
+
+from .models import ProjectSession, Layer, ProcessingJob
+from .renderers import dumps
+from .serializers import ProjectSessionSerializer, LayerSerializer, ProcessingJobSerializer, MapRenderSerializer
+from .utils import make_etag, conditional_response, set_validators, response_body, handle_exception
+from .views import health_status, ping_status, prepare_map_render, map_render_result, pool_saturated_response
+from .worker_pool import arun_qgis_task, WorkerPoolSaturated
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(success, data=None, message=None, error=None, status_code=200, metadata=None):
+    """`standard_response` hors DRF"""
+    return HttpResponse(
+        dumps(response_body(success, data, message, error, metadata)),
+        status=status_code, content_type='application/json'
+    )
+
+
+def exception_response(e, context, message):
+    """`handle_exception` hors DRF ; 404 pour un objet introuvable"""
+    if isinstance(e, Http404):
+        return json_response(success=False, error=str(e), message=message, status_code=404)
+    return handle_exception(e, context, message, respond=json_response)
+
+
+@require_GET
+async def health_ping(request):
+    """Endpoint de test pour vérifier que le service est actif"""
+    return json_response(**ping_status())
+
+
+@require_GET
+async def health(request):
+    """Sonde de disponibilité : 503 tant que QGIS n'est pas prêt dans ce processus
+    
+    L'initialisation éventuelle de QGIS est lancée hors de la boucle.
+    """
+    return json_response(**await sync_to_async(health_status, thread_sensitive=False)())
+
+
+@require_GET
+async def session_list(request):
+    """Liste des sessions, 304 si aucune session n'a changé"""
+    try:
+        summary = await ProjectSession.objects.aaggregate(
+            count=Count('session_id'),
+            revisions=Sum('revision'),
+            last_accessed=Max('last_accessed'),
+            modified_at=Max('modified_at'),
+        )
+        etag = make_etag('sessions', summary['count'], summary['revisions'], summary['last_accessed'])
+        last_modified = max(filter(None, (summary['last_accessed'], summary['modified_at'])), default=None)
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        sessions = [session async for session in ProjectSession.objects.all()]
+        response = HttpResponse(
+            dumps(ProjectSessionSerializer(sessions, many=True).data), content_type='application/json'
+        )
+        return set_validators(response, etag, last_modified)
+
+    except Exception as e:
+        return exception_response(e, "list_sessions", "Impossible de récupérer les sessions")
+
+
+@require_GET
+async def session_detail(request, session_id):
+    """Détail d'une session, 304 si sa révision n'a pas changé"""
+    try:
+        session = await aget_object_or_404(ProjectSession, session_id=session_id)
+        etag = make_etag('session', session.session_id, session.revision, session.last_accessed)
+        last_modified = max(session.last_accessed, session.modified_at)
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = HttpResponse(dumps(ProjectSessionSerializer(session).data), content_type='application/json')
+        return set_validators(response, etag, last_modified)
+
+    except Exception as e:
+        return exception_response(e, "get_session", "Impossible de récupérer la session")
+
+
+@require_GET
+async def layer_list(request):
+    """Obtenir la liste détaillée des couches de la session courante"""
+    try:
+        session_id = request.GET.get('session_id')
+        if not session_id:
+            return json_response(
+                success=False,
+                error="session_id is required",
+                message="L'identifiant de session est requis",
+                status_code=400
+            )
+
+        session = await aget_object_or_404(ProjectSession, session_id=session_id)
+        etag = make_etag('layers', session.session_id, session.revision)
+        not_modified = conditional_response(request, etag, session.modified_at)
+        if not_modified is not None:
+            return not_modified
+
+        layers = [layer async for layer in Layer.objects.filter(session=session).order_by('pk')]
+
+        return set_validators(json_response(
+            success=True,
+            data=LayerSerializer(layers, many=True).data,
+            message=f"{len(layers)} couches récupérées"
+        ), etag, session.modified_at)
+
+    except Exception as e:
+        return exception_response(e, "get_layers", "Impossible de récupérer la liste des couches")
+
+
+@require_GET
+async def job_status(request, job_id):
+    """Obtenir le statut d'un job de traitement"""
+    try:
+        job = await aget_object_or_404(ProcessingJob, job_id=job_id)
+
+        return json_response(
+            success=True,
+            data=ProcessingJobSerializer(job).data,
+            message=f"Job {job.get_status_display().lower()}"
+        )
+
+    except Exception as e:
+        return exception_response(e, "get_processing_job", "Impossible de récupérer le job de traitement")
+
+
+@csrf_exempt
+@require_POST
+async def map_render(request):
+    """Générer un rendu de carte ; le rendu est attendu sans bloquer la boucle"""
+    try:
+        try:
+            serializer = MapRenderSerializer(data=JSONParser().parse(request))
+            serializer.is_valid(raise_exception=True)
+        except (ParseError, ValidationError) as e:
+            return json_response(
+                success=False, error=e.detail, message="Paramètres de rendu invalides", status_code=400
+            )
+
+        session = await aget_object_or_404(ProjectSession, session_id=serializer.validated_data['session_id'])
+        render = await sync_to_async(prepare_map_render)(session, serializer)
+        result = None
+        if render['cached'] is None:
+            result = await arun_qgis_task('render_map', render['payload'])
+
+        return json_response(**await sync_to_async(map_render_result)(request, session, render, result))
+
+    except WorkerPoolSaturated as e:
+        return pool_saturated_response(e, json_response)
+    except Exception as e:
+        return exception_response(e, "render_map", "Impossible de générer le rendu de la carte")
@@ -0,0 +1,156 @@
+"""
+Téléchargement des fichiers générés.
+
+Le contenu est servi par `FileResponse` : sous un serveur WSGI qui fournit
+`wsgi.file_wrapper` (gunicorn), les octets partent par `os.sendfile` sans
+repasser par Python. Les requêtes `Range` (un seul intervalle) reçoivent une
+réponse 206 bornée. En mode déchargement, Django ne renvoie qu'un en-tête
+`X-Accel-Redirect` (nginx) ou `X-Sendfile` (Apache, lighttpd) et le proxy
+frontal sert le fichier, Range compris.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import parse_http_date_safe, quote_etag
+
+DEFAULT_DOWNLOAD_CONFIG = {
+    'OFFLOAD': None,
+    'ACCEL_PREFIX': '/protected-media/',
+    'BLOCK_SIZE': 256 * 1024,
+}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def get_download_config():
+    """Configuration des téléchargements fusionnée avec les valeurs par défaut"""
+    config = dict(DEFAULT_DOWNLOAD_CONFIG)
+    config.update(getattr(settings, 'FILE_DOWNLOADS', {}))
+    return config
+
+
+class BoundedFile:
+    """Fenêtre [start, start + length) d'un fichier ouvert
+    
+    `fileno()` et `tell()` restent exposés : `wsgi.file_wrapper` envoie par
+    sendfile depuis la position courante, borné par Content-Length ; le repli
+    par `read()` ne dépasse jamais la fin de la fenêtre.
+    """
+
+    def __init__(self, f, start, length):
+        self._file = f
+        self._remaining = length
+        f.seek(start)
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+def parse_range(header, size):
+    """Intervalle (début, fin inclusive) d'un en-tête Range, ou None pour ignorer l'en-tête
+    
+    Les intervalles multiples sont ignorés (réponse complète) ; un intervalle
+    hors du fichier lève RangeNotSatisfiable.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first == '':
+        if last == '':
+            return None
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def _range_applies(request, etag, last_modified):
+    """If-Range : l'intervalle ne vaut que si la représentation n'a pas changé"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == quote_etag(etag)
+    since = parse_http_date_safe(if_range)
+    return since is not None and last_modified is not None and int(last_modified.timestamp()) <= since
+
+
+def offload_response(generated_file, content_type, offload, config):
+    """Réponse vide déléguant l'envoi du fichier au proxy frontal"""
+    response = HttpResponse(content_type=content_type)
+    if offload == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = config['ACCEL_PREFIX'].rstrip('/') + '/' + generated_file.file_path.name
+    else:
+        response['X-Sendfile'] = generated_file.file_path.path
+    return response
+
+
+def file_response(request, generated_file, etag, last_modified):
+    """Réponse de téléchargement d'un `GeneratedFile` (complète, partielle ou déléguée)"""
+    config = get_download_config()
+    path = generated_file.file_path.path
+    content_type = mimetypes.guess_type(generated_file.name)[0] or mimetypes.guess_type(path)[0] \
+        or 'application/octet-stream'
+
+    offload = (config['OFFLOAD'] or '').lower()
+    if offload in ('x-accel-redirect', 'x-sendfile'):
+        response = offload_response(generated_file, content_type, offload, config)
+        response['Content-Disposition'] = f'attachment; filename="{generated_file.name}"'
+        return response
+
+    size = os.path.getsize(path)
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and _range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    f = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, as_attachment=True, filename=generated_file.name, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            BoundedFile(f, start, end - start + 1),
+            status=206,
+            as_attachment=True,
+            filename=generated_file.name,
+            content_type=content_type
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.block_size = config['BLOCK_SIZE']
+    response['Accept-Ranges'] = 'bytes'
+    return response
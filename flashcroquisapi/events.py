@@ -0,0 +1,294 @@
+"""
+Diffusion en direct de l'avancement des `ProcessingJob` (Server-Sent Events).
+
+L'ordonnanceur publie chaque avancement, ligne de journal et changement de
+statut d'un job sur `job_events`, un pub/sub en mémoire du processus ; le
+flux SSE d'un client abonné les reçoit immédiatement. Lorsque le job
+s'exécute dans un autre processus (plusieurs workers gunicorn), rien n'est
+publié localement : le flux relit alors la ligne du job en base toutes les
+`DB_POLL_INTERVAL` secondes, l'avancement y étant enregistré au plus toutes
+les `PROGRESS_WRITE_INTERVAL` secondes.
+
+Sous WSGI, chaque flux occupe un thread de requête : leur nombre est borné
+par `MAX_STREAMS`. Sous ASGI, le flux est un générateur asynchrone qui
+n'occupe aucun thread pendant l'attente, borné par `MAX_ASYNC_STREAMS`.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+
+DEFAULT_JOB_EVENTS_CONFIG = {
+    'HEARTBEAT': 15.0,
+    'DB_POLL_INTERVAL': 1.0,
+    'PROGRESS_WRITE_INTERVAL': 0.5,
+    'LOG_LINES': 50,
+    'MAX_DURATION': 3600,
+    'MAX_STREAMS': 4,
+    'MAX_ASYNC_STREAMS': 1000,
+}
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+def get_job_events_config():
+    """Configuration des flux d'événements fusionnée avec les valeurs par défaut"""
+    config = dict(DEFAULT_JOB_EVENTS_CONFIG)
+    config.update(getattr(settings, 'JOB_EVENTS', {}))
+    return config
+
+
+class JobEventBroker:
+    """Pub/sub en mémoire : une file par abonné, indexée par job
+
+    Les files des flux synchrones sont des `queue.SimpleQueue` ; celles des
+    flux asynchrones des `asyncio.Queue`, alimentées depuis le thread de
+    publication via la boucle de l'abonné.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(dict)
+
+    def _add(self, job_id, events, deliver):
+        with self._lock:
+            self._subscribers[str(job_id)][events] = deliver
+        return events
+
+    def subscribe(self, job_id):
+        events = queue.SimpleQueue()
+        return self._add(job_id, events, events.put)
+
+    def asubscribe(self, job_id):
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        return self._add(job_id, events, lambda item: loop.call_soon_threadsafe(events.put_nowait, item))
+
+    def unsubscribe(self, job_id, events):
+        with self._lock:
+            subscribers = self._subscribers.get(str(job_id))
+            if subscribers is not None:
+                subscribers.pop(events, None)
+                if not subscribers:
+                    del self._subscribers[str(job_id)]
+
+    def publish(self, job_id, event, data):
+        """Remettre un événement à tous les abonnés du job ; sans abonné, ne fait rien"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(job_id), {}).values())
+        for deliver in subscribers:
+            try:
+                deliver((event, data))
+            except RuntimeError:
+                pass  # boucle de l'abonné fermée : il se désabonne en sortant
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+job_events = JobEventBroker()
+
+
+class _StreamSlots:
+    """Places de flux ouverts dans ce processus, par mode (synchrone ou asynchrone)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = {'sync': 0, 'async': 0}
+
+    def acquire(self, kind, limit):
+        with self._lock:
+            if self._open[kind] >= limit:
+                return False
+            self._open[kind] += 1
+            return True
+
+    def release(self, kind):
+        with self._lock:
+            self._open[kind] -= 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._open)
+
+
+stream_slots = _StreamSlots()
+
+
+class _Slot:
+    """Place libérée une seule fois, à la fermeture de la réponse"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        stream_slots.release(self.kind)
+
+
+class _SyncJobStream:
+    def __init__(self, events, slot):
+        self._events = events
+        self._slot = slot
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        self._events.close()
+        self._slot.release()
+
+
+class _AsyncJobStream:
+    def __init__(self, events, slot):
+        self._events = events
+        self._slot = slot
+
+    def __aiter__(self):
+        return self._events
+
+    def close(self):
+        # Le générateur est fermé par le gestionnaire ASGI (aclosing)
+        self._slot.release()
+
+
+def open_job_stream(job, asynchronous=False):
+    """Flux SSE d'un job pour StreamingHttpResponse, ou None si la limite de flux est atteinte
+
+    La place est rendue à la fermeture de la réponse, que le flux soit allé à
+    son terme ou que le client se soit déconnecté.
+    """
+    config = get_job_events_config()
+    kind = 'async' if asynchronous else 'sync'
+    if not stream_slots.acquire(kind, config['MAX_ASYNC_STREAMS' if asynchronous else 'MAX_STREAMS']):
+        return None
+    slot = _Slot(kind)
+    if asynchronous:
+        return _AsyncJobStream(astream_job_events(job, config), slot)
+    return _SyncJobStream(stream_job_events(job, config), slot)
+
+
+def format_event(event, data):
+    """Message SSE `event:` / `data:` encodé"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+    return f"event: {event}\ndata: {payload}\n\n".encode('utf-8')
+
+
+def _job_state(job):
+    return {'job_id': str(job.job_id), 'status': job.status, 'progress': job.progress}
+
+
+def _terminal_event(job):
+    data = _job_state(job)
+    if job.status == 'completed':
+        data['result'] = job.result
+    elif job.status == 'failed':
+        data['error'] = job.error
+    return format_event('status', data)
+
+
+class _JobStreamState:
+    """Déroulé d'un flux, commun aux générateurs synchrone et asynchrone
+
+    Chaque méthode renvoie (messages à envoyer, fin du flux).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.last_seen = None
+        self.last_sent = time.monotonic()
+        self.deadline = self.last_sent + config['MAX_DURATION']
+
+    def running(self):
+        return time.monotonic() < self.deadline
+
+    def start(self, job):
+        if job.status in TERMINAL_STATUSES:
+            return [b"retry: 2000\n\n", _terminal_event(job)], True
+        self.last_seen = (job.status, job.progress)
+        return [b"retry: 2000\n\n", format_event('status', _job_state(job))], False
+
+    def on_event(self, event, data):
+        self.last_sent = time.monotonic()
+        done = event == 'status' and data.get('status') in TERMINAL_STATUSES
+        return [format_event(event, data)], done
+
+    def on_poll(self, job):
+        """Job relu en base faute d'événement local (exécuté par un autre processus ou silencieux)"""
+        if job is None:
+            return [format_event('status', {'status': 'deleted'})], True
+        if job.status in TERMINAL_STATUSES:
+            return [_terminal_event(job)], True
+        if (job.status, job.progress) != self.last_seen:
+            self.last_seen = (job.status, job.progress)
+            self.last_sent = time.monotonic()
+            return [format_event('status', _job_state(job))], False
+        if time.monotonic() - self.last_sent >= self.config['HEARTBEAT']:
+            self.last_sent = time.monotonic()
+            return [b": keep-alive\n\n"], False
+        return [], False
+
+
+def stream_job_events(job, config=None):
+    """Générateur SSE : état initial, avancement, journal puis statut final
+
+    S'abonne avant de relire le job pour ne perdre aucun événement publié
+    entre la lecture et l'abonnement.
+    """
+    from .models import ProcessingJob
+
+    state = _JobStreamState(config or get_job_events_config())
+    job_id = job.job_id
+    events = job_events.subscribe(job_id)
+    try:
+        job.refresh_from_db()
+        messages, done = state.start(job)
+        yield from messages
+        while not done and state.running():
+            try:
+                event, data = events.get(timeout=state.config['DB_POLL_INTERVAL'])
+            except queue.Empty:
+                job = ProcessingJob.objects.filter(job_id=job_id).first()
+                close_old_connections()
+                messages, done = state.on_poll(job)
+            else:
+                messages, done = state.on_event(event, data)
+            yield from messages
+    finally:
+        job_events.unsubscribe(job_id, events)
+
+
+async def astream_job_events(job, config=None):
+    """Équivalent asynchrone de `stream_job_events`, servi sous ASGI"""
+    from .models import ProcessingJob
+
+    state = _JobStreamState(config or get_job_events_config())
+    job_id = job.job_id
+    events = job_events.asubscribe(job_id)
+    try:
+        await job.arefresh_from_db()
+        messages, done = state.start(job)
+        for message in messages:
+            yield message
+        while not done and state.running():
+            try:
+                event, data = await asyncio.wait_for(events.get(), state.config['DB_POLL_INTERVAL'])
+            except asyncio.TimeoutError:
+                messages, done = state.on_poll(await ProcessingJob.objects.filter(job_id=job_id).afirst())
+            else:
+                messages, done = state.on_event(event, data)
+            for message in messages:
+                yield message
+    finally:
+        job_events.unsubscribe(job_id, events)
@@ -0,0 +1,168 @@
+"""
+Lecture des entités des couches vectorielles de session.
+
+La lecture s'exécute dans les workers QGIS (tâche `layer_features`) sur une
+instance de QgsVectorLayer ouverte à partir de `Layer.source`, sans utiliser
+le projet partagé de la session, et gardée ouverte d'une page à l'autre. Les
+flux GeoJSON et NDJSON sont produits côté web en enchaînant des pages par
+curseur : chaque page est une lecture bornée de la source, à mémoire
+constante et sans QGIS dans le processus web.
+"""
+import base64
+import json
+
+from .qgis_manager import get_qgis_manager
+from .utils import to_json_value
+
+STREAM_FORMATS = ('geojson-stream', 'ndjson')
+
+# Entités par tâche lorsque la couche est diffusée en flux
+STREAM_PAGE_SIZE = 1000
+
+
+def build_feature_request(vector_layer, field_names=None, bbox=None, filter_expression=None):
+    """Préparer une QgsFeatureRequest limitée aux attributs, à l'emprise et au filtre demandés
+    
+    Le rectangle passe par l'index spatial du fournisseur ; l'expression est
+    analysée une seule fois, par la requête qui la conserve, puis confiée au
+    fournisseur, qui la compile en SQL lorsqu'il le peut et l'évalue côté
+    client sinon.
+    """
+    classes = get_qgis_manager().get_classes()
+    request = classes['QgsFeatureRequest']()
+    if field_names is not None:
+        request.setSubsetOfAttributes(field_names, vector_layer.fields())
+    if bbox:
+        values = [float(v) for v in bbox.split(',')]
+        if len(values) != 4:
+            raise ValueError(f"bbox invalide: {bbox}")
+        request.setFilterRect(classes['QgsRectangle'](*values))
+    if filter_expression:
+        request.setFilterExpression(filter_expression)
+        expression = request.filterExpression()
+        if expression.hasParserError():
+            raise ValueError(f"Expression de filtre invalide: {expression.parserErrorString()}")
+    return request
+
+
+def encode_cursor(feature_id):
+    """Curseur opaque pointant après l'entité `feature_id`"""
+    raw = json.dumps({'fid': feature_id}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Identifiant d'entité contenu dans un curseur ; lève ValueError s'il est invalide"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return int(json.loads(raw)['fid'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Curseur invalide") from e
+
+
+def page_after(vector_layer, request, after_fid, limit):
+    """Page d'entités d'identifiant strictement supérieur à `after_fid`
+    
+    Pour une source OGR (shapefile, GeoPackage...), le curseur est un filtre
+    attributaire `FID > n` posé sur cette instance de couche et combiné à son
+    subset éventuel : le pilote le lit nativement, dans l'ordre des FID, et
+    `setLimit` arrête la lecture après la page. Les autres fournisseurs
+    reçoivent `$id > n` et un tri par identifiant dans la requête, au prix
+    d'une lecture complète lorsqu'ils ne savent pas les compiler.
+    Renvoie (entités, curseur suivant).
+    """
+    subset = vector_layer.subsetString()
+    cursor_subset = None
+    if after_fid is not None and vector_layer.providerType() == 'ogr':
+        condition = f"FID > {int(after_fid)}"
+        cursor_subset = f"({subset}) AND {condition}" if subset else condition
+        if not vector_layer.setSubsetString(cursor_subset):
+            cursor_subset = None
+    if vector_layer.providerType() != 'ogr' or (after_fid is not None and cursor_subset is None):
+        # Hors OGR, ou pilote OGR refusant le filtre sur le FID
+        if after_fid is not None:
+            request.combineFilterExpression(f"$id > {int(after_fid)}")
+        request.addOrderBy('$id')
+    request.setLimit(limit + 1)
+    try:
+        features = list(vector_layer.getFeatures(request))
+    finally:
+        if cursor_subset is not None:
+            vector_layer.setSubsetString(subset)
+    has_more = len(features) > limit
+    features = features[:limit]
+    next_cursor = encode_cursor(features[-1].id()) if has_more and features else None
+    return features, next_cursor
+
+
+def selected_fields(vector_layer, fields_param):
+    """Noms des champs à exporter ; lève ValueError pour un champ inconnu"""
+    available = vector_layer.fields().names()
+    if not fields_param:
+        return available
+    names = [name.strip() for name in fields_param.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"Champs inconnus: {', '.join(unknown)}")
+    return names
+
+
+def _geometry_json(feature, simplify=None, precision=8):
+    """Géométrie GeoJSON sérialisée, ou 'null'"""
+    if not feature.hasGeometry():
+        return 'null'
+    geometry = feature.geometry()
+    if simplify:
+        geometry = geometry.simplify(simplify)
+    return geometry.asJson(precision)
+
+
+def _properties(feature, field_names):
+    return {name: to_json_value(feature[name]) for name in field_names}
+
+
+def feature_to_geojson(feature, field_names, simplify=None, precision=8):
+    """Entité QGIS en dictionnaire GeoJSON"""
+    return {
+        'type': 'Feature',
+        'id': feature.id(),
+        'geometry': json.loads(_geometry_json(feature, simplify, precision)),
+        'properties': _properties(feature, field_names),
+    }
+
+
+def feature_to_json(feature, field_names, simplify=None, precision=8):
+    """Entité QGIS en chaîne GeoJSON, sans repasser la géométrie par un dict"""
+    return '{"type":"Feature","id":%d,"geometry":%s,"properties":%s}' % (
+        feature.id(),
+        _geometry_json(feature, simplify, precision),
+        json.dumps(_properties(feature, field_names), ensure_ascii=False, separators=(',', ':')),
+    )
+
+
+def iter_pages(fetch_page, page):
+    """Entités (chaînes GeoJSON) de `page` puis des pages suivantes
+    
+    `fetch_page(after_fid)` lit la page suivant l'entité `after_fid`.
+    """
+    while True:
+        yield from page['features']
+        if not page['next']:
+            return
+        page = fetch_page(decode_cursor(page['next']))
+
+
+def iter_geojson(features):
+    """FeatureCollection GeoJSON produite entité par entité"""
+    yield b'{"type":"FeatureCollection","features":['
+    separator = b''
+    for feature in features:
+        yield separator + feature.encode('utf-8')
+        separator = b','
+    yield b']}'
+
+
+def iter_ndjson(features):
+    """Une entité GeoJSON par ligne"""
+    for feature in features:
+        yield feature.encode('utf-8') + b'\n'
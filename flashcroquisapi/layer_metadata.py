@@ -0,0 +1,117 @@
+"""
+Cache des métadonnées de couches (étendue, SCR, nombre d'entités, bandes).
+
+`layer.extent()` et `featureCount()` parcourent toute la source lorsque le
+fichier ne stocke pas ces valeurs (shapefile sans .shx à jour, texte
+délimité...). Les métadonnées calculées par `format_layer_info` sont donc
+gardées en mémoire par source, avec la signature du fichier : date de
+modification et taille du fichier principal et de ses fichiers annexes.
+Une source modifiée ou remplacée change de signature et est recalculée.
+
+Le même enregistrement est persisté sur `Layer.metadata` ; il accompagne les
+couches dans le payload des tâches, ce qui évite aux workers QGIS de refaire
+le calcul après un redémarrage. Ce module n'utilise pas l'ORM.
+"""
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+LAYER_METADATA_MAX = 1024
+
+# Fichiers modifiés sans toucher au fichier principal
+SIDECAR_SUFFIXES = {
+    '.shp': ('.dbf', '.shx'),
+    '.gpkg': ('-wal',),
+    '.sqlite': ('-wal',),
+}
+
+_metadata = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def source_path(source):
+    """Chemin du fichier d'une source QGIS, ou None pour une source hors fichier"""
+    if not source or source.startswith('memory:'):
+        return None
+    if source.startswith('file://'):
+        return unquote(urlparse(source).path)
+    path = source.split('|')[0]
+    return path if os.path.isabs(path) else None
+
+
+def source_signature(source):
+    """Signature `mtime:taille` de la source et de ses annexes, None si non applicable"""
+    path = source_path(source)
+    if path is None:
+        return None
+    base, extension = os.path.splitext(path)
+    parts = []
+    for candidate in (path, *(
+        (base if suffix.startswith('.') else path) + suffix
+        for suffix in SIDECAR_SUFFIXES.get(extension.lower(), ())
+    )):
+        try:
+            stat = os.stat(candidate)
+        except OSError:
+            if candidate == path:
+                return None
+            continue
+        parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return '/'.join(parts)
+
+
+def lookup(source, signature=None):
+    """Métadonnées en cache de la source si sa signature n'a pas changé"""
+    signature = signature or source_signature(source)
+    if signature is None:
+        return None
+    with _lock:
+        entry = _metadata.get(source)
+        if entry is None or entry[0] != signature:
+            _stats['misses'] += 1
+            return None
+        _metadata.move_to_end(source)
+        _stats['hits'] += 1
+        return dict(entry[1])
+
+
+def store(source, info, signature=None):
+    """Mémoriser les métadonnées d'une source ; renvoie l'enregistrement à persister"""
+    signature = signature or source_signature(source)
+    if signature is None:
+        return None
+    info = {key: value for key, value in info.items() if key not in ('id', 'name')}
+    with _lock:
+        _metadata[source] = (signature, info)
+        _metadata.move_to_end(source)
+        while len(_metadata) > LAYER_METADATA_MAX:
+            _metadata.popitem(last=False)
+    return {'source': source, 'signature': signature, 'info': info}
+
+
+def record(source):
+    """Enregistrement courant d'une source, tel que persisté sur `Layer.metadata`"""
+    with _lock:
+        entry = _metadata.get(source)
+    if entry is None:
+        return None
+    return {'source': source, 'signature': entry[0], 'info': dict(entry[1])}
+
+
+def seed(metadata, source=None):
+    """Charger un enregistrement persisté, sans écraser une entrée déjà présente
+    
+    `source` remplace la clé enregistrée, par exemple par la source telle que
+    QGIS la normalise à l'ouverture de la couche.
+    """
+    if not metadata or not metadata.get('signature'):
+        return
+    with _lock:
+        _metadata.setdefault(source or metadata['source'], (metadata['signature'], metadata['info']))
+
+
+def stats():
+    with _lock:
+        return {'entries': len(_metadata), **_stats}
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from flashcroquisapi.reaper import claim_run, reap
+
+
+class Command(BaseCommand):
+    help = (
+        "Expirer les sessions inactives, appliquer les quotas disque et rapporter l'espace libéré. "
+        "Les projets en mémoire des processus serveur ne sont pas évincés : un projet de session "
+        "supprimée réécrit ensuite en .qgz est retiré par le passage suivant."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, help="Inactivité (secondes) au-delà de laquelle une session expire")
+        parser.add_argument('--quota', type=int, help="Quota disque par session en octets (0 : aucun)")
+        parser.add_argument('--dry-run', action='store_true', help="Rapporter sans rien supprimer")
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Nettoyer même si un autre processus a réservé le nettoyage de la période"
+        )
+
+    def handle(self, *args, **options):
+        if not (options['dry_run'] or options['force'] or claim_run()):
+            self.stdout.write("Nettoyage déjà effectué ou en cours pour cette période (--force pour l'imposer)")
+            return
+        report = reap(ttl=options['ttl'], quota_bytes=options['quota'], dry_run=options['dry_run'])
+
+        prefix = "[simulation] " if report['dry_run'] else ""
+        self.stdout.write(
+            f"{prefix}Sessions expirées: {report['expired_sessions']} "
+            f"({report['expired_files']} fichiers, {report['expired_bytes']} octets)"
+        )
+        self.stdout.write(
+            f"{prefix}Quotas dépassés: {report['quota_sessions']} sessions "
+            f"({report['quota_files']} fichiers, {report['quota_bytes']} octets)"
+        )
+        self.stdout.write(
+            f"{prefix}Projets orphelins: {report['orphan_files']} fichiers ({report['orphan_bytes']} octets)"
+        )
+        self.stdout.write(self.style.SUCCESS(f"{prefix}Espace libéré: {report['reclaimed_bytes']} octets"))
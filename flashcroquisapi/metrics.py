@@ -0,0 +1,307 @@
+"""
+Mesures de performance des requêtes, agrégées en histogrammes en mémoire.
+
+`RequestMetricsMiddleware` mesure pour chaque action DRF (`map.render`,
+`layer.features`, ...) la durée totale, le nombre et la durée des requêtes
+SQL, le temps passé dans les tâches QGIS et la taille de la réponse.
+`/api/health/metrics/` expose ces histogrammes au format texte Prometheus,
+avec les quantiles p50/p95/p99 estimés à partir des seaux.
+
+Les histogrammes sont propres à chaque processus : avec plusieurs workers
+gunicorn, chaque processus publie ses propres valeurs.
+"""
+import bisect
+import contextvars
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_METRICS_CONFIG = {
+    'ENABLED': True,
+    'RENDER_PROFILE_SAMPLE_RATE': 0.0,
+}
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+QUANTILES = (0.5, 0.95, 0.99)
+
+METRICS = {
+    'flashcroquis_request_duration_seconds': ('Durée totale des requêtes', DURATION_BUCKETS),
+    'flashcroquis_request_db_queries': ('Requêtes SQL par requête HTTP', QUERY_COUNT_BUCKETS),
+    'flashcroquis_request_db_seconds': ('Temps SQL par requête HTTP', DURATION_BUCKETS),
+    'flashcroquis_request_qgis_seconds': ('Temps des tâches QGIS par requête HTTP', DURATION_BUCKETS),
+    'flashcroquis_response_bytes': ('Taille des réponses', BYTES_BUCKETS),
+    'flashcroquis_render_stage_seconds': ('Durée des étapes de rendu de carte', DURATION_BUCKETS),
+    'flashcroquis_render_layer_seconds': ('Durée de rendu d\'une couche, par fournisseur', DURATION_BUCKETS),
+}
+
+# Mesures de la requête en cours (SQL, QGIS), None hors requête
+_current = contextvars.ContextVar('flashcroquis_request_metrics', default=None)
+
+
+def get_metrics_config():
+    """Configuration des mesures fusionnée avec les valeurs par défaut"""
+    config = dict(DEFAULT_METRICS_CONFIG)
+    config.update(getattr(settings, 'METRICS', {}))
+    return config
+
+
+class Histogram:
+    """Histogramme à seaux fixes (compteurs non cumulés, cumulés à l'export)"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimation d'un quantile par interpolation linéaire dans son seau,
+        bornée par les valeurs extrêmes observées"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        estimate = self.max
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if index < len(self.buckets):
+                    lower = self.buckets[index - 1] if index else 0.0
+                    estimate = lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+                break
+            cumulative += bucket_count
+        return min(max(estimate, self.min), self.max)
+
+
+class MetricsRegistry:
+    """Histogrammes indexés par (mesure, étiquettes)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(METRICS[name][1])
+            histogram.observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: (list(h.counts), h.count, h.sum, {q: h.quantile(q) for q in QUANTILES})
+                for key, h in self._histograms.items()
+            }
+
+    def render_prometheus(self):
+        """Export au format texte Prometheus 0.0.4"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, (help_text, buckets) in METRICS.items():
+            series = sorted((labels, values) for (metric, labels), values in snapshot.items() if metric == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, (counts, count, total, _) in series:
+                label_text = _format_labels(labels)
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{label_text}}} {total:.6f}")
+                lines.append(f"{name}_count{{{label_text}}} {count}")
+            lines.append(f"# HELP {name}_quantile {help_text} (quantiles estimés)")
+            lines.append(f"# TYPE {name}_quantile gauge")
+            for labels, (_, _, _, quantiles) in series:
+                label_text = _format_labels(labels)
+                for q, value in quantiles.items():
+                    if value is not None:
+                        lines.append(f'{name}_quantile{{{label_text},quantile="{q}"}} {value:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+def _format_labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+registry = MetricsRegistry()
+
+
+class _RequestMeasures:
+    __slots__ = ('db_queries', 'db_seconds', 'qgis_seconds')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.qgis_seconds = 0.0
+
+
+def record_qgis_time(seconds):
+    """Ajouter la durée d'une tâche QGIS à la requête en cours"""
+    measures = _current.get()
+    if measures is not None:
+        measures.qgis_seconds += seconds
+
+
+def should_profile_render():
+    """Tirage des rendus profilés d'office, selon RENDER_PROFILE_SAMPLE_RATE"""
+    config = get_metrics_config()
+    return config['ENABLED'] and random.random() < config['RENDER_PROFILE_SAMPLE_RATE']
+
+
+def record_render_profile(profile):
+    """Ajouter le profil d'un rendu de carte aux histogrammes"""
+    if not get_metrics_config()['ENABLED']:
+        return
+    for stage, ms in profile['stages'].items():
+        registry.observe('flashcroquis_render_stage_seconds', (('stage', stage.removesuffix('_ms')),), ms / 1000)
+    for layer in profile['layers']:
+        registry.observe('flashcroquis_render_layer_seconds', (('provider', layer['provider']),), layer['ms'] / 1000)
+
+
+def _endpoint(request):
+    """Étiquette `basename.action` de la vue DRF, ou nom d'URL Django"""
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    view = match.func
+    actions = getattr(view, 'actions', None)
+    if actions:
+        basename = getattr(view, 'initkwargs', {}).get('basename') or view.cls.__name__
+        return f"{basename}.{actions.get(request.method.lower(), request.method.lower())}"
+    return match.url_name or match.view_name or 'other'
+
+
+def _response_bytes(response, on_done):
+    """Taille de la réponse ; pour un flux sans Content-Length, mesurée à la fin de l'envoi"""
+    if response.has_header('Content-Length'):
+        on_done(int(response['Content-Length']))
+    elif not response.streaming:
+        on_done(len(response.content))
+    elif getattr(response, 'file_to_stream', None) is None:
+        content = response.streaming_content
+
+        async def acounted():
+            sent = 0
+            try:
+                async for chunk in content:
+                    sent += len(chunk)
+                    yield chunk
+            finally:
+                on_done(sent)
+
+        def counted():
+            sent = 0
+            try:
+                for chunk in content:
+                    sent += len(chunk)
+                    yield chunk
+            finally:
+                on_done(sent)
+
+        response.streaming_content = acounted() if response.is_async else counted()
+
+
+def _count_query(execute, sql, params, many, context):
+    """Enveloppe SQL permanente : compte les requêtes de la requête HTTP en cours
+    
+    La mesure courante est lue dans une ContextVar, propagée par asgiref au
+    thread qui exécute l'ORM pour les vues asynchrones.
+    """
+    measures = _current.get()
+    if measures is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        measures.db_queries += 1
+        measures.db_seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class RequestMetricsMiddleware:
+    """Mesurer chaque requête et l'ajouter aux histogrammes par action"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = get_metrics_config()['ENABLED']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        measures = _RequestMeasures()
+        token = _current.set(measures)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        _record(request, response, measures, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        measures = _RequestMeasures()
+        token = _current.set(measures)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        _record(request, response, measures, time.perf_counter() - started)
+        return response
+
+
+def _record(request, response, measures, elapsed):
+    labels = (
+        ('endpoint', _endpoint(request)),
+        ('method', request.method),
+        ('status', f"{response.status_code // 100}xx"),
+    )
+    registry.observe('flashcroquis_request_duration_seconds', labels, elapsed)
+    registry.observe('flashcroquis_request_db_queries', labels, measures.db_queries)
+    registry.observe('flashcroquis_request_db_seconds', labels, measures.db_seconds)
+    registry.observe('flashcroquis_request_qgis_seconds', labels, measures.qgis_seconds)
+    _response_bytes(response, lambda size: registry.observe('flashcroquis_response_bytes', labels, size))
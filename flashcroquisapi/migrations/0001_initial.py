@@ -0,0 +1,122 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:56
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LayoutTemplate',
+            fields=[
+                ('template_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('layout_config', models.JSONField(default=dict)),
+                ('template_file', models.FileField(blank=True, null=True, upload_to='layout_templates/')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('items', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Modèle de mise en page',
+                'verbose_name_plural': 'Modèles de mise en page',
+                'db_table': 'layout_templates',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectSession',
+            fields=[
+                ('session_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed', models.DateTimeField(auto_now=True)),
+                ('project_title', models.CharField(default='Nouveau Projet', max_length=255)),
+                ('project_crs', models.CharField(default='EPSG:4326', max_length=50)),
+                ('project_file', models.FileField(blank=True, null=True, upload_to='projects/')),
+                ('temporary_files', models.JSONField(default=list)),
+                ('layers_revision', models.PositiveIntegerField(default=0)),
+                ('revision', models.PositiveIntegerField(default=0)),
+                ('modified_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Session de projet',
+                'verbose_name_plural': 'Sessions de projet',
+                'db_table': 'project_sessions',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('algorithm', models.CharField(max_length=255)),
+                ('parameters', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('completed', 'Terminé'), ('failed', 'Échoué'), ('cancelled', 'Annulé')], default='pending', max_length=10)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('progress', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='flashcroquisapi.projectsession')),
+            ],
+            options={
+                'verbose_name': 'Traitement',
+                'verbose_name_plural': 'Traitements',
+                'db_table': 'processing_jobs',
+                'indexes': [models.Index(fields=['session', 'created_at'], name='jobs_session_created_idx'), models.Index(fields=['status', 'created_at'], name='jobs_status_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Layer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('layer_id', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('source', models.TextField(blank=True, null=True)),
+                ('crs', models.CharField(blank=True, max_length=50, null=True)),
+                ('layer_type', models.CharField(choices=[('vector', 'Vectoriel'), ('raster', 'Raster'), ('unknown', 'Inconnu')], default='unknown', max_length=10)),
+                ('geometry_type', models.CharField(choices=[('point', 'Point'), ('line', 'Ligne'), ('polygon', 'Polygone'), ('unknown', 'Inconnu')], default='unknown', max_length=10)),
+                ('feature_count', models.IntegerField(default=0)),
+                ('extent', models.JSONField(blank=True, null=True)),
+                ('spatial_index', models.CharField(choices=[('present', 'Présent'), ('memory', 'En mémoire'), ('absent', 'Absent'), ('unknown', 'Inconnu')], default='unknown', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='layers', to='flashcroquisapi.projectsession')),
+            ],
+            options={
+                'verbose_name': 'Couche',
+                'verbose_name_plural': 'Couches',
+                'db_table': 'layers',
+                'indexes': [models.Index(fields=['session', 'layer_type'], name='layers_session_type_idx')],
+                'unique_together': {('session', 'layer_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GeneratedFile',
+            fields=[
+                ('file_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('file_type', models.CharField(choices=[('pdf', 'PDF'), ('image', 'Image'), ('project', 'Projet QGIS'), ('other', 'Autre')], max_length=10)),
+                ('file_path', models.FileField(upload_to='generated_files/')),
+                ('size', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('metadata', models.JSONField(default=dict)),
+                ('cache_key', models.CharField(blank=True, db_index=True, max_length=64, null=True)),
+                ('content_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='flashcroquisapi.projectsession')),
+            ],
+            options={
+                'verbose_name': 'Fichier généré',
+                'verbose_name_plural': 'Fichiers générés',
+                'db_table': 'generated_files',
+                'indexes': [models.Index(fields=['session', 'created_at'], name='files_session_created_idx')],
+            },
+        ),
+    ]
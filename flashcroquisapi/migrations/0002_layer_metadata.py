@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcroquisapi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layer',
+            name='metadata',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
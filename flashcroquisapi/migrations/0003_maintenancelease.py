@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcroquisapi', '0002_layer_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaintenanceLease',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('holder', models.CharField(blank=True, default='', max_length=255)),
+                ('expires_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Bail de maintenance',
+                'verbose_name_plural': 'Baux de maintenance',
+                'db_table': 'maintenance_leases',
+            },
+        ),
+    ]
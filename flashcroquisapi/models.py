@@ -1,7 +1,10 @@
+import os
 import uuid
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from PyQt5.QtCore import QDateTime
+from .utils import file_sha256
 
 class ProjectSession(models.Model):
     session_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -11,6 +14,11 @@ class ProjectSession(models.Model):
     project_crs = models.CharField(max_length=50, default="EPSG:4326")
     project_file = models.FileField(upload_to='projects/', null=True, blank=True)
     temporary_files = models.JSONField(default=list)
+    # Incrémenté à chaque ajout, modification ou suppression de couche (jeu de couches / style)
+    layers_revision = models.PositiveIntegerField(default=0)
+    # Incrémenté à chaque écriture d'une couche, d'un fichier généré ou d'un traitement (ETag)
+    revision = models.PositiveIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         db_table = 'project_sessions'
@@ -42,6 +50,13 @@ class Layer(models.Model):
         ('unknown', 'Inconnu'),
     )
     
+    SPATIAL_INDEX_STATUSES = (
+        ('present', 'Présent'),
+        ('memory', 'En mémoire'),
+        ('absent', 'Absent'),
+        ('unknown', 'Inconnu'),
+    )
+    
     session = models.ForeignKey(ProjectSession, on_delete=models.CASCADE, related_name='layers')
     layer_id = models.CharField(max_length=255)
     name = models.CharField(max_length=255)
@@ -51,11 +66,17 @@ class Layer(models.Model):
     geometry_type = models.CharField(max_length=10, choices=GEOMETRY_TYPES, default='unknown')
     feature_count = models.IntegerField(default=0)
     extent = models.JSONField(null=True, blank=True)
+    spatial_index = models.CharField(max_length=10, choices=SPATIAL_INDEX_STATUSES, default='unknown')
+    # Enregistrement du cache layer_metadata : source, signature du fichier et informations
+    metadata = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'layers'
         unique_together = ('session', 'layer_id')
+        indexes = [
+            models.Index(fields=['session', 'layer_type'], name='layers_session_type_idx'),
+        ]
         verbose_name = "Couche"
         verbose_name_plural = "Couches"
 
@@ -68,6 +89,7 @@ class ProcessingJob(models.Model):
         ('running', 'En cours'),
         ('completed', 'Terminé'),
         ('failed', 'Échoué'),
+        ('cancelled', 'Annulé'),
     )
     
     job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -76,12 +98,19 @@ class ProcessingJob(models.Model):
     parameters = models.JSONField(default=dict)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     result = models.JSONField(null=True, blank=True)
+    progress = models.JSONField(default=dict, blank=True)
     error = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         db_table = 'processing_jobs'
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='jobs_session_created_idx'),
+            # File d'attente de l'ordonnanceur : jobs `pending` par ancienneté
+            models.Index(fields=['status', 'created_at'], name='jobs_status_created_idx'),
+        ]
         verbose_name = "Traitement"
         verbose_name_plural = "Traitements"
 
@@ -104,11 +133,66 @@ class GeneratedFile(models.Model):
     size = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     metadata = models.JSONField(default=dict)
+    # Empreinte des paramètres de rendu (cache de rendus), nulle pour les fichiers non cachés
+    cache_key = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # SHA-256 du contenu, ETag des téléchargements
+    content_hash = models.CharField(max_length=64, blank=True, default='')
     
     class Meta:
         db_table = 'generated_files'
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='files_session_created_idx'),
+        ]
         verbose_name = "Fichier généré"
         verbose_name_plural = "Fichiers générés"
 
     def __str__(self):
-        return f"{self.name} ({self.file_type})"
\ No newline at end of file
+        return f"{self.name} ({self.file_type})"
+
+    def save(self, *args, **kwargs):
+        if not self.content_hash and self.file_path and os.path.exists(self.file_path.path):
+            self.content_hash = file_sha256(self.file_path.path)
+        super().save(*args, **kwargs)
+
+
+class LayoutTemplate(models.Model):
+    template_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=255, unique=True)
+    layout_config = models.JSONField(default=dict)
+    template_file = models.FileField(upload_to='layout_templates/', null=True, blank=True)
+    # Incrémentée à chaque modification : invalide les mises en page en cache des workers
+    version = models.PositiveIntegerField(default=1)
+    items = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'layout_templates'
+        verbose_name = "Modèle de mise en page"
+        verbose_name_plural = "Modèles de mise en page"
+
+    def __str__(self):
+        return f"{self.name} (v{self.version})"
+
+    def template_payload(self):
+        """Description du modèle transmise aux workers QGIS"""
+        return {
+            'template_id': str(self.template_id),
+            'version': self.version,
+            'path': self.template_file.path,
+        }
+
+
+class MaintenanceLease(models.Model):
+    """Bail d'une tâche de maintenance : un seul processus l'exécute par période"""
+    name = models.CharField(max_length=50, primary_key=True)
+    holder = models.CharField(max_length=255, blank=True, default='')
+    expires_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'maintenance_leases'
+        verbose_name = "Bail de maintenance"
+        verbose_name_plural = "Baux de maintenance"
+
+    def __str__(self):
+        return f"{self.name} ({self.holder})"
@@ -1,19 +1,199 @@
+import importlib
 import logging
 import os
-from threading import Lock
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from threading import Lock, RLock
 
 logger = logging.getLogger(__name__)
 
-project_sessions = {}
-project_sessions_lock = Lock()
 qgis_manager = None
-qgis_classes = {}
+qgis_manager_lock = Lock()
+warmup_thread = None
+
+DEFAULT_STARTUP_CONFIG = {
+    'WARMUP': False,
+    'RETRY_BASE_DELAY': 1.0,
+    'RETRY_MAX_DELAY': 60.0,
+    'WORKER_INIT_ATTEMPTS': 3,
+}
+
+# Classes exposées par QgisManager.get_classes(), importées de qgis.core à la première utilisation
+QGIS_CLASS_NAMES = (
+    'Qgis', 'QgsApplication', 'QgsProject', 'QgsVectorLayer', 'QgsRasterLayer', 'QgsMapSettings',
+    'QgsMapRendererParallelJob', 'QgsMapRendererSequentialJob', 'QgsProcessingFeedback', 'QgsProcessingContext', 'QgsRectangle',
+    'QgsPalLayerSettings', 'QgsTextFormat', 'QgsVectorLayerSimpleLabeling', 'QgsPrintLayout',
+    'QgsLayoutItemMap', 'QgsLayoutItemLegend', 'QgsLayoutItemLabel', 'QgsLayoutExporter',
+    'QgsLayoutItemPicture', 'QgsLayoutPoint', 'QgsLayoutSize', 'QgsUnitTypes', 'QgsLayoutItemPage',
+    'QgsLayoutItemScaleBar', 'QgsLayoutItemHtml', 'QgsCoordinateReferenceSystem', 'QgsCoordinateTransform',
+    'QgsMapLayer', 'QgsFeature', 'QgsFeatureRequest', 'QgsFeatureSource', 'QgsGeometry', 'QgsPointXY',
+    'QgsFields', 'QgsField', 'QgsVectorFileWriter', 'QgsVectorDataProvider', 'QgsWkbTypes',
+    'QgsLayerTreeLayer', 'QgsLinePatternFillSymbolLayer', 'QgsSimpleLineSymbolLayer', 'QgsSymbol',
+    'QgsSingleSymbolRenderer', 'QgsLayerTreeGroup', 'QgsLayerTreeModel', 'QgsLegendStyle', 'QgsExpression',
+    'QgsExpressionContext', 'QgsExpressionContextUtils', 'QgsTextBackgroundSettings', 'QgsLayoutItemShape',
+    'QgsLayoutItemMapGrid', 'QgsPoint', 'QgsReadWriteContext',
+)
+
+def get_startup_config():
+    """Configuration du démarrage QGIS fusionnée avec les valeurs par défaut"""
+    from django.conf import settings
+    config = dict(DEFAULT_STARTUP_CONFIG)
+    config.update(getattr(settings, 'QGIS_STARTUP', {}))
+    return config
+
+class ProjectSessionCache:
+    """Cache LRU des QgsProject chargés, indexé par session_id
+    
+    Borné en nombre d'entrées et en mémoire estimée. Les projets évincés sont
+    réécrits en .qgz pour être rechargés sans reconstruire les couches ; ces
+    réécritures sont différées jusqu'à `flush_write_backs`, appelé une fois le
+    verrou de la session courante relâché (deux tâches qui s'évinceraient
+    mutuellement ne s'attendent ainsi jamais l'une l'autre).
+    """
+    
+    def __init__(self, max_entries=None, max_memory_mb=None):
+        self._max_entries = max_entries
+        self._max_memory_mb = max_memory_mb
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        # session_id -> [RLock, nombre de détenteurs ou d'attentes en cours]
+        self._session_locks = {}
+        self._pending_write_backs = []
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    def _limits(self):
+        if self._max_entries is None or self._max_memory_mb is None:
+            from django.conf import settings
+            config = getattr(settings, 'PROJECT_CACHE', {})
+            if self._max_entries is None:
+                self._max_entries = config.get('MAX_ENTRIES', 32)
+            if self._max_memory_mb is None:
+                self._max_memory_mb = config.get('MAX_MEMORY_MB', 512)
+        return self._max_entries, self._max_memory_mb * 1024 * 1024
+    
+    @contextmanager
+    def lock(self, session_id):
+        """Verrou propre à une session : deux sessions ne se bloquent jamais
+        
+        Le verrou est compté : il n'est retiré de la table qu'une fois libéré
+        par tous ses détenteurs, si bien que deux threads d'une même session
+        partagent toujours le même verrou.
+        """
+        session_id = str(session_id)
+        with self._lock:
+            holder = self._session_locks.get(session_id)
+            if holder is None:
+                holder = self._session_locks[session_id] = [RLock(), 0]
+            holder[1] += 1
+        try:
+            with holder[0]:
+                yield
+        finally:
+            with self._lock:
+                holder[1] -= 1
+                if not holder[1]:
+                    del self._session_locks[session_id]
+    
+    def get(self, session_id, revision=None):
+        """Projet en cache s'il correspond à la révision des couches, sinon None"""
+        session_id = str(session_id)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and revision is not None and entry['revision'] != revision:
+                del self._entries[session_id]
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self._counters['hits'] += 1
+            return entry['project']
+    
+    def put(self, session_id, project, revision=None, writeback_path=None):
+        """Ajouter un projet puis évincer les moins récemment utilisés
+        
+        Les projets évincés sont réécrits par le prochain `flush_write_backs`.
+        """
+        session_id = str(session_id)
+        max_entries, max_bytes = self._limits()
+        with self._lock:
+            self._entries[session_id] = {
+                'project': project,
+                'revision': revision,
+                'size': _estimate_project_bytes(project),
+                'writeback_path': writeback_path,
+            }
+            self._entries.move_to_end(session_id)
+            total = sum(entry['size'] for entry in self._entries.values())
+            while len(self._entries) > 1 and (len(self._entries) > max_entries or total > max_bytes):
+                evicted_id, entry = self._entries.popitem(last=False)
+                total -= entry['size']
+                self._counters['evictions'] += 1
+                self._pending_write_backs.append((evicted_id, entry))
+    
+    def flush_write_backs(self):
+        """Réécrire les projets évincés ; à appeler sans détenir de verrou de session"""
+        with self._lock:
+            pending, self._pending_write_backs = self._pending_write_backs, []
+        for session_id, entry in pending:
+            self._write_back(session_id, entry)
+    
+    def evict(self, session_id, write_back=True):
+        """Retirer une session du cache ; à appeler sans détenir de verrou de session"""
+        session_id = str(session_id)
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        if entry is not None and write_back:
+            self._write_back(session_id, entry)
+        return entry is not None
+    
+    def _write_back(self, session_id, entry):
+        """Réécrire un projet évincé en .qgz"""
+        path = entry['writeback_path']
+        if not path:
+            return
+        with self.lock(session_id):
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                project = entry['project']
+                if entry['revision'] is not None:
+                    project.writeEntry('flashcroquis', 'layers_revision', entry['revision'])
+                if not project.write(path):
+                    logger.warning(f"Impossible de réécrire le projet de la session {session_id}")
+            except Exception as e:
+                logger.warning(f"Erreur lors de la réécriture du projet {session_id}: {e}")
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'estimated_bytes': sum(entry['size'] for entry in self._entries.values()),
+                **self._counters,
+            }
+
+def _estimate_project_bytes(project):
+    """Estimer l'empreinte mémoire d'un projet à partir de ses sources"""
+    total = 512 * 1024
+    for layer in project.mapLayers().values():
+        path = layer.source().split('|')[0]
+        try:
+            total += os.path.getsize(path)
+        except (OSError, ValueError):
+            total += 1024 * 1024
+    return total
+
+project_sessions = ProjectSessionCache()
 
 def get_qgis_manager():
     """Obtenir le gestionnaire QGIS global"""
     global qgis_manager
     if qgis_manager is None:
-        qgis_manager = QgisManager()
+        with qgis_manager_lock:
+            if qgis_manager is None:
+                qgis_manager = QgisManager()
     return qgis_manager
 
 def initialize_qgis_if_needed():
@@ -23,64 +203,159 @@ def initialize_qgis_if_needed():
         return manager.initialize()
     return True, None
 
+def warm_up():
+    """Préparer QGIS avant la première requête
+    
+    Avec le pool, démarre les workers (chacun initialise QGIS dès son
+    lancement) et relance ceux dont l'initialisation a échoué ; sans pool,
+    initialise QGIS dans un thread d'arrière-plan.
+    """
+    global warmup_thread
+    from .worker_pool import get_worker_pool
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.start()
+        pool.revive()
+        return
+    with qgis_manager_lock:
+        if warmup_thread is not None and warmup_thread.is_alive():
+            return
+        warmup_thread = threading.Thread(target=initialize_qgis_if_needed, name='qgis-warmup', daemon=True)
+        warmup_thread.start()
+
+def qgis_ready():
+    """Vrai lorsque ce processus peut exécuter une tâche QGIS sans attendre son initialisation"""
+    from .worker_pool import get_worker_pool
+    pool = get_worker_pool()
+    if pool is not None:
+        return pool.is_ready()
+    return get_qgis_manager().is_initialized()
+
+class QgisClasses(Mapping):
+    """Classes QGIS résolues à la demande puis gardées en cache
+    
+    `processing` n'est importé (fournisseurs d'algorithmes compris) qu'au
+    premier traitement exécuté.
+    """
+    
+    def __init__(self, manager):
+        self._manager = manager
+        self._cache = {}
+        self._lock = Lock()
+    
+    def __getitem__(self, name):
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        if name != 'processing' and name not in QGIS_CLASS_NAMES:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._cache:
+                if name == 'processing':
+                    self._cache[name] = self._manager._load_processing()
+                else:
+                    self._cache[name] = getattr(importlib.import_module('qgis.core'), name)
+            return self._cache[name]
+    
+    def __iter__(self):
+        return iter(QGIS_CLASS_NAMES + ('processing',))
+    
+    def __len__(self):
+        return len(QGIS_CLASS_NAMES) + 1
+    
+    def is_loaded(self, name):
+        return name in self._cache
+
 class QgisManager:
     """Gestionnaire QGIS"""
     
     def __init__(self):
         self._initialized = False
-        self._initialization_attempted = False
+        self._lock = Lock()
+        self._failures = 0
+        self._retry_at = 0.0
         self.qgs_app = None
-        self.classes = {}
+        self.classes = QgisClasses(self)
         self.init_errors = []
+        self.timings = {}
+    
+    @contextmanager
+    def _phase(self, name):
+        """Mesurer la durée d'une phase du démarrage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - start, 3)
     
     def initialize(self):
-        """Initialiser QGIS avec gestion correcte de processing"""
+        """Initialiser QGIS ; après un échec, nouvel essai avec attente exponentielle"""
         if self._initialized:
             return True, None
-            
-        if self._initialization_attempted:
-            return False, "Initialization already attempted"
-            
-        self._initialization_attempted = True
-        logger.info("=== DÉBUT DE L'INITIALISATION QGIS ===")
         
-        try:
-            # Configuration de l'environnement QGIS
-            self._setup_qgis_environment()
-            
-            # Importation des modules QGIS
-            from PyQt5.QtCore import QCoreApplication
-            from qgis.core import (
-                Qgis, QgsApplication, QgsProject, QgsVectorLayer,
-                QgsRasterLayer, QgsMapSettings, QgsMapRendererParallelJob,
-                QgsProcessingFeedback, QgsProcessingContext, QgsRectangle,
-                QgsPalLayerSettings, QgsTextFormat, QgsVectorLayerSimpleLabeling,
-                QgsPrintLayout, QgsLayoutItemMap, QgsLayoutItemLegend,
-                QgsLayoutItemLabel, QgsLayoutExporter, QgsLayoutItemPicture,
-                QgsLayoutPoint, QgsLayoutSize, QgsUnitTypes, QgsLayoutItemPage,
-                QgsLayoutItemScaleBar, QgsLayoutItemHtml,
-                QgsCoordinateReferenceSystem, QgsRectangle,
-                QgsMapLayer, QgsFeature, QgsGeometry, QgsPointXY, QgsFields, QgsField,
-                QgsVectorFileWriter, QgsVectorDataProvider, QgsWkbTypes, QgsLayerTreeLayer,
-                QgsLinePatternFillSymbolLayer, QgsSimpleLineSymbolLayer, QgsSymbol, QgsSingleSymbolRenderer,
-                QgsLayerTreeGroup, QgsLayerTreeModel, QgsLegendStyle, QgsExpression, QgsExpressionContext,
-                QgsExpressionContextUtils, QgsTextBackgroundSettings, QgsLayoutItemShape, QgsLayoutItemMapGrid,
-                QgsPoint
-            )
+        with self._lock:
+            if self._initialized:
+                return True, None
             
-            # Initialisation de l'application QGIS
-            logger.info("Initialisation de l'application QGIS...")
-            if not QgsApplication.instance():
-                self.qgs_app = QgsApplication([], False)
-                self.qgs_app.initQgis()
-                logger.info("Application QGIS initialisée")
-            else:
-                self.qgs_app = QgsApplication.instance()
-                logger.info("Instance QGIS existante utilisée")
+            retry_in = self.retry_in()
+            if retry_in:
+                return False, f"Nouvel essai d'initialisation dans {retry_in:.1f}s ({self.init_errors[-1]})"
             
-            # Importation de processing
+            logger.info("=== DÉBUT DE L'INITIALISATION QGIS ===")
+            try:
+                # Configuration de l'environnement QGIS
+                with self._phase('environment'):
+                    self._setup_qgis_environment()
+                
+                with self._phase('qgis_import'):
+                    from qgis.core import QgsApplication
+                
+                # Initialisation de l'application QGIS
+                logger.info("Initialisation de l'application QGIS...")
+                with self._phase('init_qgis'):
+                    if not QgsApplication.instance():
+                        self.qgs_app = QgsApplication([], False)
+                        self.qgs_app.initQgis()
+                        logger.info("Application QGIS initialisée")
+                    else:
+                        self.qgs_app = QgsApplication.instance()
+                        logger.info("Instance QGIS existante utilisée")
+                
+                self._initialized = True
+                self._failures = 0
+                self._retry_at = 0.0
+                self.timings['total'] = round(sum(
+                    self.timings[phase] for phase in ('environment', 'qgis_import', 'init_qgis')
+                ), 3)
+                logger.info(f"=== QGIS INITIALISÉ AVEC SUCCÈS ({self.timings['total']}s) ===")
+                return True, None
+                
+            except Exception as e:
+                config = get_startup_config()
+                self._failures += 1
+                delay = min(config['RETRY_BASE_DELAY'] * 2 ** (self._failures - 1), config['RETRY_MAX_DELAY'])
+                self._retry_at = time.monotonic() + delay
+                error_msg = f"Erreur d'initialisation: {e}"
+                self.init_errors = (self.init_errors + [error_msg])[-10:]
+                logger.error(f"{error_msg} (tentative {self._failures}, nouvel essai dans {delay:.1f}s)")
+                return False, error_msg
+    
+    def retry_in(self):
+        """Secondes avant la prochaine tentative d'initialisation autorisée"""
+        return max(0.0, self._retry_at - time.monotonic())
+    
+    def _load_processing(self):
+        """Importer processing et enregistrer ses fournisseurs d'algorithmes"""
+        with self._phase('processing_import'):
             try:
                 import processing
+                from processing.core.Processing import Processing
+                Processing.initialize()
+                from qgis.analysis import QgsNativeAlgorithms
+                registry = self.classes['QgsApplication'].processingRegistry()
+                if registry.providerById('native') is None:
+                    registry.addProvider(QgsNativeAlgorithms())
                 logger.info("Module processing importé avec succès")
             except ImportError:
                 try:
@@ -94,71 +369,7 @@ class QgisManager:
                         def run(*args, **kwargs):
                             raise NotImplementedError("Processing module not available")
                     processing = MockProcessing()
-            
-            # Stockage des classes
-            self.classes = {
-                'Qgis': Qgis,
-                'QgsApplication': QgsApplication,
-                'QgsProject': QgsProject,
-                'QgsVectorLayer': QgsVectorLayer,
-                'QgsRasterLayer': QgsRasterLayer,
-                'QgsMapSettings': QgsMapSettings,
-                'QgsMapRendererParallelJob': QgsMapRendererParallelJob,
-                'QgsProcessingFeedback': QgsProcessingFeedback,
-                'QgsProcessingContext': QgsProcessingContext,
-                'QgsRectangle': QgsRectangle,
-                'processing': processing,
-                'QgsPalLayerSettings': QgsPalLayerSettings,
-                'QgsTextFormat': QgsTextFormat,
-                'QgsVectorLayerSimpleLabeling': QgsVectorLayerSimpleLabeling,
-                'QgsPrintLayout': QgsPrintLayout,
-                'QgsLayoutItemMap': QgsLayoutItemMap,
-                'QgsLayoutItemLegend': QgsLayoutItemLegend,
-                'QgsLayoutItemLabel': QgsLayoutItemLabel,
-                'QgsLayoutExporter': QgsLayoutExporter,
-                'QgsLayoutItemPicture': QgsLayoutItemPicture,
-                'QgsLayoutPoint': QgsLayoutPoint,
-                'QgsLayoutSize': QgsLayoutSize,
-                'QgsUnitTypes': QgsUnitTypes,
-                'QgsLayoutItemPage': QgsLayoutItemPage,
-                'QgsLayoutItemScaleBar': QgsLayoutItemScaleBar,
-                'QgsLayoutItemHtml': QgsLayoutItemHtml,
-                'QgsCoordinateReferenceSystem': QgsCoordinateReferenceSystem,
-                'QgsMapLayer': QgsMapLayer,
-                'QgsFeature': QgsFeature,
-                'QgsGeometry': QgsGeometry,
-                'QgsPointXY': QgsPointXY,
-                'QgsFields': QgsFields,
-                'QgsField': QgsField,
-                'QgsVectorFileWriter': QgsVectorFileWriter,
-                'QgsVectorDataProvider': QgsVectorDataProvider,
-                'QgsWkbTypes': QgsWkbTypes,
-                'QgsLayerTreeLayer': QgsLayerTreeLayer,
-                'QgsLinePatternFillSymbolLayer': QgsLinePatternFillSymbolLayer,
-                'QgsSimpleLineSymbolLayer': QgsSimpleLineSymbolLayer,
-                'QgsSymbol': QgsSymbol,
-                'QgsSingleSymbolRenderer': QgsSingleSymbolRenderer,
-                'QgsLayerTreeGroup': QgsLayerTreeGroup,
-                'QgsLayerTreeModel': QgsLayerTreeModel,
-                'QgsLegendStyle': QgsLegendStyle,
-                'QgsExpression': QgsExpression,
-                'QgsExpressionContext': QgsExpressionContext,
-                'QgsExpressionContextUtils': QgsExpressionContextUtils,
-                'QgsTextBackgroundSettings': QgsTextBackgroundSettings,
-                'QgsLayoutItemShape': QgsLayoutItemShape,
-                'QgsLayoutItemMapGrid': QgsLayoutItemMapGrid,
-                'QgsPoint': QgsPoint
-            }
-
-            self._initialized = True
-            logger.info("=== QGIS INITIALISÉ AVEC SUCCÈS ===")
-            return True, None
-            
-        except Exception as e:
-            error_msg = f"Erreur d'initialisation: {e}"
-            self.init_errors.append(error_msg)
-            logger.error(error_msg)
-            return False, error_msg
+        return processing
     
     def _setup_qgis_environment(self):
         """Configurer l'environnement QGIS"""
@@ -178,4 +389,14 @@ class QgisManager:
     
     def get_errors(self):
         return self.init_errors
-
+    
+    def startup_info(self):
+        """Durées des phases de démarrage et état des tentatives, pour le health check"""
+        return {
+            'initialized': self._initialized,
+            'failures': self._failures,
+            'retry_in': round(self.retry_in(), 1) or None,
+            'last_error': self.init_errors[-1] if self.init_errors else None,
+            'processing_loaded': self.classes.is_loaded('processing'),
+            'timings': dict(self.timings),
+        }
@@ -0,0 +1,334 @@
+"""
+Expiration des sessions inactives et quotas disque par session.
+
+Une session est expirée lorsque ni `last_accessed` ni `modified_at` n'ont
+bougé depuis `SESSION_TTL` secondes. `last_accessed` n'est mis à jour par
+Django qu'à l'enregistrement de la session : les lectures qui l'utilisent
+sans l'enregistrer (rendus servis depuis le cache, tuiles, entités,
+téléchargements) appellent `touch_session`, au plus une fois par
+`TOUCH_INTERVAL` secondes et par processus. Une session dont un traitement
+est en attente ou en cours n'est jamais expirée. Les fichiers générés,
+fichiers temporaires, fichier de projet et projet réécrit (.qgz) d'une
+session expirée sont supprimés du disque avant la suppression des lignes,
+puis ses projets en mémoire sont évincés.
+
+Les sessions actives dépassant `SESSION_QUOTA_BYTES` perdent leurs fichiers
+générés les plus anciens jusqu'à repasser sous le quota.
+
+Le nettoyage s'exécute via la commande `reap_sessions` ou, si
+`REAPER['ENABLED']`, dans un thread périodique de chaque processus Django.
+Un seul nettoyage a lieu par `INTERVAL` pour tout le déploiement : chaque
+passage réserve d'abord le bail `reaper` en base (`claim_run`), par une mise
+à jour conditionnelle comme celle des jobs de l'ordonnanceur.
+
+Les projets des sessions expirées ne sont évincés que des caches du
+processus qui exécute le nettoyage et de son pool QGIS. Un autre processus
+(la commande lancée à part, les autres workers gunicorn) peut encore garder
+le projet d'une session supprimée et le réécrire en .qgz lorsqu'il l'évince ;
+ce fichier orphelin est supprimé par le passage suivant
+(`sweep_orphan_projects`).
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ProjectSession, GeneratedFile, MaintenanceLease
+from .qgis_manager import project_sessions
+from .scheduler import ACTIVE_STATUSES
+from .worker_pool import get_worker_pool
+
+logger = logging.getLogger(__name__)
+
+reaper_thread = None
+reaper_thread_lock = threading.Lock()
+
+DEFAULT_REAPER_CONFIG = {
+    'ENABLED': False,
+    'INTERVAL': 3600,
+    'SESSION_TTL': 7 * 24 * 3600,
+    'SESSION_QUOTA_BYTES': 512 * 1024 * 1024,
+    'BATCH_SIZE': 100,
+    'TOUCH_INTERVAL': 60,
+}
+
+_stats_lock = threading.Lock()
+_stats = {'runs': 0, 'expired_sessions': 0, 'deleted_files': 0, 'reclaimed_bytes': 0, 'last_run': None}
+
+# Dernière mise à jour de `last_accessed` par session, dans ce processus
+_touched = {}
+_touched_lock = threading.Lock()
+TOUCHED_MAX = 10000
+
+REAPER_LEASE = 'reaper'
+
+
+def get_reaper_config():
+    """Configuration du nettoyage des sessions fusionnée avec les valeurs par défaut"""
+    config = dict(DEFAULT_REAPER_CONFIG)
+    config.update(getattr(settings, 'REAPER', {}))
+    return config
+
+
+def touch_session(session_id):
+    """Marquer une session comme utilisée, au plus une fois par `TOUCH_INTERVAL` secondes"""
+    interval = get_reaper_config()['TOUCH_INTERVAL']
+    key = str(session_id)
+    now = time.monotonic()
+    with _touched_lock:
+        last = _touched.get(key)
+        if last is not None and now - last < interval:
+            return
+        _touched[key] = now
+        if len(_touched) > TOUCHED_MAX:
+            for stale in [k for k, t in _touched.items() if now - t >= interval]:
+                del _touched[stale]
+    ProjectSession.objects.filter(session_id=session_id).update(last_accessed=timezone.now())
+
+
+def claim_run(interval=None):
+    """Réserver le nettoyage de la période pour ce processus
+    
+    Renvoie False si un autre processus l'a déjà réservé. Le bail couvre 90 %
+    de l'intervalle : un passage planifié toutes les `interval` secondes
+    (commande en cron, thread) n'est pas écarté par le sien.
+    """
+    interval = get_reaper_config()['INTERVAL'] if interval is None else interval
+    now = timezone.now()
+    MaintenanceLease.objects.get_or_create(name=REAPER_LEASE, defaults={'expires_at': now})
+    return bool(MaintenanceLease.objects.filter(name=REAPER_LEASE, expires_at__lte=now).update(
+        holder=f"{socket.gethostname()}:{os.getpid()}",
+        expires_at=now + timedelta(seconds=interval * 0.9)
+    ))
+
+
+def _writeback_path(session_id):
+    return os.path.join(settings.MEDIA_ROOT, 'projects', f"{session_id}.qgz")
+
+
+def _removable(path):
+    """Vrai pour un fichier sous MEDIA_ROOT ou le répertoire temporaire"""
+    path = os.path.realpath(path)
+    roots = (os.path.realpath(settings.MEDIA_ROOT), os.path.realpath(tempfile.gettempdir()))
+    return any(os.path.commonpath([path, root]) == root for root in roots)
+
+
+def _remove(path, dry_run=False):
+    """Supprimer un fichier ; renvoie sa taille, 0 s'il est absent ou hors des répertoires gérés"""
+    if not path:
+        return 0
+    if not os.path.isabs(path):
+        path = os.path.join(settings.MEDIA_ROOT, path)
+    if not _removable(path):
+        logger.warning(f"Fichier hors des répertoires gérés ignoré: {path}")
+        return 0
+    try:
+        size = os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        logger.warning(f"Impossible de supprimer {path}: {e}")
+        return 0
+
+
+def expired_sessions(ttl):
+    """Sessions inactives depuis plus de `ttl` secondes, sans traitement actif"""
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    return ProjectSession.objects.filter(
+        last_accessed__lt=cutoff, modified_at__lt=cutoff
+    ).exclude(jobs__status__in=ACTIVE_STATUSES)
+
+
+def evict_projects(session_ids):
+    """Retirer les projets des sessions des caches de ce processus et de son pool, sans réécriture"""
+    session_ids = [str(session_id) for session_id in session_ids]
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.evict_sessions(session_ids)
+    for session_id in session_ids:
+        project_sessions.evict(session_id, write_back=False)
+
+
+def _expire_batch(session_ids, dry_run):
+    """Supprimer les fichiers puis les lignes d'un lot de sessions ; renvoie (fichiers, octets)"""
+    files = GeneratedFile.objects.filter(session_id__in=session_ids).values_list('file_path', flat=True)
+    sessions = ProjectSession.objects.filter(session_id__in=session_ids).values_list(
+        'session_id', 'project_file', 'temporary_files'
+    )
+
+    paths = list(files)
+    for session_id, project_file, temporary_files in sessions:
+        paths.append(project_file)
+        paths.append(_writeback_path(session_id))
+        paths.extend(temporary_files or [])
+
+    count, reclaimed = 0, 0
+    for path in paths:
+        size = _remove(path, dry_run)
+        if size:
+            count += 1
+            reclaimed += size
+
+    if not dry_run:
+        ProjectSession.objects.filter(session_id__in=session_ids).delete()
+        evict_projects(session_ids)
+    return count, reclaimed
+
+
+def enforce_quota(session_id, quota_bytes, dry_run=False):
+    """Supprimer les fichiers générés les plus anciens d'une session au-delà de son quota"""
+    files = GeneratedFile.objects.filter(session_id=session_id)
+    total = files.aggregate(total=Sum('size'))['total'] or 0
+    count, reclaimed = 0, 0
+    for generated_file in files.order_by('created_at').iterator():
+        if total <= quota_bytes:
+            break
+        total -= generated_file.size
+        reclaimed += _remove(generated_file.file_path.name, dry_run)
+        count += 1
+        if not dry_run:
+            generated_file.delete()
+    return count, reclaimed
+
+
+def over_quota_sessions(quota_bytes):
+    """Identifiants des sessions dont les fichiers générés dépassent le quota"""
+    return list(
+        GeneratedFile.objects.values('session')
+        .annotate(total=Sum('size'))
+        .filter(total__gt=quota_bytes)
+        .values_list('session', flat=True)
+    )
+
+
+def sweep_orphan_projects(dry_run=False):
+    """Supprimer les projets réécrits (.qgz) dont la session n'existe plus"""
+    projects_dir = os.path.join(settings.MEDIA_ROOT, 'projects')
+    try:
+        names = [name for name in os.listdir(projects_dir) if name.endswith('.qgz')]
+    except FileNotFoundError:
+        return 0, 0
+    session_ids = {name[:-len('.qgz')] for name in names}
+    existing = {
+        str(session_id) for session_id in
+        ProjectSession.objects.filter(
+            session_id__in=[s for s in session_ids if _is_uuid(s)]
+        ).values_list('session_id', flat=True)
+    }
+    count, reclaimed = 0, 0
+    for session_id in session_ids - existing:
+        size = _remove(_writeback_path(session_id), dry_run)
+        if size:
+            count += 1
+            reclaimed += size
+    return count, reclaimed
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+def reap(ttl=None, quota_bytes=None, dry_run=False):
+    """Expirer les sessions inactives puis appliquer les quotas ; renvoie un rapport"""
+    config = get_reaper_config()
+    ttl = config['SESSION_TTL'] if ttl is None else ttl
+    quota_bytes = config['SESSION_QUOTA_BYTES'] if quota_bytes is None else quota_bytes
+    report = {
+        'expired_sessions': 0, 'expired_files': 0, 'expired_bytes': 0,
+        'quota_sessions': 0, 'quota_files': 0, 'quota_bytes': 0,
+        'orphan_files': 0, 'orphan_bytes': 0, 'dry_run': dry_run,
+    }
+
+    session_ids = list(expired_sessions(ttl).values_list('session_id', flat=True).distinct())
+    for start in range(0, len(session_ids), config['BATCH_SIZE']):
+        batch = session_ids[start:start + config['BATCH_SIZE']]
+        count, reclaimed = _expire_batch(batch, dry_run)
+        report['expired_sessions'] += len(batch)
+        report['expired_files'] += count
+        report['expired_bytes'] += reclaimed
+
+    if quota_bytes:
+        for session_id in over_quota_sessions(quota_bytes):
+            count, reclaimed = enforce_quota(session_id, quota_bytes, dry_run)
+            report['quota_sessions'] += 1
+            report['quota_files'] += count
+            report['quota_bytes'] += reclaimed
+
+    report['orphan_files'], report['orphan_bytes'] = sweep_orphan_projects(dry_run)
+    report['reclaimed_bytes'] = report['expired_bytes'] + report['quota_bytes'] + report['orphan_bytes']
+
+    if not dry_run:
+        with _stats_lock:
+            _stats['runs'] += 1
+            _stats['expired_sessions'] += report['expired_sessions']
+            _stats['deleted_files'] += report['expired_files'] + report['quota_files'] + report['orphan_files']
+            _stats['reclaimed_bytes'] += report['reclaimed_bytes']
+            _stats['last_run'] = timezone.now().isoformat()
+        if report['reclaimed_bytes'] or report['expired_sessions']:
+            logger.info(
+                f"Nettoyage: {report['expired_sessions']} sessions expirées, "
+                f"{report['reclaimed_bytes']} octets libérés"
+            )
+    return report
+
+
+def stats():
+    """Compteurs du nettoyage pour le health check"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+class SessionReaper:
+    """Thread de nettoyage périodique des sessions"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='session-reaper', daemon=True)
+        self._thread.start()
+        logger.info(f"Nettoyage des sessions démarré (toutes les {self.interval}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if claim_run(self.interval):
+                    reap()
+            except Exception as e:
+                logger.error(f"Erreur du nettoyage des sessions: {e}")
+            finally:
+                close_old_connections()
+
+
+def start_reaper():
+    """Démarrer le thread de nettoyage du processus, une seule fois"""
+    global reaper_thread
+    with reaper_thread_lock:
+        if reaper_thread is None:
+            reaper_thread = SessionReaper(get_reaper_config()['INTERVAL'])
+        reaper_thread.start()
+    return reaper_thread
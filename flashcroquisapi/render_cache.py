@@ -0,0 +1,127 @@
+"""
+Cache des rendus de carte et des PDF, adressé par contenu.
+
+La clé est l'empreinte SHA-256 des paramètres validés du sérialiseur, du type
+de rendu et de `ProjectSession.layers_revision`. Un succès renvoie le
+`GeneratedFile` existant sans rien rendre ; l'éviction par âge et par taille
+totale supprime les lignes et les fichiers sous-jacents.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import GeneratedFile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDER_CACHE_CONFIG = {
+    'ENABLED': True,
+    'MAX_AGE': 24 * 3600,
+    'MAX_TOTAL_BYTES': 512 * 1024 * 1024,
+    'EVICT_EVERY': 20,
+}
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evicted_files': 0, 'evicted_bytes': 0}
+
+
+def get_render_cache_config():
+    """Configuration du cache de rendus fusionnée avec les valeurs par défaut"""
+    config = dict(DEFAULT_RENDER_CACHE_CONFIG)
+    config.update(getattr(settings, 'RENDER_CACHE', {}))
+    return config
+
+
+def make_key(kind, session, params):
+    """Empreinte canonique d'un rendu, ou None si le cache est désactivé"""
+    if not get_render_cache_config()['ENABLED']:
+        return None
+    canonical = json.dumps(
+        {
+            'kind': kind,
+            'session': str(session.session_id),
+            'revision': session.layers_revision,
+            'params': params,
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def lookup(session, key):
+    """Renvoyer le fichier généré correspondant à la clé, ou None"""
+    if key is None:
+        return None
+
+    cached = GeneratedFile.objects.filter(session=session, cache_key=key).order_by('-created_at').first()
+    if cached is not None and not os.path.exists(cached.file_path.path):
+        logger.warning(f"Fichier en cache introuvable, entrée supprimée: {cached.file_path.name}")
+        cached.delete()
+        cached = None
+
+    with _stats_lock:
+        _stats['hits' if cached is not None else 'misses'] += 1
+        misses = _stats['misses']
+    if cached is None and misses % get_render_cache_config()['EVICT_EVERY'] == 0:
+        evict()
+    return cached
+
+
+def _delete_entries(entries):
+    """Supprimer des entrées de cache et leurs fichiers ; renvoie (fichiers, octets)"""
+    count, reclaimed = 0, 0
+    for generated_file in entries:
+        try:
+            generated_file.file_path.delete(save=False)
+        except OSError as e:
+            logger.warning(f"Impossible de supprimer {generated_file.file_path.name}: {e}")
+        generated_file.delete()
+        count += 1
+        reclaimed += generated_file.size
+    return count, reclaimed
+
+
+def evict():
+    """Appliquer la politique d'éviction par âge puis par taille totale"""
+    config = get_render_cache_config()
+    cached_files = GeneratedFile.objects.exclude(cache_key__isnull=True)
+
+    expired = cached_files.filter(created_at__lt=timezone.now() - timedelta(seconds=config['MAX_AGE']))
+    count, reclaimed = _delete_entries(list(expired))
+
+    total = cached_files.aggregate(total=Sum('size'))['total'] or 0
+    if total > config['MAX_TOTAL_BYTES']:
+        oldest_first = []
+        for generated_file in cached_files.order_by('created_at').iterator():
+            if total <= config['MAX_TOTAL_BYTES']:
+                break
+            oldest_first.append(generated_file)
+            total -= generated_file.size
+        evicted_count, evicted_bytes = _delete_entries(oldest_first)
+        count += evicted_count
+        reclaimed += evicted_bytes
+
+    if count:
+        logger.info(f"Cache de rendus: {count} fichiers évincés ({reclaimed} octets)")
+    with _stats_lock:
+        _stats['evicted_files'] += count
+        _stats['evicted_bytes'] += reclaimed
+    return count, reclaimed
+
+
+def stats():
+    """Compteurs du cache pour le health check"""
+    with _stats_lock:
+        current = dict(_stats)
+    lookups = current['hits'] + current['misses']
+    current['hit_ratio'] = round(current['hits'] / lookups, 4) if lookups else None
+    return current
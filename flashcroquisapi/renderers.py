@@ -0,0 +1,106 @@
+import datetime
+import decimal
+import json
+import uuid
+
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer
+
+from .utils import to_json_value
+
+try:
+    import orjson
+except ImportError:  # repli sur le module json de la bibliothèque standard
+    orjson = None
+
+ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def _default(value):
+    """Types non natifs : UUID, dates, Decimal, numpy, valeurs Qt, chaînes différées"""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, Promise):
+        return str(value)
+    if hasattr(value, 'tolist'):  # tableaux et scalaires numpy
+        return value.tolist()
+    return to_json_value(value)
+
+
+def dumps(data, indent=None):
+    """Sérialiser en JSON UTF-8 (orjson si disponible)"""
+    if orjson is not None and not indent:
+        try:
+            return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            pass  # entiers hors 64 bits, clés non sérialisables : chemin standard
+    return json.dumps(
+        data, default=_default, ensure_ascii=False, allow_nan=False,
+        indent=indent, separators=None if indent else (',', ':')
+    ).encode('utf-8')
+
+
+class FastJSONRenderer(BaseRenderer):
+    """Rendu JSON par défaut de l'API, sans copie intermédiaire des données"""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data, indent=self.get_indent(accepted_media_type, renderer_context or {}))
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        """Indentation demandée par `Accept: application/json; indent=2`"""
+        if accepted_media_type:
+            for param in accepted_media_type.split(';')[1:]:
+                key, _, value = param.strip().partition('=')
+                if key == 'indent':
+                    try:
+                        return max(min(int(value), 8), 0)
+                    except ValueError:
+                        return None
+        return renderer_context.get('indent')
+
+
+class PrometheusTextRenderer(BaseRenderer):
+    """Format d'exposition texte de Prometheus (données déjà formatées)"""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode('utf-8')
+        return dumps(data)
+
+
+class _StreamFormatRenderer(BaseRenderer):
+    """Rendu des formats de flux : les entités sont envoyées par la vue en
+    StreamingHttpResponse, ce rendu ne sert qu'aux réponses d'erreur"""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class GeoJSONStreamRenderer(_StreamFormatRenderer):
+    media_type = 'application/geo+json'
+    format = 'geojson-stream'
+
+
+class NDJSONRenderer(_StreamFormatRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class EventStreamRenderer(_StreamFormatRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
@@ -0,0 +1,332 @@
+"""
+Ordonnanceur local des traitements `ProcessingJob`.
+
+La file d'attente est la table `processing_jobs` elle-même : un thread de
+répartition réclame les jobs `pending` par une mise à jour conditionnelle
+(`pending` -> `running`), ce qui reste sûr lorsque plusieurs processus
+Django partagent la même base. Les limites de concurrence (globale et par
+session) sont calculées à partir des jobs `running` en base.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count
+from django.utils import timezone
+
+from .events import job_events, get_job_events_config
+from .models import ProcessingJob, GeneratedFile
+from .signals import bump_session_revision
+from .utils import session_payload, generated_file_path
+from .worker_pool import run_qgis_task, cancel_qgis_task, JobCancelled
+
+logger = logging.getLogger(__name__)
+
+job_scheduler = None
+job_scheduler_lock = threading.Lock()
+
+DEFAULT_SCHEDULER_CONFIG = {
+    'MAX_CONCURRENT_JOBS': 4,
+    'MAX_JOBS_PER_SESSION': 1,
+    'POLL_INTERVAL': 1.0,
+    'BATCH_SIZE': 50,
+    'STALE_AFTER': 3600,
+}
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+PDF_BATCH_ALGORITHM = 'flashcroquis:generate_pdf_batch'
+
+
+def _transition(jobs, **fields):
+    """Mise à jour conditionnelle de jobs, répercutée sur la révision de leurs sessions"""
+    session_ids = set(jobs.values_list('session_id', flat=True))
+    count = jobs.update(**fields)
+    if count:
+        bump_session_revision(*session_ids)
+    return count
+
+
+def _publish_status(job_id, status, **data):
+    """Annoncer un changement de statut aux flux SSE du job ouverts dans ce processus"""
+    job_events.publish(job_id, 'status', {'job_id': str(job_id), 'status': status, **data})
+
+
+def get_scheduler_config():
+    """Configuration de l'ordonnanceur fusionnée avec les valeurs par défaut"""
+    config = dict(DEFAULT_SCHEDULER_CONFIG)
+    config.update(getattr(settings, 'PROCESSING_SCHEDULER', {}))
+    return config
+
+
+class JobScheduler:
+    """Répartiteur de jobs de traitement adossé à la base de données"""
+
+    def __init__(self, max_concurrent_jobs, max_jobs_per_session, poll_interval, batch_size, stale_after):
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_jobs_per_session = max_jobs_per_session
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.stale_after = stale_after
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_jobs, thread_name_prefix='processing-job'
+        )
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Démarrer le thread de répartition s'il ne tourne pas déjà"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='processing-scheduler', daemon=True)
+            self._thread.start()
+        logger.info("Ordonnanceur de traitements démarré")
+
+    def stop(self):
+        """Arrêter la répartition et remettre en file les jobs de ce processus
+        
+        Appelé à la sortie d'un worker gunicorn (recyclage après
+        `max_requests`) : les jobs réclamés ici repassent `pending` et sont
+        repris par un autre processus au lieu de rester `running` jusqu'à
+        `STALE_AFTER`. Leurs tâches QGIS sont interrompues.
+        """
+        self._stop.set()
+        self._wake.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        for job_id in running:
+            cancel_qgis_task(str(job_id))
+        requeued = _transition(
+            ProcessingJob.objects.filter(job_id__in=running, status='running'),
+            status='pending', started_at=None
+        )
+        for job_id in running:
+            _publish_status(job_id, 'pending')
+        logger.info(f"{requeued} jobs de traitement remis en file à l'arrêt du processus")
+
+    def notify(self):
+        """Signaler qu'un job vient d'être créé ou de se terminer"""
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self._abort_cancelled()
+                self._fail_stale()
+                self._dispatch()
+            except Exception as e:
+                logger.error(f"Erreur de l'ordonnanceur de traitements: {e}")
+            finally:
+                close_old_connections()
+
+    def _abort_cancelled(self):
+        """Interrompre les jobs locaux annulés depuis un autre processus"""
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        cancelled = ProcessingJob.objects.filter(job_id__in=running, status='cancelled')
+        for job_id in cancelled.values_list('job_id', flat=True):
+            cancel_qgis_task(str(job_id))
+
+    def _fail_stale(self):
+        """Libérer les jobs restés `running` après l'arrêt brutal d'un processus"""
+        with self._lock:
+            running = list(self._running)
+        stale = ProcessingJob.objects.filter(
+            status='running',
+            started_at__lt=timezone.now() - timedelta(seconds=self.stale_after)
+        ).exclude(job_id__in=running)
+        count = _transition(
+            stale,
+            status='failed', error="Job abandonné (processus arrêté)", completed_at=timezone.now()
+        )
+        if count:
+            logger.warning(f"{count} jobs de traitement abandonnés marqués en échec")
+
+    def _dispatch(self):
+        """Réclamer autant de jobs `pending` que les limites le permettent"""
+        running_by_session = dict(
+            ProcessingJob.objects.filter(status='running')
+            .values('session')
+            .annotate(count=Count('job_id'))
+            .values_list('session', 'count')
+        )
+        total_running = sum(running_by_session.values())
+        if total_running >= self.max_concurrent_jobs:
+            return
+
+        pending = ProcessingJob.objects.filter(status='pending').order_by('created_at')
+        for job_id, session_id in pending.values_list('job_id', 'session')[:self.batch_size]:
+            if total_running >= self.max_concurrent_jobs:
+                break
+            if running_by_session.get(session_id, 0) >= self.max_jobs_per_session:
+                continue
+
+            claimed = _transition(
+                ProcessingJob.objects.filter(job_id=job_id, status='pending'),
+                status='running', started_at=timezone.now()
+            )
+            if not claimed:
+                continue
+            _publish_status(job_id, 'running')
+
+            total_running += 1
+            running_by_session[session_id] = running_by_session.get(session_id, 0) + 1
+            with self._lock:
+                self._running.add(job_id)
+            self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        """Exécuter un job réclamé et enregistrer son issue"""
+        config = get_job_events_config()
+        progress = {}
+        log = deque(maxlen=config['LOG_LINES'])
+        last_write = [0.0]
+
+        def snapshot():
+            return {**progress, 'log': list(log)} if log else dict(progress)
+
+        def on_progress(data):
+            # Publié à chaque appel ; enregistré en base au plus toutes les
+            # PROGRESS_WRITE_INTERVAL secondes (flux des autres processus)
+            if 'log' in data:
+                line = {'level': data.get('level', 'info'), 'message': data['log']}
+                log.append(line)
+                job_events.publish(job_id, 'log', line)
+            else:
+                progress.update(data)
+                job_events.publish(job_id, 'progress', data)
+            now = time.monotonic()
+            if now - last_write[0] >= config['PROGRESS_WRITE_INTERVAL']:
+                last_write[0] = now
+                ProcessingJob.objects.filter(job_id=job_id, status='running').update(progress=snapshot())
+
+        try:
+            job = ProcessingJob.objects.select_related('session').get(job_id=job_id)
+            progress.update(job.progress or {})
+            handler = JOB_HANDLERS.get(job.algorithm, run_processing_job)
+            result = handler(job, on_progress)
+            completed = _transition(
+                ProcessingJob.objects.filter(job_id=job_id, status='running'),
+                status='completed', result=result, progress=snapshot(), completed_at=timezone.now()
+            )
+            if completed:
+                _publish_status(job_id, 'completed', result=result, progress=snapshot())
+        except JobCancelled:
+            logger.info(f"Job de traitement {job_id} annulé")
+        except Exception as e:
+            if self._stop.is_set():
+                # Tâche interrompue par `stop`, qui a remis le job en file
+                logger.info(f"Job de traitement {job_id} interrompu par l'arrêt du processus: {e}")
+                return
+            logger.error(f"Échec du job de traitement {job_id}: {e}")
+            failed = _transition(
+                ProcessingJob.objects.filter(job_id=job_id, status='running'),
+                status='failed', error=str(e), progress=snapshot(), completed_at=timezone.now()
+            )
+            if failed:
+                _publish_status(job_id, 'failed', error=str(e), progress=snapshot())
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+            close_old_connections()
+            self._wake.set()
+
+    def cancel(self, job_id):
+        """Annuler un job `pending` ou `running` ; renvoie False s'il est déjà terminé"""
+        updated = _transition(
+            ProcessingJob.objects.filter(job_id=job_id, status__in=ACTIVE_STATUSES),
+            status='cancelled', completed_at=timezone.now()
+        )
+        if not updated:
+            return False
+        _publish_status(job_id, 'cancelled')
+        with self._lock:
+            is_local = job_id in self._running
+        if is_local:
+            cancel_qgis_task(str(job_id))
+        return True
+
+
+def run_processing_job(job, on_progress):
+    """Exécuter un algorithme processing QGIS"""
+    return run_qgis_task('run_processing', {
+        **session_payload(job.session),
+        'algorithm': job.algorithm,
+        'parameters': job.parameters,
+    }, job_key=str(job.job_id), on_progress=on_progress)
+
+
+def run_pdf_batch_job(job, on_progress):
+    """Générer un lot de croquis PDF et enregistrer le fichier produit"""
+    parameters = job.parameters
+    extension = 'zip' if parameters['output'] == 'zip' else 'pdf'
+    relative_path, output_path = generated_file_path(extension)
+    result = run_qgis_task('generate_pdf_batch', {
+        **session_payload(job.session),
+        'layout_config': parameters['layout_config'],
+        'template': parameters.get('layout_template'),
+        'entries': parameters['entries'],
+        'output': parameters['output'],
+        'output_path': output_path,
+    }, job_key=str(job.job_id), on_progress=on_progress)
+
+    if not ProcessingJob.objects.filter(job_id=job.job_id, status='running').exists():
+        # Annulé (ou remis en file) pendant la génération : rien n'est enregistré
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+        raise JobCancelled(f"Job {job.job_id} annulé pendant la génération")
+
+    generated_file = GeneratedFile.objects.create(
+        session=job.session,
+        name=parameters['output_filename'],
+        file_type='pdf' if extension == 'pdf' else 'other',
+        file_path=relative_path,
+        size=result['size'],
+        metadata={'job_id': str(job.job_id), 'items': result['items'], 'output': parameters['output']}
+    )
+    return {'file_id': str(generated_file.file_id), 'items': result['items'], 'size': result['size']}
+
+
+# Jobs internes identifiés par leur `algorithm` ; les autres sont des algorithmes processing
+JOB_HANDLERS = {
+    PDF_BATCH_ALGORITHM: run_pdf_batch_job,
+}
+
+
+def get_job_scheduler():
+    """Obtenir l'ordonnanceur de traitements global"""
+    global job_scheduler
+    if job_scheduler is None:
+        with job_scheduler_lock:
+            if job_scheduler is None:
+                config = get_scheduler_config()
+                job_scheduler = JobScheduler(
+                    max_concurrent_jobs=config['MAX_CONCURRENT_JOBS'],
+                    max_jobs_per_session=config['MAX_JOBS_PER_SESSION'],
+                    poll_interval=config['POLL_INTERVAL'],
+                    batch_size=config['BATCH_SIZE'],
+                    stale_after=config['STALE_AFTER'],
+                )
+    return job_scheduler
@@ -1,5 +1,6 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import ProjectSession, Layer, ProcessingJob, GeneratedFile
+from .models import ProjectSession, Layer, ProcessingJob, GeneratedFile, LayoutTemplate
 from PyQt5.QtCore import QDateTime
 
 class QDateTimeReadOnlyField(serializers.ReadOnlyField):
@@ -18,6 +19,8 @@ class ProjectSessionSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProjectSession
         fields = '__all__'
+        # Révisions et dates internes : alimentent les ETag et les clés de cache
+        read_only_fields = ('created_at', 'last_accessed', 'revision', 'layers_revision', 'modified_at')
 
 class LayerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -29,7 +32,7 @@ class ProcessingJobSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProcessingJob
         fields = '__all__'
-        read_only_fields = ('job_id', 'created_at', 'completed_at')
+        read_only_fields = ('job_id', 'progress', 'created_at', 'started_at', 'completed_at')
 
 class GeneratedFileSerializer(serializers.ModelSerializer):
     download_url = serializers.SerializerMethodField()
@@ -42,7 +45,7 @@ class GeneratedFileSerializer(serializers.ModelSerializer):
     def get_download_url(self, obj):
         request = self.context.get('request')
         if request and obj.file_path:
-            return request.build_absolute_uri(obj.file_path.url)
+            return request.build_absolute_uri(reverse('file-download', args=[obj.file_id]))
         return None
 
 class LayerFeatureSerializer(serializers.Serializer):
@@ -50,6 +53,13 @@ class LayerFeatureSerializer(serializers.Serializer):
     session_id = serializers.UUIDField()
     offset = serializers.IntegerField(min_value=0, default=0)
     limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+    cursor = serializers.CharField(required=False, allow_blank=True)
+    bbox = serializers.CharField(required=False, allow_blank=True)
+    filter = serializers.CharField(required=False, allow_blank=True)
+    format = serializers.ChoiceField(choices=['json', 'geojson-stream', 'ndjson'], default='json')
+    fields = serializers.CharField(required=False, allow_blank=True)
+    simplify = serializers.FloatField(required=False, allow_null=True, min_value=0)
+    precision = serializers.IntegerField(default=8, min_value=0, max_value=15)
 
 class VectorLayerAddSerializer(serializers.Serializer):
     data_source = serializers.CharField()
@@ -64,12 +74,27 @@ class VectorLayerAddSerializer(serializers.Serializer):
     label_size = serializers.IntegerField(default=10, min_value=1, max_value=100)
     label_offset_x = serializers.IntegerField(default=0)
     label_offset_y = serializers.IntegerField(default=0)
+    build_spatial_index = serializers.BooleanField(default=False)
+
+class SpatialIndexSerializer(serializers.Serializer):
+    layer_id = serializers.CharField()
+    session_id = serializers.UUIDField()
 
 class RasterLayerAddSerializer(serializers.Serializer):
     data_source = serializers.CharField()
     layer_name = serializers.CharField(default="Couche Raster")
     session_id = serializers.UUIDField()
 
+class LayerSourceSerializer(serializers.Serializer):
+    data_source = serializers.CharField()
+    layer_name = serializers.CharField(required=False)
+    layer_type = serializers.ChoiceField(choices=['vector', 'raster'], default='vector')
+
+class LayerBulkAddSerializer(serializers.Serializer):
+    session_id = serializers.UUIDField()
+    layers = LayerSourceSerializer(many=True, allow_empty=False, max_length=500)
+    build_spatial_index = serializers.BooleanField(default=False)
+
 class MapRenderSerializer(serializers.Serializer):
     session_id = serializers.UUIDField()
     width = serializers.IntegerField(default=800, min_value=100, max_value=4000)
@@ -96,12 +121,48 @@ class MapRenderSerializer(serializers.Serializer):
         choices=['corners', 'edges', 'all'], default='edges'
     )
     grid_vertical_labels = serializers.BooleanField(default=False)
+    # Détail des temps de rendu (étapes, couches, étiquetage) dans les métadonnées
+    profile = serializers.BooleanField(default=False)
     grid_label_font_size = serializers.IntegerField(default=8, min_value=6, max_value=20)
 
+class LayoutTemplateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LayoutTemplate
+        fields = '__all__'
+        read_only_fields = ('template_id', 'template_file', 'version', 'items', 'created_at', 'updated_at')
+
+    def validate_layout_config(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("layout_config doit être un objet")
+        return value
+
 class PDFGenerateSerializer(serializers.Serializer):
     session_id = serializers.UUIDField()
     layout_config = serializers.JSONField(default=dict)
+    # Modèle de mise en page nommé ; seules les `variables` changent d'une requête à l'autre
+    template = serializers.CharField(required=False)
+    variables = serializers.JSONField(default=dict)
     output_filename = serializers.CharField(default='generated_report.pdf')
 
+class PDFBatchEntrySerializer(serializers.Serializer):
+    bbox = serializers.CharField(required=False, allow_null=True)
+    layer_id = serializers.CharField(required=False)
+    feature_id = serializers.IntegerField(required=False, min_value=0)
+    title = serializers.CharField(required=False, allow_blank=True)
+    layout_config = serializers.JSONField(default=dict)
+
+    def validate(self, attrs):
+        if not attrs.get('bbox') and (attrs.get('layer_id') is None or attrs.get('feature_id') is None):
+            raise serializers.ValidationError("bbox ou layer_id et feature_id sont requis")
+        return attrs
+
+class PDFBatchGenerateSerializer(serializers.Serializer):
+    session_id = serializers.UUIDField()
+    layout_config = serializers.JSONField(default=dict)
+    template = serializers.CharField(required=False)
+    entries = PDFBatchEntrySerializer(many=True, min_length=1, max_length=1000)
+    output = serializers.ChoiceField(choices=['pdf', 'zip'], default='pdf')
+    output_filename = serializers.CharField(default='croquis_batch.pdf')
+
 class QRScanSerializer(serializers.Serializer):
     qr_data = serializers.CharField()
\ No newline at end of file
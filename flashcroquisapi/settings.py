@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -19,13 +21,25 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = "django-insecure-bh)o(j4&85g5zkc%%7d=i6kbds(p!e0%!0$*83l8xa!f2y33#6"
+# Hors développement (DJANGO_DEBUG=0), la clé et les hôtes servis viennent
+# obligatoirement de l'environnement d'exécution : le démarrage échoue sinon.
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', '')
 
-# SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Liste séparée par des virgules (ex. « api.example.org,localhost ») en production
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
 
-ALLOWED_HOSTS = []
+if not DEBUG:
+    missing = [name for name, value in (
+        ('DJANGO_SECRET_KEY', SECRET_KEY), ('DJANGO_ALLOWED_HOSTS', ALLOWED_HOSTS)
+    ) if not value]
+    if missing:
+        raise ImproperlyConfigured(f"Variables requises avec DJANGO_DEBUG=0: {', '.join(missing)}")
+elif not SECRET_KEY:
+    SECRET_KEY = "django-insecure-bh)o(j4&85g5zkc%%7d=i6kbds(p!e0%!0$*83l8xa!f2y33#6"
 
 
 # Application definition
@@ -45,6 +59,10 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # L'API navigable n'est proposée qu'en développement
+    'DEFAULT_RENDERER_CLASSES': ['flashcroquisapi.renderers.FastJSONRenderer'] + (
+        ['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []
+    ),
 }
 
 SPECTACULAR_SETTINGS = {
@@ -56,6 +74,7 @@ SPECTACULAR_SETTINGS = {
 }
 
 MIDDLEWARE = [
+    "flashcroquisapi.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -88,12 +107,54 @@ WSGI_APPLICATION = "flashcroquisapi.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB_ENGINE=sqlite (défaut) ou postgresql.
+# SQLite : WAL et réglages de connexion (SQLITE_TUNING=0 pour les désactiver),
+# transactions IMMEDIATE pour éviter les « database is locked » en écriture concurrente.
+# PostgreSQL : connexions persistantes (DB_CONN_MAX_AGE) vérifiées avant réutilisation,
+# ou pool psycopg (DB_POOL=1), exclusif des connexions persistantes.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get('POSTGRES_DB', 'flashcroquis'),
+            "USER": os.environ.get('POSTGRES_USER', 'flashcroquis'),
+            "PASSWORD": os.environ.get('POSTGRES_PASSWORD', ''),
+            "HOST": os.environ.get('POSTGRES_HOST', 'localhost'),
+            "PORT": os.environ.get('POSTGRES_PORT', '5432'),
+            "CONN_MAX_AGE": 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    "max_size": int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                    "timeout": float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                },
+            } if DB_POOL else {},
+        }
     }
-}
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get('DB_NAME', BASE_DIR / "db.sqlite3"),
+        }
+    }
+    if os.environ.get('SQLITE_TUNING', '1') == '1':
+        DATABASES["default"]["OPTIONS"] = {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 20000)) / 1000,
+            "init_command": ";".join([
+                "PRAGMA journal_mode=WAL",
+                f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+                f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 20000))}",
+                f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))}",
+                "PRAGMA temp_store=MEMORY",
+            ]),
+        }
 
 
 # Password validation
@@ -133,6 +194,115 @@ USE_TZ = True
 STATIC_URL = "static/"
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Pool de workers QGIS
+# Chaque worker est un processus qui initialise QGIS une seule fois au démarrage.
+# Chaque worker gunicorn démarre son propre pool : SIZE vaut par défaut
+# cpu_count // WEB_CONCURRENCY (au moins 1), soit au total WEB_CONCURRENCY × SIZE
+# processus QGIS, environ un par cœur.
+
+QGIS_WORKER_POOL = {
+    'ENABLED': os.environ.get('QGIS_WORKER_POOL_ENABLED', '1') == '1',
+    'SIZE': int(os.environ.get(
+        'QGIS_WORKER_POOL_SIZE',
+        max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get('WEB_CONCURRENCY', 1))))
+    )),
+    'MAX_JOBS_PER_WORKER': int(os.environ.get('QGIS_WORKER_MAX_JOBS', 200)),
+    'MAX_MEMORY_MB': int(os.environ.get('QGIS_WORKER_MAX_MEMORY_MB', 1024)),
+    'ACQUIRE_TIMEOUT': float(os.environ.get('QGIS_WORKER_ACQUIRE_TIMEOUT', 5)),
+    'JOB_TIMEOUT': float(os.environ.get('QGIS_WORKER_JOB_TIMEOUT', 300)),
+    'MAX_WAITING': int(os.environ.get('QGIS_WORKER_MAX_WAITING', 32)),
+}
+
+# Démarrage de QGIS : WARMUP initialise QGIS (ou démarre le pool) dès le chargement
+# de l'application plutôt qu'à la première requête ; un échec est retenté avec
+# une attente exponentielle
+
+QGIS_STARTUP = {
+    'WARMUP': os.environ.get('QGIS_WARMUP', '0') == '1',
+    'RETRY_BASE_DELAY': float(os.environ.get('QGIS_INIT_RETRY_BASE_DELAY', 1)),
+    'RETRY_MAX_DELAY': float(os.environ.get('QGIS_INIT_RETRY_MAX_DELAY', 60)),
+    'WORKER_INIT_ATTEMPTS': int(os.environ.get('QGIS_WORKER_INIT_ATTEMPTS', 3)),
+}
+
+# Ordonnanceur des traitements (file d'attente adossée à la table processing_jobs)
+
+PROCESSING_SCHEDULER = {
+    'MAX_CONCURRENT_JOBS': int(os.environ.get('PROCESSING_MAX_CONCURRENT_JOBS', 4)),
+    'MAX_JOBS_PER_SESSION': int(os.environ.get('PROCESSING_MAX_JOBS_PER_SESSION', 1)),
+    'POLL_INTERVAL': float(os.environ.get('PROCESSING_POLL_INTERVAL', 1.0)),
+    'STALE_AFTER': int(os.environ.get('PROCESSING_STALE_AFTER', 3600)),
+}
+
+# Flux SSE /api/processing/{job_id}/events/ : avancement publié en mémoire, relu
+# en base lorsque le job tourne dans un autre processus
+
+JOB_EVENTS = {
+    'HEARTBEAT': 15.0,
+    'DB_POLL_INTERVAL': float(os.environ.get('JOB_EVENTS_DB_POLL_INTERVAL', 1.0)),
+    'PROGRESS_WRITE_INTERVAL': float(os.environ.get('JOB_EVENTS_PROGRESS_WRITE_INTERVAL', 0.5)),
+    'LOG_LINES': 50,
+    'MAX_DURATION': 3600,
+    # Flux simultanés par processus : sous WSGI chacun occupe un thread de requête
+    'MAX_STREAMS': int(os.environ.get('JOB_EVENTS_MAX_STREAMS', 4)),
+    'MAX_ASYNC_STREAMS': int(os.environ.get('JOB_EVENTS_MAX_ASYNC_STREAMS', 1000)),
+}
+
+# Cache disque des tuiles XYZ raster (MEDIA_ROOT/tiles) et vectorielles (MEDIA_ROOT/mvt)
+
+TILE_CACHE = {
+    'TILE_SIZE': 256,
+    'METATILE_SIZE': int(os.environ.get('TILE_METATILE_SIZE', 4)),
+    'BUFFER': 64,
+    'MAX_ZOOM': 22,
+    'MVT_RESOLUTION': 4096,
+    'MVT_BUFFER': 256,
+}
+
+# Cache des rendus /api/map/render et /api/map/generate_pdf
+
+RENDER_CACHE = {
+    'ENABLED': os.environ.get('RENDER_CACHE_ENABLED', '1') == '1',
+    'MAX_AGE': int(os.environ.get('RENDER_CACHE_MAX_AGE', 24 * 3600)),
+    'MAX_TOTAL_BYTES': int(os.environ.get('RENDER_CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+    'EVICT_EVERY': 20,
+}
+
+# Cache LRU des QgsProject chargés, par session (dans chaque processus QGIS)
+
+PROJECT_CACHE = {
+    'MAX_ENTRIES': int(os.environ.get('PROJECT_CACHE_MAX_ENTRIES', 32)),
+    'MAX_MEMORY_MB': int(os.environ.get('PROJECT_CACHE_MAX_MEMORY_MB', 512)),
+}
+
+# Téléchargement des fichiers générés : OFFLOAD vaut '', 'x-accel-redirect' (nginx)
+# ou 'x-sendfile' (Apache/lighttpd) pour laisser le proxy frontal servir les octets
+
+FILE_DOWNLOADS = {
+    'OFFLOAD': os.environ.get('FILE_DOWNLOAD_OFFLOAD', ''),
+    'ACCEL_PREFIX': os.environ.get('FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/'),
+}
+
+# Histogrammes de performance par action, exposés sur /api/health/metrics/
+
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', '1') == '1',
+    # Part des rendus de carte profilés d'office (0 à 1), en plus de `profile=true`
+    'RENDER_PROFILE_SAMPLE_RATE': float(os.environ.get('METRICS_RENDER_PROFILE_SAMPLE_RATE', 0)),
+}
+
+# Expiration des sessions inactives et quotas disque (commande `reap_sessions`)
+
+REAPER = {
+    # Nettoyage périodique dans chaque processus Django, en plus de la commande
+    'ENABLED': os.environ.get('REAPER_ENABLED', '0') == '1',
+    'INTERVAL': int(os.environ.get('REAPER_INTERVAL', 3600)),
+    'SESSION_TTL': int(os.environ.get('SESSION_TTL', 7 * 24 * 3600)),
+    'SESSION_QUOTA_BYTES': int(os.environ.get('SESSION_QUOTA_BYTES', 512 * 1024 * 1024)),
+    'BATCH_SIZE': 100,
+    # Mise à jour de last_accessed par les lectures, au plus une fois par intervalle
+    'TOUCH_INTERVAL': int(os.environ.get('SESSION_TOUCH_INTERVAL', 60)),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import ProjectSession, Layer, GeneratedFile, ProcessingJob
+from .tile_cache import (
+    invalidate_session_tiles, invalidate_layer_vector_tiles, invalidate_session_vector_tiles
+)
+
+def bump_session_revision(*session_ids):
+    """Signaler une écriture dans des sessions (ETag / Last-Modified)"""
+    ProjectSession.objects.filter(session_id__in=session_ids).update(
+        revision=F('revision') + 1, modified_at=timezone.now()
+    )
+
+def bump_layers_revision(session_id):
+    """Invalider les caches dérivés des couches d'une session"""
+    ProjectSession.objects.filter(session_id=session_id).update(
+        layers_revision=F('layers_revision') + 1,
+        revision=F('revision') + 1,
+        modified_at=timezone.now()
+    )
+    transaction.on_commit(lambda: invalidate_session_tiles(session_id))
+
+@receiver(post_save, sender=Layer)
+def layer_saved(sender, instance, **kwargs):
+    bump_layers_revision(instance.session_id)
+    transaction.on_commit(lambda: invalidate_layer_vector_tiles(instance.session_id, instance.pk))
+
+@receiver(post_delete, sender=Layer)
+def layer_deleted(sender, instance, **kwargs):
+    layer_pk = instance.pk
+    bump_layers_revision(instance.session_id)
+    transaction.on_commit(lambda: invalidate_layer_vector_tiles(instance.session_id, layer_pk))
+
+@receiver(post_save, sender=GeneratedFile)
+@receiver(post_delete, sender=GeneratedFile)
+@receiver(post_save, sender=ProcessingJob)
+@receiver(post_delete, sender=ProcessingJob)
+def session_child_written(sender, instance, **kwargs):
+    bump_session_revision(instance.session_id)
+
+@receiver(post_delete, sender=ProjectSession)
+def session_deleted(sender, instance, **kwargs):
+    def invalidate():
+        invalidate_session_tiles(instance.session_id)
+        invalidate_session_vector_tiles(instance.session_id)
+    transaction.on_commit(invalidate)
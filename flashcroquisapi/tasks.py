@@ -0,0 +1,1034 @@
+"""
+Tâches QGIS exécutées soit dans un worker du pool, soit en ligne.
+
+Les tâches ne touchent jamais l'ORM Django : elles reçoivent un payload
+sérialisable (dictionnaires, listes, chaînes) et renvoient un résultat
+sérialisable, ce qui permet de les faire transiter par un canal IPC.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+from PyQt5.QtCore import QPointF, QRectF, QSize, Qt
+from PyQt5.QtGui import QColor, QFont, QPainter, QPen
+from PyQt5.QtXml import QDomDocument
+
+from . import features, layer_metadata
+from .qgis_manager import project_sessions
+from .utils import vector_provider, format_layer_info
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {'png': 'PNG', 'jpg': 'JPG', 'jpeg': 'JPG'}
+
+# Couches ouvertes réutilisées d'une tâche à l'autre (tuiles vectorielles, lots PDF, entités)
+_vector_layers = OrderedDict()
+VECTOR_LAYERS_MAX = 16
+
+# Modèles de mise en page : documents .qpt lus par (modèle, version) et
+# mises en page préconstruites par (modèle, version, session), clonées à chaque requête
+_layout_templates = OrderedDict()
+_template_layouts = OrderedDict()
+_templates_lock = threading.Lock()
+LAYOUT_TEMPLATES_MAX = 16
+
+# Rappel de progression de la tâche en cours, propre à chaque thread
+_progress = threading.local()
+
+# Feedbacks des traitements en cours, pour l'annulation en mode en ligne
+active_feedbacks = {}
+cancelled_jobs = set()
+feedbacks_lock = threading.Lock()
+
+
+def _parse_color(value, default='#FFFFFF'):
+    """Convertir une chaîne de couleur en QColor valide"""
+    color = QColor(value) if value else QColor()
+    if not color.isValid():
+        color = QColor(default)
+    return color
+
+
+def _parse_bbox(classes, bbox):
+    """Convertir une bbox 'xmin,ymin,xmax,ymax' en QgsRectangle"""
+    if not bbox:
+        return None
+    values = [float(v) for v in str(bbox).split(',')]
+    if len(values) != 4:
+        raise ValueError(f"bbox invalide: {bbox}")
+    return classes['QgsRectangle'](*values)
+
+
+def _load_layer(classes, info):
+    """Charger une couche QGIS depuis sa description"""
+    if info.get('layer_type') == 'raster':
+        layer = classes['QgsRasterLayer'](info['source'], info['name'])
+    else:
+        provider, uri = vector_provider(info['source'])
+        layer = classes['QgsVectorLayer'](uri, info['name'], provider)
+    if not layer.isValid():
+        logger.warning(f"Couche invalide ignorée: {info['name']} ({info['source']})")
+        return None
+    metadata = info.get('metadata')
+    if metadata and metadata.get('source') == info['source']:
+        # Métadonnées persistées indexées par la source normalisée par QGIS
+        layer_metadata.seed(metadata, layer.source())
+    if info.get('spatial_index') == 'memory':
+        # Les index en mémoire ne survivent pas au rechargement de la couche
+        layer.dataProvider().createSpatialIndex()
+    return layer
+
+
+def _load_project(manager, payload):
+    """Réhydrater un projet depuis son fichier, sa copie .qgz ou les couches"""
+    classes = manager.get_classes()
+    project = classes['QgsProject']()
+    project_file = payload.get('project_file')
+
+    if project_file and os.path.exists(project_file):
+        if not project.read(project_file):
+            raise RuntimeError(f"Impossible de charger le projet {project_file}")
+        return project
+
+    writeback_path = payload.get('writeback_path')
+    if writeback_path and os.path.exists(writeback_path):
+        if project.read(writeback_path):
+            revision, found = project.readNumEntry('flashcroquis', 'layers_revision', -1)
+            if found and revision == payload.get('layers_revision'):
+                return project
+        project.clear()
+
+    project.setTitle(payload.get('project_title') or '')
+    project.setCrs(classes['QgsCoordinateReferenceSystem'](payload.get('project_crs') or 'EPSG:4326'))
+    for info in payload.get('layers', []):
+        if not info.get('source'):
+            continue
+        layer = _load_layer(classes, info)
+        if layer is not None:
+            project.addMapLayer(layer)
+    return project
+
+
+def build_project(manager, payload):
+    """Obtenir le QgsProject de la session depuis le cache LRU, chargé si absent"""
+    session_id = payload.get('session_id')
+    if not session_id:
+        return _load_project(manager, payload)
+
+    revision = payload.get('layers_revision')
+    project = project_sessions.get(session_id, revision)
+    if project is None:
+        project = _load_project(manager, payload)
+        project_sessions.put(session_id, project, revision, payload.get('writeback_path'))
+    return project
+
+
+def _project_extent(classes, project, layers):
+    """Calculer l'étendue combinée des couches dans le SCR du projet"""
+    extent = classes['QgsRectangle']()
+    extent.setMinimal()
+    for layer in layers:
+        transform = classes['QgsCoordinateTransform'](layer.crs(), project.crs(), project)
+        try:
+            extent.combineExtentWith(transform.transformBoundingBox(layer.extent()))
+        except Exception as e:
+            logger.warning(f"Étendue de la couche {layer.id()} ignorée: {e}")
+    return extent
+
+
+def _draw_points(map_settings, image, params):
+    """Dessiner les points demandés par-dessus le rendu"""
+    points = params.get('show_points') or []
+    if isinstance(points, dict):
+        points = [points]
+    to_pixel = map_settings.mapToPixel()
+    size = params.get('points_size', 10)
+    color = _parse_color(params.get('points_color'), '#FF0000')
+
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setPen(QPen(color))
+    painter.setBrush(color)
+    for index, point in enumerate(points):
+        if isinstance(point, dict):
+            x, y, label = point.get('x'), point.get('y'), point.get('label', str(index + 1))
+        else:
+            x, y, label = point[0], point[1], str(index + 1)
+        pixel = to_pixel.transform(float(x), float(y))
+        px, py = pixel.x(), pixel.y()
+        half = size / 2
+        style = params.get('points_style', 'circle')
+        if style == 'square':
+            painter.drawRect(QRectF(px - half, py - half, size, size))
+        elif style == 'triangle':
+            painter.drawPolygon(QPointF(px, py - half), QPointF(px - half, py + half), QPointF(px + half, py + half))
+        else:
+            painter.drawEllipse(QPointF(px, py), half, half)
+        if params.get('points_labels'):
+            painter.drawText(QPointF(px + half + 2, py - half - 2), label)
+    painter.end()
+
+
+def _draw_grid(map_settings, image, params):
+    """Dessiner une grille de coordonnées par-dessus le rendu"""
+    extent = map_settings.visibleExtent()
+    spacing = params.get('grid_spacing', 1.0)
+    if (extent.width() / spacing) > 1000 or (extent.height() / spacing) > 1000:
+        logger.warning("Espacement de grille trop fin, grille ignorée")
+        return
+
+    to_pixel = map_settings.mapToPixel()
+    grid_type = params.get('grid_type', 'lines')
+    cross = params.get('grid_size', 3)
+    color = _parse_color(params.get('grid_color'), '#0000FF')
+
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setPen(QPen(color, params.get('grid_width', 1)))
+    painter.setFont(QFont('DejaVu Sans', params.get('grid_label_font_size', 8)))
+
+    xs = []
+    x = (extent.xMinimum() // spacing + 1) * spacing
+    while x < extent.xMaximum():
+        xs.append(x)
+        x += spacing
+    ys = []
+    y = (extent.yMinimum() // spacing + 1) * spacing
+    while y < extent.yMaximum():
+        ys.append(y)
+        y += spacing
+
+    width, height = image.width(), image.height()
+    if grid_type == 'lines':
+        for x in xs:
+            px = to_pixel.transform(x, extent.yMinimum()).x()
+            painter.drawLine(QPointF(px, 0), QPointF(px, height))
+        for y in ys:
+            py = to_pixel.transform(extent.xMinimum(), y).y()
+            painter.drawLine(QPointF(0, py), QPointF(width, py))
+    else:
+        for x in xs:
+            for y in ys:
+                pixel = to_pixel.transform(x, y)
+                px, py = pixel.x(), pixel.y()
+                if grid_type == 'dots':
+                    painter.drawPoint(QPointF(px, py))
+                else:
+                    painter.drawLine(QPointF(px - cross, py), QPointF(px + cross, py))
+                    painter.drawLine(QPointF(px, py - cross), QPointF(px, py + cross))
+
+    if params.get('grid_labels'):
+        position = params.get('grid_label_position', 'edges')
+        for x in xs:
+            px = to_pixel.transform(x, extent.yMinimum()).x()
+            painter.save()
+            painter.translate(px + 2, height - 2)
+            if params.get('grid_vertical_labels'):
+                painter.rotate(-90)
+            painter.drawText(QPointF(0, 0), f"{x:g}")
+            painter.restore()
+        for y in ys:
+            py = to_pixel.transform(extent.xMinimum(), y).y()
+            painter.drawText(QPointF(2, py - 2), f"{y:g}")
+        if position in ('corners', 'all'):
+            painter.drawText(QPointF(2, 12), f"{extent.xMinimum():g}, {extent.yMaximum():g}")
+            painter.drawText(
+                QRectF(0, height - 14, width - 2, 14), Qt.AlignRight,
+                f"{extent.xMaximum():g}, {extent.yMinimum():g}"
+            )
+    painter.end()
+
+
+def build_map_settings(manager, project, params, extent=None):
+    """Préparer les QgsMapSettings d'un rendu à partir des paramètres validés"""
+    classes = manager.get_classes()
+    layers = project.layerTreeRoot().layerOrder()
+
+    map_settings = classes['QgsMapSettings']()
+    map_settings.setLayers(layers)
+    map_settings.setDestinationCrs(project.crs())
+    map_settings.setOutputSize(QSize(params.get('width', 800), params.get('height', 600)))
+    map_settings.setOutputDpi(params.get('dpi', 96))
+    background = params.get('background', 'transparent')
+    if params.get('format_image', 'png') != 'png' and background == 'transparent':
+        background = '#FFFFFF'
+    map_settings.setBackgroundColor(_parse_color(background))
+
+    if extent is None:
+        extent = _parse_bbox(classes, params.get('bbox')) or _project_extent(classes, project, layers)
+    if extent.isEmpty():
+        raise ValueError("Impossible de déterminer l'étendue de la carte")
+    map_settings.setExtent(extent)
+
+    if params.get('scale'):
+        map_settings.setExtent(map_settings.computeExtentForScale(extent.center(), params['scale']))
+    return map_settings
+
+
+def _profile_layers(classes, map_settings):
+    """Temps de rendu de chaque couche isolée, sans étiquettes
+    
+    `perLayerRenderingTime()` n'est pas exposé en Python : chaque couche est
+    rendue seule par un job séquentiel, ce qui mesure aussi le décodage raster.
+    """
+    layers = []
+    for layer in map_settings.layers():
+        layer_settings = classes['QgsMapSettings'](map_settings)
+        layer_settings.setLayers([layer])
+        layer_settings.setFlag(classes['QgsMapSettings'].DrawLabeling, False)
+        job = classes['QgsMapRendererSequentialJob'](layer_settings)
+        job.start()
+        job.waitForFinished()
+        layers.append({
+            'layer_id': layer.id(),
+            'name': layer.name(),
+            'provider': layer.providerType(),
+            'ms': job.renderingTime(),
+        })
+    return layers
+
+
+def render_map(manager, payload):
+    """Rendre la carte d'une session dans un fichier image
+    
+    Avec `profile`, le rendu passe par un job séquentiel (les temps des
+    couches s'additionnent) et le résultat contient la durée de chaque étape,
+    de chaque couche et de l'étiquetage (reste du rendu hors couches).
+    """
+    classes = manager.get_classes()
+    params = payload['params']
+    profile = payload.get('profile', False)
+    stages = {}
+    clock = time.perf_counter()
+
+    def stage(name):
+        nonlocal clock
+        now = time.perf_counter()
+        stages[name] = round((now - clock) * 1000, 1)
+        clock = now
+
+    project = build_project(manager, payload)
+    map_settings = build_map_settings(manager, project, params)
+    stage('project_ms')
+
+    job_class = classes['QgsMapRendererSequentialJob' if profile else 'QgsMapRendererParallelJob']
+    job = job_class(map_settings)
+    job.start()
+    job.waitForFinished()
+    image = job.renderedImage()
+    stage('render_ms')
+
+    if params.get('show_grid'):
+        _draw_grid(map_settings, image, params)
+        stage('grid_ms')
+    if params.get('show_points'):
+        _draw_points(map_settings, image, params)
+        stage('points_ms')
+
+    output_path = payload['output_path']
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    image_format = IMAGE_FORMATS[params.get('format_image', 'png')]
+    if not image.save(output_path, image_format, params.get('quality', 90)):
+        raise RuntimeError(f"Impossible d'enregistrer l'image {output_path}")
+    stage('encode_ms')
+
+    extent = map_settings.visibleExtent()
+    result = {
+        'path': output_path,
+        'size': os.path.getsize(output_path),
+        'extent': [extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()],
+    }
+    if profile:
+        layers = _profile_layers(classes, map_settings)
+        stages['labeling_ms'] = max(0, job.renderingTime() - sum(layer['ms'] for layer in layers))
+        result['profile'] = {'stages': stages, 'layers': layers}
+    return result
+
+
+def render_metatile(manager, payload):
+    """Rendre un métatuile EPSG:3857 et le découper en tuiles PNG"""
+    classes = manager.get_classes()
+    project = build_project(manager, payload)
+    span = payload['span']
+    tile_size = payload['tile_size']
+    buffer = payload['buffer']
+    xmin, ymin, xmax, ymax = payload['bounds']
+    pixel_size = (xmax - xmin) / (span * tile_size)
+
+    map_settings = classes['QgsMapSettings']()
+    map_settings.setLayers(project.layerTreeRoot().layerOrder())
+    map_settings.setDestinationCrs(classes['QgsCoordinateReferenceSystem']('EPSG:3857'))
+    map_settings.setBackgroundColor(QColor(0, 0, 0, 0))
+    map_settings.setOutputSize(QSize(span * tile_size + 2 * buffer, span * tile_size + 2 * buffer))
+    map_settings.setExtent(classes['QgsRectangle'](
+        xmin - buffer * pixel_size, ymin - buffer * pixel_size,
+        xmax + buffer * pixel_size, ymax + buffer * pixel_size
+    ))
+
+    job = classes['QgsMapRendererParallelJob'](map_settings)
+    job.start()
+    job.waitForFinished()
+    image = job.renderedImage()
+
+    count = 0
+    for column in range(span):
+        column_dir = os.path.join(payload['tile_dir'], str(payload['z']), str(payload['x0'] + column))
+        os.makedirs(column_dir, exist_ok=True)
+        for row in range(span):
+            tile = image.copy(buffer + column * tile_size, buffer + row * tile_size, tile_size, tile_size)
+            path = os.path.join(column_dir, f"{payload['y0'] + row}.png")
+            # Écriture atomique : un lecteur concurrent ne voit jamais de tuile partielle
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            if not tile.save(temporary_path, 'PNG'):
+                raise RuntimeError(f"Impossible d'enregistrer la tuile {path}")
+            os.replace(temporary_path, path)
+            count += 1
+    return {'tiles': count}
+
+
+def _cached_vector_layer(classes, source, name):
+    """Couche ouverte réutilisée d'une tuile à l'autre dans ce processus
+    
+    La date de modification du fichier fait partie de la clé : une source
+    réécrite sur place est rouverte.
+    """
+    try:
+        key = (source, os.path.getmtime(source.split('|')[0]))
+    except OSError:
+        key = (source, None)
+    layer = _vector_layers.get(key)
+    if layer is None:
+        provider, uri = vector_provider(source)
+        layer = classes['QgsVectorLayer'](uri, name, provider)
+        if not layer.isValid():
+            raise ValueError(f"Source de couche invalide: {source}")
+        _vector_layers[key] = layer
+        while len(_vector_layers) > VECTOR_LAYERS_MAX:
+            _vector_layers.popitem(last=False)
+    _vector_layers.move_to_end(key)
+    return layer
+
+
+def encode_vector_tile(manager, payload):
+    """Encoder une tuile Mapbox Vector Tile d'une couche vectorielle
+    
+    L'encodeur QGIS découpe les géométries à l'emprise de la tuile (plus une
+    marge) et les ramène sur la grille de `resolution` unités de la tuile, ce
+    qui simplifie les géométries en fonction du niveau de zoom.
+    """
+    from qgis.core import QgsTileXYZ, QgsVectorTileMVTEncoder
+
+    classes = manager.get_classes()
+    layer = _cached_vector_layer(classes, payload['source'], payload['name'])
+
+    encoder = QgsVectorTileMVTEncoder(QgsTileXYZ(payload['x'], payload['y'], payload['z']))
+    encoder.setResolution(payload['resolution'])
+    encoder.setTileBuffer(payload['buffer'])
+    encoder.setTransformContext(classes['QgsProject'].instance().transformContext())
+    encoder.addLayer(layer, None, payload.get('filter') or '', payload['layer_name'])
+    data = bytes(encoder.encode())
+
+    path = payload['output_path']
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as tile_file:
+        tile_file.write(data)
+    os.replace(temporary_path, path)
+    return {'size': len(data)}
+
+
+def build_print_layout(manager, project, layout_config):
+    """Construire un QgsPrintLayout à partir d'une configuration libre"""
+    classes = manager.get_classes()
+    QgsLayoutPoint = classes['QgsLayoutPoint']
+    QgsLayoutSize = classes['QgsLayoutSize']
+    millimeters = classes['QgsUnitTypes'].LayoutMillimeters
+
+    layout = classes['QgsPrintLayout'](project)
+    layout.initializeDefaults()
+    layout.setName(layout_config.get('name', 'croquis'))
+
+    page = layout.pageCollection().page(0)
+    orientation = (
+        classes['QgsLayoutItemPage'].Landscape
+        if layout_config.get('orientation', 'portrait') == 'landscape'
+        else classes['QgsLayoutItemPage'].Portrait
+    )
+    page.setPageSize(layout_config.get('page_size', 'A4'), orientation)
+    page_width = page.pageSize().width()
+    page_height = page.pageSize().height()
+    margin = layout_config.get('margin', 10)
+
+    title_height = 0
+    if layout_config.get('title'):
+        title_height = 15
+        title = classes['QgsLayoutItemLabel'](layout)
+        title.setId('title')
+        title.setText(layout_config['title'])
+        title.setFont(QFont('DejaVu Sans', layout_config.get('title_size', 16), QFont.Bold))
+        title.setHAlign(Qt.AlignHCenter)
+        title.attemptMove(QgsLayoutPoint(margin, margin, millimeters))
+        title.attemptResize(QgsLayoutSize(page_width - 2 * margin, title_height, millimeters))
+        layout.addLayoutItem(title)
+
+    map_item = classes['QgsLayoutItemMap'](layout)
+    map_item.setId('map')
+    map_item.setRect(0, 0, 10, 10)
+    map_item.setCrs(project.crs())
+    map_item.attemptMove(QgsLayoutPoint(margin, margin + title_height, millimeters))
+    map_item.attemptResize(QgsLayoutSize(
+        page_width - 2 * margin,
+        page_height - 2 * margin - title_height - (20 if layout_config.get('show_scalebar', True) else 0),
+        millimeters
+    ))
+    layers = project.layerTreeRoot().layerOrder()
+    map_item.setLayers(layers)
+    extent = _parse_bbox(classes, layout_config.get('bbox')) or _project_extent(classes, project, layers)
+    if not extent.isEmpty():
+        map_item.zoomToExtent(extent)
+    if layout_config.get('scale'):
+        map_item.setScale(layout_config['scale'])
+    layout.addLayoutItem(map_item)
+
+    if layout_config.get('show_legend', False):
+        legend = classes['QgsLayoutItemLegend'](layout)
+        legend.setId('legend')
+        legend.setLinkedMap(map_item)
+        legend.attemptMove(QgsLayoutPoint(margin + 2, margin + title_height + 2, millimeters))
+        layout.addLayoutItem(legend)
+
+    if layout_config.get('show_scalebar', True):
+        scalebar = classes['QgsLayoutItemScaleBar'](layout)
+        scalebar.setId('scalebar')
+        scalebar.setStyle('Single Box')
+        scalebar.setLinkedMap(map_item)
+        scalebar.applyDefaultSize()
+        scalebar.attemptMove(QgsLayoutPoint(margin, page_height - margin - 15, millimeters))
+        layout.addLayoutItem(scalebar)
+
+    grid_config = layout_config.get('grid')
+    if grid_config:
+        grid = classes['QgsLayoutItemMapGrid']('grid', map_item)
+        grid.setIntervalX(grid_config.get('interval_x', grid_config.get('interval', 1000)))
+        grid.setIntervalY(grid_config.get('interval_y', grid_config.get('interval', 1000)))
+        grid.setAnnotationEnabled(grid_config.get('annotations', True))
+        map_item.grids().addGrid(grid)
+
+    # Textes libres ; `[% @variable %]` est résolu avec les variables de mise en page
+    for label_config in layout_config.get('labels', []):
+        label = classes['QgsLayoutItemLabel'](layout)
+        label.setId(label_config.get('id', ''))
+        label.setText(label_config.get('text', ''))
+        label.setFont(QFont('DejaVu Sans', label_config.get('size', 10)))
+        label.attemptMove(QgsLayoutPoint(label_config.get('x', margin), label_config.get('y', margin), millimeters))
+        label.attemptResize(QgsLayoutSize(label_config.get('width', 60), label_config.get('height', 8), millimeters))
+        layout.addLayoutItem(label)
+
+    for picture_config in layout_config.get('pictures', []):
+        picture = classes['QgsLayoutItemPicture'](layout)
+        picture.setId(picture_config.get('id', ''))
+        picture.setPicturePath(picture_config['path'])
+        picture.attemptMove(QgsLayoutPoint(picture_config.get('x', margin), picture_config.get('y', margin), millimeters))
+        picture.attemptResize(QgsLayoutSize(picture_config.get('width', 30), picture_config.get('height', 30), millimeters))
+        layout.addLayoutItem(picture)
+
+    return layout
+
+
+def compile_layout_template(manager, payload):
+    """Construire la mise en page d'un modèle et l'enregistrer en .qpt"""
+    classes = manager.get_classes()
+    layout = build_print_layout(manager, classes['QgsProject'](), payload.get('layout_config') or {})
+
+    output_path = payload['output_path']
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if not layout.saveAsTemplate(output_path, classes['QgsReadWriteContext']()):
+        raise RuntimeError(f"Impossible d'enregistrer le modèle {output_path}")
+
+    return {
+        'path': output_path,
+        'size': os.path.getsize(output_path),
+        'items': sorted(item.id() for item in layout.items() if hasattr(item, 'id') and item.id()),
+    }
+
+
+def _template_document(template):
+    """Document XML d'un modèle, lu une seule fois par version"""
+    key = (template['template_id'], template['version'])
+    document = _layout_templates.get(key)
+    if document is None:
+        document = QDomDocument()
+        with open(template['path'], 'r', encoding='utf-8') as f:
+            if not document.setContent(f.read()):
+                raise ValueError(f"Modèle de mise en page illisible: {template['path']}")
+        _layout_templates[key] = document
+        while len(_layout_templates) > LAYOUT_TEMPLATES_MAX:
+            _layout_templates.popitem(last=False)
+    _layout_templates.move_to_end(key)
+    return document
+
+
+def template_layout(manager, project, payload):
+    """Clone de la mise en page préconstruite d'un modèle pour ce projet
+    
+    La mise en page chargée depuis le .qpt est gardée tant que le modèle
+    (version) et le projet de session sont inchangés ; chaque requête
+    travaille sur un clone qu'elle peut modifier librement.
+    """
+    classes = manager.get_classes()
+    template = payload['template']
+    key = (template['template_id'], template['version'], payload.get('session_id'))
+    with _templates_lock:
+        cached = _template_layouts.get(key)
+        if cached is None or cached[0] is not project:
+            layout = classes['QgsPrintLayout'](project)
+            _, loaded = layout.loadFromTemplate(_template_document(template), classes['QgsReadWriteContext']())
+            if not loaded:
+                raise ValueError(f"Impossible de charger le modèle {template['template_id']}")
+            map_item = layout.itemById('map')
+            if map_item is not None:
+                map_item.setCrs(project.crs())
+                map_item.setLayers(project.layerTreeRoot().layerOrder())
+            cached = _template_layouts[key] = (project, layout)
+            while len(_template_layouts) > LAYOUT_TEMPLATES_MAX:
+                _template_layouts.popitem(last=False)
+        _template_layouts.move_to_end(key)
+    return cached[1].clone()
+
+
+def patch_layout(classes, project, layout, params, extent=None):
+    """Appliquer les parties variables d'une requête à une mise en page
+    
+    `params` accepte bbox, scale, title, labels ({id: texte}) et attributes,
+    posés comme variables de mise en page (`@nom` dans les expressions).
+    """
+    map_item = layout.itemById('map')
+    if map_item is not None:
+        if extent is None:
+            extent = _parse_bbox(classes, params.get('bbox'))
+        if extent is None:
+            extent = _project_extent(classes, project, project.layerTreeRoot().layerOrder())
+        if not extent.isEmpty():
+            map_item.zoomToExtent(extent)
+        if params.get('scale'):
+            map_item.setScale(params['scale'])
+
+    title_item = layout.itemById('title')
+    if title_item is not None and params.get('title') is not None:
+        title_item.setText(params['title'])
+    for item_id, text in (params.get('labels') or {}).items():
+        label = layout.itemById(item_id)
+        if label is not None and hasattr(label, 'setText'):
+            label.setText(str(text))
+
+    for name, value in (params.get('attributes') or {}).items():
+        classes['QgsExpressionContextUtils'].setLayoutVariable(layout, name, value)
+    layout.refresh()
+
+
+def generate_pdf(manager, payload):
+    """Générer un PDF de croquis avec un QgsPrintLayout"""
+    classes = manager.get_classes()
+    project = build_project(manager, payload)
+    if payload.get('template'):
+        layout = template_layout(manager, project, payload)
+        patch_layout(classes, project, layout, payload.get('variables') or {})
+    else:
+        layout = build_print_layout(manager, project, payload.get('layout_config') or {})
+
+    output_path = payload['output_path']
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    exporter = classes['QgsLayoutExporter'](layout)
+    result = exporter.exportToPdf(output_path, classes['QgsLayoutExporter'].PdfExportSettings())
+    if result != classes['QgsLayoutExporter'].Success:
+        raise RuntimeError(f"Échec de l'export PDF ({result})")
+
+    return {
+        'path': output_path,
+        'size': os.path.getsize(output_path),
+        'pages': layout.pageCollection().pageCount(),
+    }
+
+
+def _spatial_index_status(classes, layer):
+    """Statut d'index spatial d'une couche ouverte"""
+    presence = layer.dataProvider().hasSpatialIndex()
+    source_class = classes['QgsFeatureSource']
+    if presence == source_class.SpatialIndexPresent:
+        return 'present'
+    if presence == source_class.SpatialIndexNotPresent:
+        return 'absent'
+    return 'unknown'
+
+
+def spatial_index(manager, payload):
+    """Consulter, et construire si demandé, l'index spatial d'une couche vectorielle
+    
+    Shapefile : fichier .qix persistant ; GeoPackage : R-tree dans le fichier ;
+    couches mémoire et texte délimité : index en mémoire, reconstruit à chaque
+    chargement de la couche.
+    """
+    classes = manager.get_classes()
+    provider_name, uri = vector_provider(payload['source'])
+    layer = classes['QgsVectorLayer'](uri, payload.get('name') or 'layer', provider_name)
+    if not layer.isValid():
+        raise ValueError(f"Source de couche invalide: {payload['source']}")
+
+    provider = layer.dataProvider()
+    in_memory = provider_name in ('memory', 'delimitedtext')
+    status = _spatial_index_status(classes, layer)
+
+    if payload.get('build') and status != 'present':
+        if not provider.capabilities() & classes['QgsVectorDataProvider'].CreateSpatialIndex:
+            raise ValueError(f"Le fournisseur {provider_name} ne sait pas créer d'index spatial")
+        if not provider.createSpatialIndex():
+            raise RuntimeError(f"Échec de la création de l'index spatial de {payload['source']}")
+        status = 'memory' if in_memory else _spatial_index_status(classes, layer)
+    elif in_memory and payload.get('status') == 'memory':
+        status = 'memory'
+
+    index_file = None
+    if provider.storageType() == 'ESRI Shapefile':
+        candidate = os.path.splitext(uri.split('|')[0])[0] + '.qix'
+        index_file = candidate if os.path.exists(candidate) else None
+        if index_file:
+            status = 'present'
+
+    return {
+        'status': status,
+        'provider': provider_name,
+        'storage': provider.storageType(),
+        'index_file': index_file,
+    }
+
+
+def layer_features(manager, payload):
+    """Page d'entités d'une couche vectorielle, par décalage ou après un curseur
+    
+    La couche reste ouverte dans le worker pour les pages suivantes du flux.
+    `encoded` renvoie les entités en chaînes GeoJSON (flux), sinon en
+    dictionnaires ; `with_total` ajoute le nombre d'entités (cache de métadonnées).
+    """
+    layer_metadata.seed(payload.get('metadata'))
+    vector_layer = _cached_vector_layer(manager.get_classes(), payload['source'], payload['name'])
+    field_names = features.selected_fields(vector_layer, payload.get('fields'))
+    request = features.build_feature_request(
+        vector_layer, field_names, payload.get('bbox'), payload.get('filter')
+    )
+
+    offset, limit = payload.get('offset', 0), payload['limit']
+    if offset:
+        # Pagination par décalage conservée pour les clients existants
+        request.setLimit(offset + limit)
+        page = [
+            feature for index, feature in enumerate(vector_layer.getFeatures(request))
+            if index >= offset
+        ]
+        next_cursor = None
+    else:
+        page, next_cursor = features.page_after(vector_layer, request, payload.get('after_fid'), limit)
+
+    encode = features.feature_to_json if payload.get('encoded') else features.feature_to_geojson
+    result = {
+        'features': [
+            encode(feature, field_names, payload.get('simplify'), payload.get('precision', 8))
+            for feature in page
+        ],
+        'next': next_cursor,
+    }
+    if payload.get('with_total'):
+        result['total'] = format_layer_info(vector_layer, payload['source']).get('feature_count')
+    return result
+
+
+def _inspect_layer(manager, entry):
+    """Ouvrir une source et en extraire les métadonnées à enregistrer sur `Layer`"""
+    classes = manager.get_classes()
+    layer = _load_layer(classes, entry)
+    if layer is None:
+        raise ValueError(f"Source de couche invalide: {entry['source']}")
+
+    info = format_layer_info(layer, entry['source'])
+    info['metadata'] = layer_metadata.record(entry['source'])
+    if entry.get('layer_type') == 'raster':
+        info['spatial_index'] = 'unknown'
+    elif entry.get('build_spatial_index'):
+        info['spatial_index'] = spatial_index(manager, {**entry, 'build': True})['status']
+    else:
+        info['spatial_index'] = _spatial_index_status(classes, layer)
+    return info
+
+
+def inspect_layers(manager, payload):
+    """Valider un lot de sources de couches
+    
+    Une source invalide n'interrompt pas le lot : son entrée porte `error`
+    au lieu des métadonnées.
+    """
+    results = []
+    for entry in payload['layers']:
+        try:
+            results.append({'valid': True, **_inspect_layer(manager, entry)})
+        except Exception as e:
+            results.append({'valid': False, 'source': entry['source'], 'error': str(e)})
+    return results
+
+
+def _entry_extent(classes, project, entry):
+    """Emprise d'une entrée de lot : bbox explicite ou emprise d'une entité"""
+    if entry.get('bbox'):
+        return _parse_bbox(classes, entry['bbox'])
+
+    layer = _cached_vector_layer(classes, entry['source'], entry.get('layer_id') or 'layer')
+    feature = layer.getFeature(entry['feature_id'])
+    if not feature.isValid() or not feature.hasGeometry():
+        raise ValueError(f"Entité {entry['feature_id']} introuvable dans {entry.get('layer_id')}")
+    transform = classes['QgsCoordinateTransform'](layer.crs(), project.crs(), project)
+    extent = transform.transformBoundingBox(feature.geometry().boundingBox())
+    margin = max(extent.width(), extent.height()) * entry.get('margin_ratio', 0.1)
+    extent.grow(margin or 1.0)
+    return extent
+
+
+def _batch_iterator(layout, entries, apply_entry):
+    """Itérateur de mise en page façon atlas sur les entrées d'un lot"""
+    from qgis.core import QgsAbstractLayoutIterator
+
+    class BatchLayoutIterator(QgsAbstractLayoutIterator):
+        def __init__(self):
+            super().__init__()
+            self.index = -1
+
+        def layout(self):
+            return layout
+
+        def beginRender(self):
+            self.index = -1
+            return True
+
+        def endRender(self):
+            return True
+
+        def count(self):
+            return len(entries)
+
+        def next(self):
+            self.index += 1
+            if self.index >= len(entries):
+                return False
+            apply_entry(entries[self.index])
+            report_progress({
+                'done': self.index,
+                'total': len(entries),
+                'percent': round(100 * self.index / len(entries), 1),
+                'current': entries[self.index].get('title') or str(self.index + 1),
+            })
+            return True
+
+        def filePath(self, baseFilePath, extension):
+            return os.path.join(baseFilePath, f"croquis_{self.index + 1:04d}.{extension}")
+
+    return BatchLayoutIterator()
+
+
+def generate_pdf_batch(manager, payload):
+    """Générer un lot de croquis avec une seule mise en page réutilisée
+    
+    La mise en page est construite une fois ; pour chaque entrée seuls
+    l'emprise de la carte, l'échelle et les textes sont modifiés. La sortie
+    est un PDF multipage ou une archive ZIP d'un PDF par entrée.
+    """
+    classes = manager.get_classes()
+    project = build_project(manager, payload)
+    layout_config = payload.get('layout_config') or {}
+    if payload.get('template'):
+        layout = template_layout(manager, project, payload)
+        defaults = {'scale': layout_config.get('scale')}
+    else:
+        layout = build_print_layout(manager, project, {'title': ' ', **layout_config})
+        defaults = {'scale': layout_config.get('scale'), 'title': layout_config.get('title', '')}
+
+    def apply_entry(entry):
+        params = {**defaults, **(entry.get('layout_config') or {})}
+        if entry.get('title'):
+            params['title'] = entry['title']
+        patch_layout(classes, project, layout, params, extent=_entry_extent(classes, project, entry))
+
+    entries = payload['entries']
+    exporter_class = classes['QgsLayoutExporter']
+    export_settings = exporter_class.PdfExportSettings()
+    iterator = _batch_iterator(layout, entries, apply_entry)
+    output_path = payload['output_path']
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    if payload.get('output') == 'zip':
+        work_dir = tempfile.mkdtemp(prefix='croquis_batch_')
+        try:
+            result, error = exporter_class.exportToPdfs(iterator, work_dir, export_settings)
+            if result != exporter_class.Success:
+                raise RuntimeError(f"Échec de l'export PDF du lot ({result}): {error}")
+            # Les PDF sont déjà compressés : pas de recompression dans l'archive
+            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED) as archive:
+                for name in sorted(os.listdir(work_dir)):
+                    archive.write(os.path.join(work_dir, name), name)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        result, error = exporter_class.exportToPdf(iterator, output_path, export_settings)
+        if result != exporter_class.Success:
+            raise RuntimeError(f"Échec de l'export PDF du lot ({result}): {error}")
+
+    report_progress({'done': len(entries), 'total': len(entries), 'percent': 100.0, 'current': None})
+    return {'path': output_path, 'size': os.path.getsize(output_path), 'items': len(entries)}
+
+
+def _jsonable(value):
+    """Rendre un résultat de traitement sérialisable en JSON"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, 'source'):
+        return value.source()
+    return str(value)
+
+
+def _reporting_feedback(classes):
+    """QgsProcessingFeedback relayant l'avancement et le journal à `report_progress`"""
+
+    class ReportingFeedback(classes['QgsProcessingFeedback']):
+        def __init__(self):
+            super().__init__()
+            self._last_percent = -1.0
+            self.progressChanged.connect(self._report_percent)
+
+        def _report_percent(self, percent):
+            # Au plus un message par point de pourcentage
+            if percent >= 100 or percent - self._last_percent >= 1:
+                self._last_percent = percent
+                report_progress({'percent': round(percent, 1)})
+
+        def _report_log(self, level, text):
+            if text:
+                report_progress({'log': text, 'level': level})
+
+        def setProgressText(self, text):
+            super().setProgressText(text)
+            self._report_log('progress', text)
+
+        def pushInfo(self, info):
+            super().pushInfo(info)
+            self._report_log('info', info)
+
+        def pushCommandInfo(self, info):
+            super().pushCommandInfo(info)
+            self._report_log('command', info)
+
+        def pushConsoleInfo(self, info):
+            super().pushConsoleInfo(info)
+            self._report_log('console', info)
+
+        def pushWarning(self, warning):
+            super().pushWarning(warning)
+            self._report_log('warning', warning)
+
+        def reportError(self, error, fatalError=False):
+            super().reportError(error, fatalError)
+            self._report_log('error', error)
+
+    return ReportingFeedback()
+
+
+def run_processing(manager, payload):
+    """Exécuter un algorithme processing QGIS"""
+    classes = manager.get_classes()
+    project = build_project(manager, payload)
+    parameters = {k: v for k, v in payload.get('parameters', {}).items() if k != 'session_id'}
+
+    context = classes['QgsProcessingContext']()
+    context.setProject(project)
+    feedback = _reporting_feedback(classes)
+    job_key = payload.get('job_key')
+    if job_key:
+        with feedbacks_lock:
+            active_feedbacks[job_key] = feedback
+    try:
+        result = classes['processing'].run(payload['algorithm'], parameters, context=context, feedback=feedback)
+    finally:
+        if job_key:
+            with feedbacks_lock:
+                active_feedbacks.pop(job_key, None)
+    return _jsonable(result)
+
+
+def cancel_feedback(job_key):
+    """Demander l'annulation d'un traitement en cours dans ce processus"""
+    with feedbacks_lock:
+        feedback = active_feedbacks.get(job_key)
+        if feedback is None:
+            return False
+        cancelled_jobs.add(job_key)
+    feedback.cancel()
+    return True
+
+
+def was_cancelled(job_key):
+    """Indiquer (une seule fois) si un traitement a été annulé"""
+    with feedbacks_lock:
+        if job_key in cancelled_jobs:
+            cancelled_jobs.discard(job_key)
+            return True
+    return False
+
+
+TASKS = {
+    'render_map': render_map,
+    'render_metatile': render_metatile,
+    'encode_vector_tile': encode_vector_tile,
+    'generate_pdf': generate_pdf,
+    'generate_pdf_batch': generate_pdf_batch,
+    'compile_layout_template': compile_layout_template,
+    'run_processing': run_processing,
+    'spatial_index': spatial_index,
+    'inspect_layers': inspect_layers,
+    'layer_features': layer_features,
+}
+
+
+def report_progress(data):
+    """Transmettre l'avancement de la tâche en cours à son appelant"""
+    callback = getattr(_progress, 'callback', None)
+    if callback is not None:
+        callback(data)
+
+
+def run_task(manager, task_name, payload, progress=None):
+    """Exécuter une tâche enregistrée avec le gestionnaire QGIS fourni
+    
+    Les tâches d'une même session sont sérialisées sur le verrou de la session,
+    car un QgsProject ne peut pas être utilisé par deux threads à la fois.
+    `progress` reçoit les appels à `report_progress` faits par la tâche.
+    `evict_sessions` liste les sessions expirées à retirer du cache de projets.
+    """
+    if task_name not in TASKS:
+        raise KeyError(f"Tâche inconnue: {task_name}")
+    for session_id in payload.get('evict_sessions', ()):
+        project_sessions.evict(session_id, write_back=False)
+    _progress.callback = progress
+    try:
+        session_id = payload.get('session_id')
+        if not session_id:
+            return TASKS[task_name](manager, payload)
+        with project_sessions.lock(session_id):
+            return TASKS[task_name](manager, payload)
+    finally:
+        _progress.callback = None
+        # Réécritures des projets évincés, hors du verrou de la session
+        project_sessions.flush_write_backs()
@@ -0,0 +1,165 @@
+"""
+Nombre de requêtes SQL par point d'accès, et nettoyage des sessions.
+
+Ces tests figent la forme des requêtes des lectures par session : le nombre
+de requêtes ne doit dépendre ni du nombre de sessions, ni du nombre de
+couches, de jobs ou de fichiers. Une régression (requête par ligne, COUNT
+redondant, relation non préchargée) les fait échouer.
+
+    python manage.py test flashcroquisapi
+"""
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import reaper
+from .models import ProjectSession, Layer, ProcessingJob, GeneratedFile, MaintenanceLease
+
+
+class QueryCountTestCase(TestCase):
+    """Sessions remplies de couches, jobs et fichiers, et un client HTTP"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = ProjectSession.objects.create(project_title="Levé")
+        for index in range(10):
+            Layer.objects.create(
+                session=cls.session, layer_id=f"layer_{index}", name=f"Couche {index}",
+                source=f"/data/layer_{index}.shp", layer_type='vector'
+            )
+        cls.jobs = [
+            ProcessingJob.objects.create(session=cls.session, algorithm='native:buffer')
+            for _ in range(5)
+        ]
+        cls.files = [
+            GeneratedFile.objects.create(
+                session=cls.session, name=f"carte_{index}.png", file_type='image',
+                file_path=f"generated/carte_{index}.png", size=4, content_hash=f"{index:064x}"
+            )
+            for index in range(5)
+        ]
+        for _ in range(5):
+            ProjectSession.objects.create()
+
+    def assertGetQueries(self, url, count, **headers):
+        """GET `url` en exactement `count` requêtes ; renvoie la réponse"""
+        with self.assertNumQueries(count):
+            response = self.client.get(url, **headers)
+        self.assertLess(response.status_code, 400, getattr(response, 'content', b'')[:500])
+        return response
+
+
+class SessionQueryCountTests(QueryCountTestCase):
+
+    def test_list(self):
+        # Agrégat pour l'ETag, puis les sessions
+        response = self.assertGetQueries(reverse('project-list'), 2)
+        self.assertEqual(len(response.json()), ProjectSession.objects.count())
+
+    def test_list_not_modified(self):
+        url = reverse('project-list')
+        etag = self.client.get(url)['ETag']
+        response = self.assertGetQueries(url, 1, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail(self):
+        self.assertGetQueries(reverse('project-detail', args=[self.session.session_id]), 1)
+
+    def test_detail_not_modified(self):
+        url = reverse('project-detail', args=[self.session.session_id])
+        etag = self.client.get(url)['ETag']
+        response = self.assertGetQueries(url, 1, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class LayerQueryCountTests(QueryCountTestCase):
+
+    def url(self):
+        return f"{reverse('layer-list')}?session_id={self.session.session_id}"
+
+    def test_list(self):
+        # Session, puis ses couches ; le nombre de couches vient de la liste évaluée
+        response = self.assertGetQueries(self.url(), 2)
+        self.assertEqual(len(response.json()['data']), 10)
+
+    def test_list_does_not_grow_with_layers(self):
+        Layer.objects.create(session=self.session, layer_id='extra', name='Extra', layer_type='raster')
+        self.assertGetQueries(self.url(), 2)
+
+    def test_list_not_modified(self):
+        etag = self.client.get(self.url())['ETag']
+        response = self.assertGetQueries(self.url(), 1, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class ProcessingJobQueryCountTests(QueryCountTestCase):
+
+    def test_detail(self):
+        response = self.assertGetQueries(reverse('processing-detail', args=[self.jobs[0].job_id]), 1)
+        self.assertEqual(response.json()['data']['status'], 'pending')
+
+
+class GeneratedFileQueryCountTests(QueryCountTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def test_detail(self):
+        self.assertGetQueries(reverse('file-detail', args=[self.files[0].file_id]), 1)
+
+    def test_detail_not_modified(self):
+        url = reverse('file-detail', args=[self.files[0].file_id])
+        etag = self.client.get(url)['ETag']
+        response = self.assertGetQueries(url, 1, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_download(self):
+        generated_file = self.files[0]
+        path = generated_file.file_path.path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG')
+        url = reverse('file-download', args=[generated_file.file_id])
+        reaper._touched.clear()
+        # Fichier, puis last_accessed de la session au premier accès de l'intervalle
+        response = self.assertGetQueries(url, 2)
+        self.assertEqual(b''.join(response.streaming_content), b'\x89PNG')
+        self.assertGetQueries(url, 1)
+
+
+class ReaperTests(TestCase):
+
+    def test_read_keeps_session_alive(self):
+        """Une session seulement lue n'est pas expirée"""
+        session = ProjectSession.objects.create()
+        old = timezone.now() - timedelta(days=30)
+        ProjectSession.objects.filter(pk=session.pk).update(last_accessed=old, modified_at=old)
+        self.assertTrue(reaper.expired_sessions(3600).filter(pk=session.pk).exists())
+
+        reaper._touched.clear()
+        reaper.touch_session(session.session_id)
+        self.assertFalse(reaper.expired_sessions(3600).filter(pk=session.pk).exists())
+        with self.assertNumQueries(0):
+            reaper.touch_session(session.session_id)
+
+    def test_one_reaper_per_period(self):
+        """Un seul processus réserve le nettoyage d'une période"""
+        self.assertTrue(reaper.claim_run(3600))
+        self.assertFalse(reaper.claim_run(3600))
+        MaintenanceLease.objects.filter(name=reaper.REAPER_LEASE).update(expires_at=timezone.now())
+        self.assertTrue(reaper.claim_run(3600))
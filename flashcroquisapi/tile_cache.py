@@ -0,0 +1,150 @@
+"""
+Cache disque de tuiles XYZ (EPSG:3857) par session.
+
+Les tuiles raster sont rangées sous MEDIA_ROOT/tiles/{session_id}/{clé}/{z}/{x}/{y}.png
+où la clé dérive du jeu de couches et de `ProjectSession.layers_revision`.
+Une tuile manquante déclenche le rendu de tout son métatuile (N x N tuiles
+en un seul QgsMapRendererParallelJob), découpé ensuite en tuiles.
+
+Les tuiles vectorielles (MVT) d'une couche sont rangées sous
+MEDIA_ROOT/mvt/{session_id}/{Layer.pk}/{z}/{x}/{y}.mvt et supprimées dès que
+la ligne `Layer` change.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+
+from django.conf import settings
+
+from .utils import session_payload
+from .worker_pool import run_qgis_task
+
+logger = logging.getLogger(__name__)
+
+ORIGIN_SHIFT = 20037508.342789244
+
+DEFAULT_TILE_CONFIG = {
+    'TILE_SIZE': 256,
+    'METATILE_SIZE': 4,
+    'BUFFER': 64,
+    'MAX_ZOOM': 22,
+    'MVT_RESOLUTION': 4096,
+    'MVT_BUFFER': 256,
+}
+
+# Verrous répartis par métatuile : deux requêtes sur le même métatuile
+# n'en déclenchent qu'un seul rendu
+_metatile_locks = [threading.Lock() for _ in range(64)]
+
+
+def get_tile_config():
+    """Configuration du cache de tuiles fusionnée avec les valeurs par défaut"""
+    config = dict(DEFAULT_TILE_CONFIG)
+    config.update(getattr(settings, 'TILE_CACHE', {}))
+    return config
+
+
+def tiles_root():
+    return os.path.join(settings.MEDIA_ROOT, 'tiles')
+
+
+def session_tiles_dir(session_id):
+    return os.path.join(tiles_root(), str(session_id))
+
+
+def tile_bounds(z, x, y):
+    """Emprise EPSG:3857 d'une tuile XYZ (xmin, ymin, xmax, ymax)"""
+    size = 2 * ORIGIN_SHIFT / (2 ** z)
+    xmin = -ORIGIN_SHIFT + x * size
+    ymax = ORIGIN_SHIFT - y * size
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= get_tile_config()['MAX_ZOOM'] and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def cache_key(session):
+    """Clé couvrant la session, le jeu de couches et leur révision de style"""
+    layers = sorted(session.layers.values_list('layer_id', 'source'))
+    digest = hashlib.sha1(repr((session.layers_revision, layers)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def metatile_origin(z, x, y, metatile_size):
+    """Premier tuile et dimensions du métatuile contenant (x, y)"""
+    span = min(metatile_size, 2 ** z)
+    return (x // span) * span, (y // span) * span, span
+
+
+def get_tile(session, z, x, y, key=None):
+    """Chemin de la tuile demandée, rendue si absente du cache"""
+    config = get_tile_config()
+    key = key or cache_key(session)
+    tile_dir = os.path.join(session_tiles_dir(session.session_id), key)
+    path = os.path.join(tile_dir, str(z), str(x), f"{y}.png")
+    if os.path.exists(path):
+        return path
+
+    x0, y0, span = metatile_origin(z, x, y, config['METATILE_SIZE'])
+    lock = _metatile_locks[hash((key, z, x0, y0)) % len(_metatile_locks)]
+    with lock:
+        if os.path.exists(path):
+            return path
+        result = run_qgis_task('render_metatile', {
+            **session_payload(session),
+            'z': z,
+            'x0': x0,
+            'y0': y0,
+            'span': span,
+            'bounds': [
+                *tile_bounds(z, x0, y0 + span - 1)[:2],
+                *tile_bounds(z, x0 + span - 1, y0)[2:],
+            ],
+            'tile_size': config['TILE_SIZE'],
+            'buffer': config['BUFFER'],
+            'tile_dir': tile_dir,
+        })
+        logger.debug(f"Métatuile {z}/{x0}/{y0} rendu ({result['tiles']} tuiles)")
+    return path
+
+
+def invalidate_session_tiles(session_id):
+    """Supprimer toutes les tuiles en cache d'une session"""
+    shutil.rmtree(session_tiles_dir(session_id), ignore_errors=True)
+
+
+def layer_vector_tiles_dir(layer):
+    return os.path.join(settings.MEDIA_ROOT, 'mvt', str(layer.session_id), str(layer.pk))
+
+
+def get_vector_tile(layer, z, x, y):
+    """Chemin de la tuile MVT d'une couche, encodée si absente du cache"""
+    config = get_tile_config()
+    path = os.path.join(layer_vector_tiles_dir(layer), str(z), str(x), f"{y}.mvt")
+    if os.path.exists(path):
+        return path
+
+    run_qgis_task('encode_vector_tile', {
+        'source': layer.source,
+        'name': layer.name,
+        'layer_name': layer.layer_id,
+        'z': z,
+        'x': x,
+        'y': y,
+        'resolution': config['MVT_RESOLUTION'],
+        'buffer': config['MVT_BUFFER'],
+        'output_path': path,
+    })
+    return path
+
+
+def invalidate_layer_vector_tiles(session_id, layer_pk):
+    """Supprimer les tuiles MVT en cache d'une couche"""
+    shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'mvt', str(session_id), str(layer_pk)), ignore_errors=True)
+
+
+def invalidate_session_vector_tiles(session_id):
+    shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'mvt', str(session_id)), ignore_errors=True)
@@ -4,9 +4,10 @@ from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     ProjectSessionViewSet, LayerViewSet, ProcessingViewSet, 
-    MapViewSet, QRViewSet, HealthCheckViewSet
+    MapViewSet, LayoutTemplateViewSet, GeneratedFileViewSet, QRViewSet, HealthCheckViewSet
 )
 
 router = DefaultRouter()
@@ -14,14 +15,38 @@ router.register(r'projects', ProjectSessionViewSet, basename='project')
 router.register(r'layers', LayerViewSet, basename='layer')
 router.register(r'processing', ProcessingViewSet, basename='processing')
 router.register(r'map', MapViewSet, basename='map')
+router.register(r'layout-templates', LayoutTemplateViewSet, basename='layout-template')
+router.register(r'files', GeneratedFileViewSet, basename='file')
 router.register(r'qr', QRViewSet, basename='qr')
 router.register(r'health', HealthCheckViewSet, basename='health')
 
+# Variantes asynchrones des points d'accès légers (servies au mieux par asgi.py)
+async_urlpatterns = [
+    path('health/ping/', async_views.health_ping, name='async-health-ping'),
+    path('health/health/', async_views.health, name='async-health'),
+    path('projects/', async_views.session_list, name='async-project-list'),
+    path('projects/<uuid:session_id>/', async_views.session_detail, name='async-project-detail'),
+    path('layers/', async_views.layer_list, name='async-layer-list'),
+    path('processing/<uuid:job_id>/', async_views.job_status, name='async-processing-detail'),
+    path('map/render/', async_views.map_render, name='async-map-render'),
+]
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path(
+        'api/map/tiles/<uuid:session_id>/<int:z>/<int:x>/<int:y>.png',
+        MapViewSet.as_view({'get': 'tiles'}),
+        name='map-tiles'
+    ),
+    path(
+        'api/layers/<str:layer_id>/tiles/<int:z>/<int:x>/<int:y>.mvt',
+        LayerViewSet.as_view({'get': 'vector_tiles'}),
+        name='layer-vector-tiles'
+    ),
+    path('api/async/', include(async_urlpatterns)),
     path('api/', include(router.urls)),
 ]
 if settings.DEBUG:
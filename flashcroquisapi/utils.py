@@ -1,24 +1,45 @@
+import hashlib
+import logging
+import os
+import uuid
 from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from rest_framework.response import Response
+from PyQt5.QtCore import QByteArray, QDate, QDateTime, QTime, QVariant, Qt
+from . import layer_metadata
 
-def standard_response(success, data=None, message=None, error=None, status_code=200, metadata=None):
-    """Format de réponse standardisé avec métadonnées enrichies"""
-    response_data = {
+logger = logging.getLogger(__name__)
+
+def response_body(success, data=None, message=None, error=None, metadata=None):
+    """Enveloppe des réponses de l'API, hors DRF comme dans `standard_response`"""
+    return {
         'success': success,
-        'timestamp': datetime.now().isoformat(),
+        # Sérialisé directement par le rendu JSON
+        'timestamp': datetime.now(),
         'data': data,
         'message': message,
         'error': error,
         'metadata': metadata or {}
     }
-    return Response(response_data, status=status_code)
 
-def handle_exception(e, context, message):
-    """Gestion centralisée des exceptions"""
+def standard_response(success, data=None, message=None, error=None, status_code=200, metadata=None):
+    """Format de réponse standardisé avec métadonnées enrichies"""
+    return Response(response_body(success, data, message, error, metadata), status=status_code)
+
+def handle_exception(e, context, message, respond=standard_response):
+    """Gestion centralisée des exceptions
+    
+    `respond` construit la réponse : `standard_response` pour DRF, une
+    fonction de même signature pour les vues asynchrones.
+    """
     import logging
     logger = logging.getLogger(__name__)
     logger.error(f"Erreur dans {context}: {e}")
-    return standard_response(
+    return respond(
         success=False,
         error={
             "type": type(e).__name__,
@@ -29,8 +50,42 @@ def handle_exception(e, context, message):
         status_code=500
     )
 
-def format_layer_info(layer):
-    """Formater les informations d'une couche de manière détaillée"""
+def to_json_value(value):
+    """Convertir une valeur d'attribut QGIS/Qt en valeur JSON native"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, QVariant):
+        return None if value.isNull() else to_json_value(value.value())
+    if isinstance(value, (QDate, QDateTime, QTime)):
+        return value.toString(Qt.ISODate) if value.isValid() else None
+    if isinstance(value, (bytes, QByteArray)):
+        return bytes(value).hex()
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): to_json_value(item) for key, item in value.items()}
+    return str(value)
+
+def format_layer_info(layer, source=None):
+    """Formater les informations d'une couche de manière détaillée
+    
+    Les métadonnées coûteuses (étendue, nombre d'entités, bandes) viennent du
+    cache `layer_metadata` tant que le fichier source n'a pas changé. `source`
+    est la clé de cache, par défaut la source de la couche QGIS.
+    """
+    source = source or (layer.source() if hasattr(layer, 'source') else None)
+    signature = layer_metadata.source_signature(source)
+    cached = layer_metadata.lookup(source, signature) if signature else None
+    if cached is not None:
+        return {'id': layer.id(), 'name': layer.name(), **cached}
+    
+    base_info = _live_layer_info(layer)
+    if signature:
+        layer_metadata.store(source, base_info, signature)
+    return base_info
+
+def _live_layer_info(layer):
+    """Informations d'une couche lues auprès de son fournisseur"""
     base_info = {
         'id': layer.id(),
         'name': layer.name(),
@@ -98,7 +153,7 @@ def format_layer_info(layer):
     return base_info
 
 def format_project_info(project):
-    """Formater les informations d'un projet de manière détaillée"""
+    """Formater les informations d'un projet de manière détaillée (métadonnées en cache)"""
     layers_info = []
     for layer_id, layer in project.mapLayers().items():
         layers_info.append(format_layer_info(layer))
@@ -111,4 +166,92 @@ def format_project_info(project):
         'layers_count': len(layers_info),
         'created_at': project.createdAt() if hasattr(project, 'createdAt') else None,
         'last_modified': project.lastModified() if hasattr(project, 'lastModified') else None
-    }
\ No newline at end of file
+    }
+
+def session_payload(session):
+    """Décrire une session et ses couches sous une forme transmissible aux workers QGIS"""
+    return {
+        'session_id': str(session.session_id),
+        'project_title': session.project_title,
+        'project_crs': session.project_crs,
+        'project_file': session.project_file.path if session.project_file else None,
+        'layers_revision': session.layers_revision,
+        'writeback_path': os.path.join(settings.MEDIA_ROOT, 'projects', f"{session.session_id}.qgz"),
+        'layers': list(
+            session.layers.order_by('pk')
+            .values('layer_id', 'name', 'source', 'layer_type', 'spatial_index', 'metadata')
+        ),
+    }
+
+def vector_provider(source):
+    """Fournisseur QGIS et URI d'une source vectorielle
+    
+    `memory:Point?crs=EPSG:4326` désigne une couche mémoire, une URI
+    `file:///...csv?xField=...` une liste de points en texte délimité.
+    """
+    if source.startswith('memory:'):
+        return 'memory', source[len('memory:'):]
+    if source.startswith('file:') and '?' in source:
+        return 'delimitedtext', source
+    return 'ogr', source
+
+def file_sha256(path):
+    """Empreinte SHA-256 du contenu d'un fichier"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_etag(*parts):
+    """ETag fort dérivé de valeurs de révision"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+def conditional_response(request, etag=None, last_modified=None):
+    """Réponse 304/412 si les préconditions de la requête la permettent, sinon None"""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=quote_etag(etag) if etag else None, last_modified=timestamp)
+
+def set_validators(response, etag=None, last_modified=None):
+    """Poser ETag et Last-Modified ; le client revalide à chaque requête"""
+    if etag:
+        response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def generated_file_path(extension):
+    """Réserver un chemin de fichier généré sous MEDIA_ROOT (relatif, absolu)"""
+    relative_path = os.path.join('generated_files', f"{uuid.uuid4()}.{extension}")
+    return relative_path, os.path.join(settings.MEDIA_ROOT, relative_path)
+
+def is_asgi(request):
+    """Vrai si la requête (Django ou DRF) est servie par le gestionnaire ASGI"""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+def streaming_content(request, iterator):
+    """Contenu de StreamingHttpResponse adapté au serveur
+    
+    Sous ASGI, Django consomme un itérateur synchrone en entier avant
+    d'envoyer quoi que ce soit ; l'itérateur est alors lu élément par élément
+    dans un thread, chaque élément étant envoyé dès qu'il est produit.
+    """
+    if not is_asgi(request):
+        return iterator
+    return _iterate_in_thread(iterator)
+
+async def _iterate_in_thread(iterator):
+    iterator = iter(iterator)
+    done = object()
+    read = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            item = await read(iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=False)()
@@ -1,23 +1,217 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from rest_framework import viewsets, status, mixins, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from rest_framework.settings import api_settings
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import ProjectSession, Layer, ProcessingJob, GeneratedFile
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from .models import ProjectSession, Layer, ProcessingJob, GeneratedFile, LayoutTemplate
 from .serializers import (
     ProjectSessionSerializer, LayerSerializer, ProcessingJobSerializer, 
     GeneratedFileSerializer, LayerFeatureSerializer, VectorLayerAddSerializer,
-    RasterLayerAddSerializer, MapRenderSerializer, PDFGenerateSerializer, QRScanSerializer
+    RasterLayerAddSerializer, MapRenderSerializer, PDFGenerateSerializer, QRScanSerializer,
+    SpatialIndexSerializer, PDFBatchGenerateSerializer, LayoutTemplateSerializer, LayerBulkAddSerializer
 )
-from .qgis_manager import get_qgis_manager, initialize_qgis_if_needed
-from .utils import standard_response, handle_exception, format_layer_info, format_project_info
+from .qgis_manager import get_qgis_manager, qgis_ready, warm_up
+from .utils import (
+    standard_response, handle_exception, format_layer_info, format_project_info,
+    session_payload, generated_file_path, file_sha256, make_etag, conditional_response, set_validators,
+    is_asgi, streaming_content
+)
+from .signals import bump_session_revision, bump_layers_revision
+from .worker_pool import run_qgis_task, get_worker_pool, WorkerPoolSaturated, WorkerPoolError, WorkerJobError
+from .scheduler import get_job_scheduler, PDF_BATCH_ALGORITHM
+from . import tile_cache, render_cache, metrics, reaper, layer_metadata
+from .downloads import file_response
+from .features import STREAM_FORMATS, STREAM_PAGE_SIZE, decode_cursor, iter_pages, iter_geojson, iter_ndjson
+from .renderers import GeoJSONStreamRenderer, NDJSONRenderer, PrometheusTextRenderer, EventStreamRenderer
+from .events import open_job_stream
 import logging
 from datetime import datetime
 from . import settings
 
 logger = logging.getLogger(__name__)
 
+def pool_saturated_response(e, respond=standard_response):
+    """Réponse 503 lorsque le pool QGIS ne peut pas accepter de travail"""
+    response = respond(
+        success=False,
+        error=str(e),
+        message="Serveur de rendu saturé, réessayez plus tard",
+        status_code=503
+    )
+    response['Retry-After'] = '5'
+    return response
+
+def qgis_unavailable_response(e):
+    """Réponse 503 lorsque QGIS ne peut pas être initialisé"""
+    logger.error(f"QGIS indisponible: {e}")
+    response = standard_response(
+        success=False,
+        error=str(e),
+        message="QGIS n'est pas disponible, réessayez plus tard",
+        status_code=503
+    )
+    response['Retry-After'] = '30'
+    return response
+
+def task_value_error(e):
+    """Message d'une ValueError levée par une tâche QGIS, en ligne ou dans un worker ; sinon None"""
+    if isinstance(e, ValueError):
+        return str(e)
+    if isinstance(e, WorkerJobError) and e.error_type == 'ValueError':
+        return e.message
+    return None
+
+def default_layer_name(source):
+    """Nom de couche déduit du fichier source"""
+    path = source.split('|')[0].split('?')[0]
+    return os.path.splitext(os.path.basename(path.rstrip('/')))[0] or source
+
+def inspect_layer_sources(entries):
+    """Ouvrir et valider des sources de couches en parallèle sur les workers QGIS
+    
+    Les entrées sont réparties en autant de lots que de workers du pool (un
+    seul lot en mode en ligne) ; les résultats sont renvoyés dans l'ordre.
+    """
+    pool = get_worker_pool()
+    chunks = min(len(entries), pool.size if pool else 1)
+    if chunks <= 1:
+        return run_qgis_task('inspect_layers', {'layers': entries})
+    
+    with ThreadPoolExecutor(max_workers=chunks) as executor:
+        batches = list(executor.map(
+            lambda i: run_qgis_task('inspect_layers', {'layers': entries[i::chunks]}),
+            range(chunks)
+        ))
+    results = [None] * len(entries)
+    for i, batch in enumerate(batches):
+        results[i::chunks] = batch
+    return results
+
+def layer_from_inspection(session, entry, info):
+    """Instance `Layer` (non enregistrée) remplie depuis les métadonnées de la source"""
+    return Layer(
+        session=session,
+        layer_id=info['id'],
+        name=entry['name'],
+        source=entry['source'],
+        crs=info.get('crs'),
+        layer_type=entry['layer_type'],
+        geometry_type=info.get('geometry_type', 'unknown'),
+        feature_count=max(info.get('feature_count') or 0, 0),
+        extent=info.get('extent'),
+        spatial_index=info['spatial_index'],
+        metadata=info.get('metadata'),
+    )
+
+def ping_status():
+    """Contenu du ping, partagé par les vues synchrone et asynchrone
+    
+    Avec le pool, QGIS ne s'initialise que dans les workers : l'état rapporté
+    est celui du pool, jamais celui du processus web. Ne bloque pas.
+    """
+    pool = get_worker_pool()
+    pool_stats = pool.stats() if pool is not None else None
+    return {
+        'success': True,
+        'data': {
+            "status": "ok",
+            "service": "FlashCroquis API",
+            "version": "1.0.0",
+            "qgis_initialized": qgis_ready(),
+            "qgis_mode": "pool" if pool is not None else "inline",
+            "worker_pool": {
+                key: pool_stats[key] for key in ('size', 'alive', 'ready')
+            } if pool_stats else None,
+        },
+        'message': "Service en ligne et opérationnel",
+    }
+
+def health_status():
+    """Contenu de la sonde de santé, partagé par les vues synchrone et asynchrone
+    
+    Bloquant : lance l'initialisation de QGIS (démarrage des workers) tant que
+    ce processus n'est pas prêt.
+    """
+    pool = get_worker_pool()
+    ready = qgis_ready()
+    if not ready:
+        warm_up()
+    return {
+        'success': ready,
+        'data': {
+            "status": "healthy" if ready else "starting",
+            "timestamp": datetime.now().isoformat(),
+            "qgis_ready": ready,
+            "qgis_startup": get_qgis_manager().startup_info(),
+            "worker_pool": pool.stats() if pool else None,
+            "render_cache": render_cache.stats(),
+            "reaper": reaper.stats(),
+            "layer_metadata": layer_metadata.stats()
+        },
+        'message': "Service opérationnel" if ready else "Initialisation de QGIS en cours",
+        'error': None if ready else "QGIS is not ready",
+        'status_code': 200 if ready else 503,
+    }
+
+def prepare_map_render(session, serializer):
+    """Rendu de carte déjà en cache, sinon la tâche `render_map` à exécuter
+    
+    Partagé par `MapViewSet.render` et sa variante asynchrone. Renvoie
+    `cached` (GeneratedFile en cache ou None), `cache_key`, `profile` et, pour
+    un rendu à exécuter, `relative_path` et `payload`.
+    """
+    data = serializer.validated_data
+    reaper.touch_session(session.session_id)
+    
+    # Un rendu profilé est toujours exécuté : il ne passe pas par le cache
+    cache_key = None if data['profile'] else render_cache.make_key('render', session, serializer.data)
+    render = {'cached': render_cache.lookup(session, cache_key), 'cache_key': cache_key, 'profile': data['profile']}
+    if render['cached'] is None:
+        render['relative_path'], output_path = generated_file_path(data['format_image'])
+        render['payload'] = {
+            **session_payload(session),
+            'params': serializer.data,
+            'output_path': output_path,
+            'profile': data['profile'] or metrics.should_profile_render(),
+        }
+    return render
+
+def map_render_result(request, session, render, result=None):
+    """Contenu de la réponse d'un rendu : fichier en cache, ou fichier produit par `render_map`"""
+    if result is None:
+        generated_file, metadata = render['cached'], {'cache': 'hit'}
+    else:
+        if 'profile' in result:
+            metrics.record_render_profile(result['profile'])
+        
+        # Sauvegarder l'image générée
+        params = render['payload']['params']
+        generated_file = GeneratedFile.objects.create(
+            session=session,
+            name=f"map_render_{session.session_id}",
+            file_type='image',
+            file_path=render['relative_path'],
+            size=result['size'],
+            metadata={**params, 'extent': result['extent']},
+            cache_key=render['cache_key']
+        )
+        metadata = {'cache': 'miss' if render['cache_key'] else 'disabled'}
+        if render['profile']:
+            metadata.update(cache='bypass', profile=result['profile'])
+    
+    return {
+        'success': True,
+        'data': GeneratedFileSerializer(generated_file, context={'request': request}).data,
+        'message': "Carte générée avec succès",
+        'metadata': metadata,
+    }
+
 # class ProjectSessionViewSet(viewsets.GenericViewSet,
 #                            mixins.CreateModelMixin,
 #                            mixins.RetrieveModelMixin):
@@ -131,6 +325,31 @@ class ProjectSessionViewSet(viewsets.ModelViewSet):
     queryset = ProjectSession.objects.all()
     serializer_class = ProjectSessionSerializer
     
+    def list(self, request, *args, **kwargs):
+        """Liste des sessions, 304 si aucune session n'a changé"""
+        summary = ProjectSession.objects.aggregate(
+            count=Count('session_id'),
+            revisions=Sum('revision'),
+            last_accessed=Max('last_accessed'),
+            modified_at=Max('modified_at'),
+        )
+        etag = make_etag('sessions', summary['count'], summary['revisions'], summary['last_accessed'])
+        last_modified = max(filter(None, (summary['last_accessed'], summary['modified_at'])), default=None)
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(super().list(request, *args, **kwargs), etag, last_modified)
+    
+    def retrieve(self, request, *args, **kwargs):
+        """Détail d'une session, 304 si sa révision n'a pas changé"""
+        session = self.get_object()
+        etag = make_etag('session', session.session_id, session.revision, session.last_accessed)
+        last_modified = max(session.last_accessed, session.modified_at)
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(Response(self.get_serializer(session).data), etag, last_modified)
+    
 class LayerViewSet(viewsets.GenericViewSet,
                   mixins.ListModelMixin):
     queryset = Layer.objects.all()
@@ -150,13 +369,18 @@ class LayerViewSet(viewsets.GenericViewSet,
                 )
             
             session = get_object_or_404(ProjectSession, session_id=session_id)
-            layers = Layer.objects.filter(session=session)
+            etag = make_etag('layers', session.session_id, session.revision)
+            not_modified = conditional_response(request, etag, session.modified_at)
+            if not_modified is not None:
+                return not_modified
             
-            return standard_response(
+            layers = list(Layer.objects.filter(session=session).order_by('pk'))
+            
+            return set_validators(standard_response(
                 success=True,
                 data=LayerSerializer(layers, many=True).data,
-                message=f"{layers.count()} couches récupérées"
-            )
+                message=f"{len(layers)} couches récupérées"
+            ), etag, session.modified_at)
             
         except Exception as e:
             return handle_exception(e, "get_layers", "Impossible de récupérer la liste des couches")
@@ -171,16 +395,23 @@ class LayerViewSet(viewsets.GenericViewSet,
             data = serializer.validated_data
             session = get_object_or_404(ProjectSession, session_id=data['session_id'])
             
-            # Logique d'ajout de couche vectorielle (similaire à l'original)
-            # ... (le code original d'add_vector_layer adapté)
+            entry = {
+                'source': data['data_source'],
+                'name': data['layer_name'],
+                'layer_type': 'vector',
+                'build_spatial_index': data['build_spatial_index'],
+            }
+            info = inspect_layer_sources([entry])[0]
+            if not info['valid']:
+                return standard_response(
+                    success=False,
+                    error=info['error'],
+                    message="Source de couche vectorielle invalide",
+                    status_code=400
+                )
             
-            # Après ajout réussi, créer l'enregistrement Layer
-            layer = Layer.objects.create(
-                session=session,
-                layer_id="generated_id",  # À remplacer par l'ID réel
-                name=data['layer_name'],
-                # ... autres champs
-            )
+            layer = layer_from_inspection(session, entry, info)
+            layer.save()
             
             return standard_response(
                 success=True,
@@ -188,6 +419,8 @@ class LayerViewSet(viewsets.GenericViewSet,
                 message=f"Couche vectorielle '{data['layer_name']}' ajoutée avec succès"
             )
             
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
         except Exception as e:
             return handle_exception(e, "add_vector_layer", "Impossible d'ajouter la couche vectorielle")
     
@@ -201,16 +434,18 @@ class LayerViewSet(viewsets.GenericViewSet,
             data = serializer.validated_data
             session = get_object_or_404(ProjectSession, session_id=data['session_id'])
             
-            # Logique d'ajout de couche raster (similaire à l'original)
-            # ... (le code original d'add_raster_layer adapté)
+            entry = {'source': data['data_source'], 'name': data['layer_name'], 'layer_type': 'raster'}
+            info = inspect_layer_sources([entry])[0]
+            if not info['valid']:
+                return standard_response(
+                    success=False,
+                    error=info['error'],
+                    message="Source de couche raster invalide",
+                    status_code=400
+                )
             
-            # Après ajout réussi, créer l'enregistrement Layer
-            layer = Layer.objects.create(
-                session=session,
-                layer_id="generated_id",  # À remplacer par l'ID réel
-                name=data['layer_name'],
-                # ... autres champs
-            )
+            layer = layer_from_inspection(session, entry, info)
+            layer.save()
             
             return standard_response(
                 success=True,
@@ -218,34 +453,265 @@ class LayerViewSet(viewsets.GenericViewSet,
                 message=f"Couche raster '{data['layer_name']}' ajoutée avec succès"
             )
             
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
         except Exception as e:
             return handle_exception(e, "add_raster_layer", "Impossible d'ajouter la couche raster")
     
-    @action(detail=True, methods=['get'], serializer_class=LayerFeatureSerializer)
+    @action(detail=False, methods=['post'], serializer_class=LayerBulkAddSerializer)
+    def bulk_add(self, request):
+        """Ajouter d'un coup plusieurs couches, validées en parallèle
+        
+        Les sources invalides sont signalées dans `metadata.errors` sans
+        empêcher l'ajout des autres ; 400 si aucune n'est valide.
+        """
+        try:
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            
+            data = serializer.validated_data
+            session = get_object_or_404(ProjectSession, session_id=data['session_id'])
+            
+            entries = [
+                {
+                    'source': source['data_source'],
+                    'name': source.get('layer_name') or default_layer_name(source['data_source']),
+                    'layer_type': source['layer_type'],
+                    'build_spatial_index': data['build_spatial_index'],
+                }
+                for source in data['layers']
+            ]
+            results = inspect_layer_sources(entries)
+            
+            errors = [
+                {'index': index, 'source': info['source'], 'error': info['error']}
+                for index, info in enumerate(results) if not info['valid']
+            ]
+            layers = [
+                layer_from_inspection(session, entry, info)
+                for entry, info in zip(entries, results) if info['valid']
+            ]
+            if not layers:
+                return standard_response(
+                    success=False,
+                    error=errors,
+                    message="Aucune source de couche valide",
+                    status_code=400
+                )
+            
+            # bulk_create n'émet pas post_save : révision et caches de la
+            # session sont invalidés une seule fois pour tout le lot
+            with transaction.atomic():
+                layers = Layer.objects.bulk_create(layers)
+                bump_layers_revision(session.session_id)
+            
+            return standard_response(
+                success=True,
+                data=LayerSerializer(layers, many=True).data,
+                message=f"{len(layers)} couches ajoutées sur {len(entries)}",
+                metadata={'errors': errors},
+                status_code=201
+            )
+            
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
+        except Exception as e:
+            return handle_exception(e, "bulk_add_layers", "Impossible d'ajouter les couches")
+    
+    def vector_tiles(self, request, layer_id=None, z=None, x=None, y=None):
+        """Obtenir une tuile Mapbox Vector Tile d'une couche vectorielle de session"""
+        try:
+            session_id = request.GET.get('session_id')
+            if not session_id:
+                return standard_response(
+                    success=False,
+                    error="session_id is required",
+                    message="L'identifiant de session est requis",
+                    status_code=400
+                )
+            if not tile_cache.is_valid_tile(z, x, y):
+                return standard_response(
+                    success=False,
+                    error="tile out of range",
+                    message="Coordonnées de tuile invalides",
+                    status_code=404
+                )
+            
+            layer = get_object_or_404(
+                Layer.objects.select_related('session'), session_id=session_id, layer_id=layer_id
+            )
+            if layer.layer_type == 'raster' or not layer.source:
+                return standard_response(
+                    success=False,
+                    error="not a vector layer",
+                    message="Les tuiles vectorielles ne concernent que les couches vectorielles",
+                    status_code=400
+                )
+            reaper.touch_session(layer.session_id)
+            # Toute écriture de la couche incrémente layers_revision : l'ETag
+            # change dès que les tuiles en cache de la couche sont supprimées
+            etag = make_etag('mvt', layer.pk, layer.session.layers_revision, z, x, y)
+            not_modified = conditional_response(request, etag)
+            if not_modified is not None:
+                return not_modified
+            
+            path = tile_cache.get_vector_tile(layer, z, x, y)
+            
+            response = FileResponse(open(path, 'rb'), content_type='application/vnd.mapbox-vector-tile')
+            return set_validators(response, etag)
+            
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
+        except Exception as e:
+            return handle_exception(e, "vector_tile", "Impossible de générer la tuile vectorielle")
+    
+    @action(detail=True, methods=['get', 'post'], serializer_class=SpatialIndexSerializer)
+    def spatial_index(self, request, pk=None):
+        """Statut de l'index spatial d'une couche (GET), ou construction de l'index (POST)"""
+        try:
+            serializer = self.get_serializer(data={
+                'layer_id': pk,
+                'session_id': request.query_params.get('session_id') or request.data.get('session_id'),
+            })
+            serializer.is_valid(raise_exception=True)
+            
+            data = serializer.validated_data
+            layer = get_object_or_404(Layer, session_id=data['session_id'], layer_id=data['layer_id'])
+            if layer.layer_type == 'raster' or not layer.source:
+                return standard_response(
+                    success=False,
+                    error="not a vector layer",
+                    message="L'index spatial ne concerne que les couches vectorielles",
+                    status_code=400
+                )
+            
+            index_info = run_qgis_task('spatial_index', {
+                'source': layer.source,
+                'name': layer.name,
+                'status': layer.spatial_index,
+                'build': request.method == 'POST',
+            })
+            if index_info['status'] != layer.spatial_index:
+                # update() plutôt que save() : l'index ne change pas le rendu,
+                # inutile d'invalider les caches de la session
+                layer.spatial_index = index_info['status']
+                Layer.objects.filter(pk=layer.pk).update(spatial_index=layer.spatial_index)
+                bump_session_revision(layer.session_id)
+            
+            return standard_response(
+                success=True,
+                data={'layer_id': layer.layer_id, **index_info},
+                message=f"Index spatial: {layer.get_spatial_index_display().lower()}"
+            )
+            
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
+        except Exception as e:
+            return handle_exception(e, "spatial_index", "Impossible de consulter l'index spatial de la couche")
+    
+    @action(
+        detail=True, methods=['get'], serializer_class=LayerFeatureSerializer,
+        renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [GeoJSONStreamRenderer, NDJSONRenderer]
+    )
     def features(self, request, pk=None):
-        """Obtenir les caractéristiques d'une couche avec pagination"""
+        """Obtenir les caractéristiques d'une couche avec pagination ou en flux
+        
+        `?format=geojson-stream` ou `?format=ndjson` renvoie toutes les entités
+        en StreamingHttpResponse, lues page par page dans les workers QGIS.
+        Les erreurs sont toujours renvoyées en JSON.
+        """
+        response = self._features(request, pk)
+        if isinstance(response, Response) and response.status_code >= 400:
+            response.content_type = 'application/json'
+        return response
+    
+    def _features(self, request, pk):
         try:
             serializer = self.get_serializer(data={
+                'offset': 0,
+                'limit': 100,
+                **request.GET.dict(),
                 'layer_id': pk,
-                'session_id': request.GET.get('session_id'),
-                'offset': request.GET.get('offset', 0),
-                'limit': request.GET.get('limit', 100)
             })
             serializer.is_valid(raise_exception=True)
             
             data = serializer.validated_data
-            session = get_object_or_404(ProjectSession, session_id=data['session_id'])
-            layer = get_object_or_404(Layer, session=session, layer_id=data['layer_id'])
+            layer = get_object_or_404(Layer, session_id=data['session_id'], layer_id=data['layer_id'])
+            if layer.layer_type == 'raster' or not layer.source:
+                return standard_response(
+                    success=False,
+                    error="not a vector layer",
+                    message="Seules les couches vectorielles ont des entités",
+                    status_code=400
+                )
+            reaper.touch_session(layer.session_id)
+            
+            payload = {
+                'source': layer.source,
+                'name': layer.name,
+                'metadata': layer.metadata,
+                'fields': data.get('fields'),
+                'bbox': data.get('bbox'),
+                'filter': data.get('filter'),
+                'simplify': data.get('simplify'),
+                'precision': data['precision'],
+            }
+            stream = data['format'] in STREAM_FORMATS
+            offset, limit = data['offset'], data['limit']
+            try:
+                after_fid = decode_cursor(data['cursor']) if data.get('cursor') else None
+                if stream:
+                    def fetch_page(after):
+                        return run_qgis_task('layer_features', {
+                            **payload, 'after_fid': after, 'limit': STREAM_PAGE_SIZE, 'encoded': True
+                        })
+                    # Première page lue avant de répondre : une source ou un
+                    # filtre invalide donne encore une erreur 400
+                    page = fetch_page(None)
+                else:
+                    page = run_qgis_task('layer_features', {
+                        **payload, 'offset': offset, 'limit': limit, 'after_fid': after_fid, 'with_total': True
+                    })
+            except (ValueError, WorkerJobError) as e:
+                invalid = task_value_error(e)
+                if invalid is None:
+                    raise
+                return standard_response(
+                    success=False,
+                    error=invalid,
+                    message="Paramètres de couche invalides",
+                    status_code=400
+                )
             
-            # Logique de récupération des features (similaire à l'original)
-            # ... (le code original de get_layer_features adapté)
+            if stream:
+                features = iter_pages(fetch_page, page)
+                if data['format'] == 'geojson-stream':
+                    return StreamingHttpResponse(
+                        streaming_content(request, iter_geojson(features)), content_type='application/geo+json'
+                    )
+                return StreamingHttpResponse(
+                    streaming_content(request, iter_ndjson(features)), content_type='application/x-ndjson'
+                )
             
             return standard_response(
                 success=True,
-                data={},  # Remplacer par les données réelles
-                message="Features récupérés avec succès"
+                data={'type': 'FeatureCollection', 'features': page['features']},
+                message="Features récupérés avec succès",
+                metadata={
+                    'offset': offset,
+                    'limit': limit,
+                    'returned': len(page['features']),
+                    'next': page['next'],
+                    'total': page['total']
+                }
             )
             
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
+        except WorkerPoolError as e:
+            if isinstance(e, WorkerJobError):
+                return handle_exception(e, "get_layer_features", "Impossible de récupérer les features de la couche")
+            return qgis_unavailable_response(e)
         except Exception as e:
             return handle_exception(e, "get_layer_features", "Impossible de récupérer les features de la couche")
 
@@ -253,10 +719,86 @@ class ProcessingViewSet(viewsets.GenericViewSet):
     queryset = ProcessingJob.objects.all()
     serializer_class = ProcessingJobSerializer
     permission_classes = [AllowAny]
+    lookup_value_regex = '[0-9a-fA-F-]{36}'
+    
+    def retrieve(self, request, pk=None):
+        """Obtenir le statut d'un job de traitement"""
+        try:
+            job = get_object_or_404(ProcessingJob, job_id=pk)
+            
+            return standard_response(
+                success=True,
+                data=ProcessingJobSerializer(job).data,
+                message=f"Job {job.get_status_display().lower()}"
+            )
+            
+        except Exception as e:
+            return handle_exception(e, "get_processing_job", "Impossible de récupérer le job de traitement")
+    
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Annuler un job de traitement en attente ou en cours"""
+        try:
+            job = get_object_or_404(ProcessingJob, job_id=pk)
+            
+            if not get_job_scheduler().cancel(job.job_id):
+                job.refresh_from_db()
+                return standard_response(
+                    success=False,
+                    data=ProcessingJobSerializer(job).data,
+                    error=f"job is already {job.status}",
+                    message="Le job est déjà terminé",
+                    status_code=409
+                )
+            
+            job.refresh_from_db()
+            return standard_response(
+                success=True,
+                data=ProcessingJobSerializer(job).data,
+                message="Job annulé"
+            )
+            
+        except Exception as e:
+            return handle_exception(e, "cancel_processing_job", "Impossible d'annuler le job de traitement")
+    
+    @action(
+        detail=True, methods=['get'],
+        renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [EventStreamRenderer]
+    )
+    def events(self, request, pk=None):
+        """Suivre un job en Server-Sent Events : avancement, journal puis statut final
+        
+        Générateur asynchrone sous ASGI ; 503 lorsque le nombre maximal de flux
+        ouverts dans ce processus est atteint.
+        """
+        try:
+            job = get_object_or_404(ProcessingJob, job_id=pk)
+            
+            events = open_job_stream(job, asynchronous=is_asgi(request))
+            if events is None:
+                response = standard_response(
+                    success=False,
+                    error="too many event streams",
+                    message="Trop de suivis de jobs ouverts, réessayez plus tard",
+                    status_code=503
+                )
+                response['Retry-After'] = '5'
+                response.content_type = 'application/json'
+                return response
+            
+            response = StreamingHttpResponse(events, content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+            
+        except Exception as e:
+            response = handle_exception(e, "stream_processing_job_events", "Impossible de suivre le job de traitement")
+            response.content_type = 'application/json'
+            return response
     
     @action(detail=False, methods=['post'])
     def execute(self, request):
-        """Exécuter un algorithme de traitement avec suivi détaillé"""
+        """Mettre en file un algorithme de traitement et renvoyer immédiatement son job"""
         try:
             algorithm_name = request.data.get('algorithm')
             parameters = request.data.get('parameters', {})
@@ -281,40 +823,20 @@ class ProcessingViewSet(viewsets.GenericViewSet):
             
             session = get_object_or_404(ProjectSession, session_id=session_id)
             
-            # Créer un job de traitement
+            # Créer un job de traitement, exécuté par l'ordonnanceur
             job = ProcessingJob.objects.create(
                 session=session,
                 algorithm=algorithm_name,
                 parameters=parameters,
                 status='pending'
             )
-            
-            # Exécuter le traitement (pourrait être fait en arrière-plan avec Celery)
-            success, error = initialize_qgis_if_needed()
-            if not success:
-                job.status = 'failed'
-                job.error = error
-                job.save()
-                
-                return standard_response(
-                    success=False, 
-                    error=error, 
-                    message="Échec de l'initialisation de QGIS",
-                    status_code=500
-                )
-            
-            # Logique d'exécution du processing (similaire à l'original)
-            # ... (le code original de execute_processing adapté)
-            
-            # Mettre à jour le job
-            job.status = 'completed'
-            job.result = {}  # Remplacer par le résultat réel
-            job.save()
+            get_job_scheduler().notify()
             
             return standard_response(
                 success=True,
                 data=ProcessingJobSerializer(job).data,
-                message="Algorithme exécuté avec succès"
+                message="Algorithme mis en file d'attente",
+                status_code=202
             )
             
         except Exception as e:
@@ -332,30 +854,47 @@ class MapViewSet(viewsets.GenericViewSet):
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             
-            data = serializer.validated_data
-            session = get_object_or_404(ProjectSession, session_id=data['session_id'])
+            session = get_object_or_404(ProjectSession, session_id=serializer.validated_data['session_id'])
+            render = prepare_map_render(session, serializer)
+            result = None
+            if render['cached'] is None:
+                result = run_qgis_task('render_map', render['payload'])
             
-            # Logique de rendu de carte (similaire à l'original)
-            # ... (le code original de render_map adapté)
+            return standard_response(**map_render_result(request, session, render, result))
             
-            # Sauvegarder l'image générée
-            generated_file = GeneratedFile.objects.create(
-                session=session,
-                name=f"map_render_{session.session_id}",
-                file_type='image',
-                file_path='path/to/generated/image.png',  # Remplacer par le chemin réel
-                size=1000,  # Remplacer par la taille réelle
-                metadata=data
-            )
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
+        except Exception as e:
+            return handle_exception(e, "render_map", "Impossible de générer le rendu de la carte")
+    
+    def tiles(self, request, session_id=None, z=None, x=None, y=None):
+        """Obtenir une tuile XYZ de la carte de session depuis le cache disque"""
+        try:
+            if not tile_cache.is_valid_tile(z, x, y):
+                return standard_response(
+                    success=False,
+                    error="tile out of range",
+                    message="Coordonnées de tuile invalides",
+                    status_code=404
+                )
             
-            return standard_response(
-                success=True,
-                data=GeneratedFileSerializer(generated_file, context={'request': request}).data,
-                message="Carte générée avec succès"
-            )
+            session = get_object_or_404(ProjectSession, session_id=session_id)
+            reaper.touch_session(session.session_id)
+            # L'URL ne porte pas de révision : le client revalide la tuile par
+            # son ETag, qui change avec le jeu de couches
+            key = tile_cache.cache_key(session)
+            etag = make_etag('tile', key, z, x, y)
+            not_modified = conditional_response(request, etag)
+            if not_modified is not None:
+                return not_modified
+            
+            path = tile_cache.get_tile(session, z, x, y, key)
+            return set_validators(FileResponse(open(path, 'rb'), content_type='image/png'), etag)
             
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
         except Exception as e:
-            return handle_exception(e, "render_map", "Impossible de générer le rendu de la carte")
+            return handle_exception(e, "map_tile", "Impossible de générer la tuile")
     
     @action(detail=False, methods=['post'], serializer_class=PDFGenerateSerializer)
     def generate_pdf(self, request):
@@ -366,29 +905,272 @@ class MapViewSet(viewsets.GenericViewSet):
             
             data = serializer.validated_data
             session = get_object_or_404(ProjectSession, session_id=data['session_id'])
+            reaper.touch_session(session.session_id)
+            
+            cache_params = serializer.data
+            template = None
+            if data.get('template'):
+                template = get_object_or_404(LayoutTemplate, name=data['template'])
+                cache_params = {**cache_params, 'template_version': template.version}
+            
+            cache_key = render_cache.make_key('pdf', session, cache_params)
+            cached_file = render_cache.lookup(session, cache_key)
+            if cached_file is not None:
+                return standard_response(
+                    success=True,
+                    data=GeneratedFileSerializer(cached_file, context={'request': request}).data,
+                    message="PDF généré avec succès",
+                    metadata={'cache': 'hit'}
+                )
             
-            # Logique de génération PDF (similaire à l'original)
-            # ... (le code original de generate_advanced_pdf adapté)
+            relative_path, output_path = generated_file_path('pdf')
+            payload = {
+                **session_payload(session),
+                'layout_config': data['layout_config'],
+                'output_path': output_path,
+            }
+            if template is not None:
+                payload['template'] = template.template_payload()
+                payload['variables'] = data['variables']
+            result = run_qgis_task('generate_pdf', payload)
             
             # Sauvegarder le PDF généré
             generated_file = GeneratedFile.objects.create(
                 session=session,
                 name=data['output_filename'],
                 file_type='pdf',
-                file_path='path/to/generated/file.pdf',  # Remplacer par le chemin réel
-                size=1000,  # Remplacer par la taille réelle
-                metadata=data
+                file_path=relative_path,
+                size=result['size'],
+                metadata={**serializer.data, 'pages': result['pages']},
+                cache_key=cache_key
             )
             
             return standard_response(
                 success=True,
                 data=GeneratedFileSerializer(generated_file, context={'request': request}).data,
-                message="PDF généré avec succès"
+                message="PDF généré avec succès",
+                metadata={'cache': 'miss' if cache_key else 'disabled'}
             )
             
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
         except Exception as e:
             return handle_exception(e, "generate_advanced_pdf", "Impossible de générer le PDF avancé")
 
+    @action(detail=False, methods=['post'], serializer_class=PDFBatchGenerateSerializer)
+    def generate_pdf_batch(self, request):
+        """Générer un lot de croquis PDF suivi comme un seul job"""
+        try:
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            
+            data = serializer.validated_data
+            session = get_object_or_404(ProjectSession, session_id=data['session_id'])
+            
+            # Résoudre les couches des entrées désignées par une entité
+            sources = dict(Layer.objects.filter(session=session).values_list('layer_id', 'source'))
+            entries = serializer.data['entries']
+            for entry in entries:
+                if not entry.get('bbox'):
+                    if not sources.get(entry['layer_id']):
+                        return standard_response(
+                            success=False,
+                            error=f"unknown layer {entry['layer_id']}",
+                            message=f"Couche '{entry['layer_id']}' introuvable dans la session",
+                            status_code=400
+                        )
+                    entry['source'] = sources[entry['layer_id']]
+            
+            parameters = {**serializer.data, 'entries': entries}
+            if data.get('template'):
+                template = get_object_or_404(LayoutTemplate, name=data['template'])
+                parameters['layout_template'] = template.template_payload()
+            
+            job = ProcessingJob.objects.create(
+                session=session,
+                algorithm=PDF_BATCH_ALGORITHM,
+                parameters=parameters,
+                progress={'done': 0, 'total': len(entries), 'percent': 0.0, 'current': None},
+                status='pending'
+            )
+            get_job_scheduler().notify()
+            
+            return standard_response(
+                success=True,
+                data=ProcessingJobSerializer(job).data,
+                message=f"Lot de {len(entries)} croquis mis en file d'attente",
+                status_code=202
+            )
+            
+        except Exception as e:
+            return handle_exception(e, "generate_pdf_batch", "Impossible de lancer la génération du lot de PDF")
+
+class LayoutTemplateViewSet(viewsets.GenericViewSet):
+    """Modèles de mise en page nommés, compilés en .qpt"""
+    queryset = LayoutTemplate.objects.all()
+    serializer_class = LayoutTemplateSerializer
+    permission_classes = [AllowAny]
+    
+    def _compile(self, template):
+        """Construire le .qpt de la version courante du modèle"""
+        relative_path = os.path.join('layout_templates', f"{template.template_id}_v{template.version}.qpt")
+        result = run_qgis_task('compile_layout_template', {
+            'layout_config': template.layout_config,
+            'output_path': os.path.join(settings.MEDIA_ROOT, relative_path),
+        })
+        template.template_file.name = relative_path
+        template.items = result['items']
+    
+    def list(self, request):
+        """Lister les modèles de mise en page"""
+        try:
+            templates = self.get_queryset().order_by('name')
+            return standard_response(
+                success=True,
+                data=self.get_serializer(templates, many=True).data,
+                message="Modèles de mise en page récupérés"
+            )
+        except Exception as e:
+            return handle_exception(e, "list_layout_templates", "Impossible de récupérer les modèles")
+    
+    def retrieve(self, request, pk=None):
+        """Obtenir un modèle de mise en page"""
+        try:
+            template = get_object_or_404(LayoutTemplate, template_id=pk)
+            return standard_response(
+                success=True,
+                data=self.get_serializer(template).data,
+                message="Modèle de mise en page récupéré"
+            )
+        except Exception as e:
+            return handle_exception(e, "get_layout_template", "Impossible de récupérer le modèle")
+    
+    def create(self, request):
+        """Enregistrer un modèle et le compiler une fois pour toutes"""
+        try:
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            
+            template = LayoutTemplate(**serializer.validated_data)
+            self._compile(template)
+            template.save()
+            
+            return standard_response(
+                success=True,
+                data=self.get_serializer(template).data,
+                message="Modèle de mise en page enregistré",
+                status_code=201
+            )
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
+        except Exception as e:
+            return handle_exception(e, "create_layout_template", "Impossible d'enregistrer le modèle")
+    
+    def update(self, request, pk=None, partial=False):
+        """Modifier un modèle : nouvelle version, nouveau .qpt"""
+        try:
+            template = get_object_or_404(LayoutTemplate, template_id=pk)
+            serializer = self.get_serializer(template, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            
+            previous_file = template.template_file.name
+            for field, value in serializer.validated_data.items():
+                setattr(template, field, value)
+            template.version += 1
+            self._compile(template)
+            template.save()
+            if previous_file:
+                template.template_file.storage.delete(previous_file)
+            
+            return standard_response(
+                success=True,
+                data=self.get_serializer(template).data,
+                message=f"Modèle de mise en page mis à jour (v{template.version})"
+            )
+        except WorkerPoolSaturated as e:
+            return pool_saturated_response(e)
+        except Exception as e:
+            return handle_exception(e, "update_layout_template", "Impossible de modifier le modèle")
+    
+    def partial_update(self, request, pk=None):
+        return self.update(request, pk=pk, partial=True)
+    
+    def destroy(self, request, pk=None):
+        """Supprimer un modèle et son .qpt"""
+        try:
+            template = get_object_or_404(LayoutTemplate, template_id=pk)
+            if template.template_file:
+                template.template_file.delete(save=False)
+            template.delete()
+            return standard_response(
+                success=True,
+                message="Modèle de mise en page supprimé"
+            )
+        except Exception as e:
+            return handle_exception(e, "delete_layout_template", "Impossible de supprimer le modèle")
+
+class GeneratedFileViewSet(viewsets.GenericViewSet):
+    """Fichiers générés : description et contenu, avec requêtes conditionnelles"""
+    queryset = GeneratedFile.objects.all()
+    serializer_class = GeneratedFileSerializer
+    permission_classes = [AllowAny]
+    
+    def _get_file(self, pk):
+        generated_file = get_object_or_404(GeneratedFile, file_id=pk)
+        if not generated_file.content_hash:
+            # Fichiers antérieurs au calcul de l'empreinte à la création
+            generated_file.content_hash = file_sha256(generated_file.file_path.path)
+            GeneratedFile.objects.filter(pk=generated_file.pk).update(content_hash=generated_file.content_hash)
+        return generated_file
+    
+    def _missing_file_response(self, e):
+        """404 lorsque le fichier a disparu du disque"""
+        logger.warning(f"Fichier généré absent du disque: {e}")
+        return standard_response(
+            success=False,
+            error="file not found on disk",
+            message="Fichier généré introuvable",
+            status_code=404
+        )
+    
+    def retrieve(self, request, pk=None):
+        """Description d'un fichier généré"""
+        try:
+            generated_file = self._get_file(pk)
+            etag = make_etag('file', generated_file.file_id, generated_file.content_hash)
+            not_modified = conditional_response(request, etag, generated_file.created_at)
+            if not_modified is not None:
+                return not_modified
+            
+            return set_validators(standard_response(
+                success=True,
+                data=self.get_serializer(generated_file).data,
+                message="Fichier généré récupéré"
+            ), etag, generated_file.created_at)
+            
+        except OSError as e:
+            return self._missing_file_response(e)
+        except Exception as e:
+            return handle_exception(e, "get_generated_file", "Impossible de récupérer le fichier généré")
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Contenu d'un fichier généré (Range, sendfile ou proxy) ; l'ETag est l'empreinte du contenu"""
+        try:
+            generated_file = self._get_file(pk)
+            reaper.touch_session(generated_file.session_id)
+            not_modified = conditional_response(request, generated_file.content_hash, generated_file.created_at)
+            if not_modified is not None:
+                return not_modified
+            
+            response = file_response(request, generated_file, generated_file.content_hash, generated_file.created_at)
+            return set_validators(response, generated_file.content_hash, generated_file.created_at)
+            
+        except OSError as e:
+            return self._missing_file_response(e)
+        except Exception as e:
+            return handle_exception(e, "download_generated_file", "Impossible de télécharger le fichier généré")
+
 class QRViewSet(viewsets.GenericViewSet):
     permission_classes = [AllowAny]
     serializer_class = QRScanSerializer
@@ -421,27 +1203,21 @@ class HealthCheckViewSet(viewsets.GenericViewSet):
     @action(detail=False, methods=['get'])
     def ping(self, request):
         """Endpoint de test pour vérifier que le service est actif"""
-        manager = get_qgis_manager()
-        return standard_response(
-            success=True,
-            data={
-                "status": "ok",
-                "service": "FlashCroquis API",
-                "version": "1.0.0",
-                "qgis_initialized": manager.is_initialized()
-            },
-            message="Service en ligne et opérationnel"
-        )
+        return standard_response(**ping_status())
     
     @action(detail=False, methods=['get'])
     def health(self, request):
-        """Vérification de santé de l'API"""
-        return standard_response(
-            success=True,
-            data={
-                "status": "healthy",
-                "timestamp": datetime.now().isoformat(),
-                "qgis_ready": get_qgis_manager().is_initialized()
-            },
-            message="Service opérationnel"
+        """Vérification de santé de l'API
+        
+        Sert de sonde de disponibilité : 503 tant que QGIS n'est pas prêt dans
+        ce processus, dont l'initialisation est alors lancée si besoin.
+        """
+        return standard_response(**health_status())
+    
+    @action(detail=False, methods=['get'], renderer_classes=[PrometheusTextRenderer])
+    def metrics(self, request):
+        """Histogrammes de performance par action, au format texte Prometheus"""
+        return Response(
+            metrics.registry.render_prometheus(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
         )
\ No newline at end of file
@@ -0,0 +1,481 @@
+"""
+Pool de processus QGIS pré-initialisés.
+
+Chaque worker est un processus séparé qui appelle `QgisManager.initialize()`
+une seule fois au démarrage puis exécute les tâches de `tasks.py` reçues par
+un `Pipe` multiprocessing. Les rendus et traitements ne se partagent donc plus
+une seule instance QGIS ni un seul GIL.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+import multiprocessing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+worker_pool = None
+worker_pool_lock = threading.Lock()
+inline_lock = threading.Lock()
+
+DEFAULT_POOL_CONFIG = {
+    'ENABLED': True,
+    'SIZE': max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))),
+    'MAX_JOBS_PER_WORKER': 200,
+    'MAX_MEMORY_MB': 1024,
+    'ACQUIRE_TIMEOUT': 5.0,
+    'JOB_TIMEOUT': 300.0,
+    'STARTUP_TIMEOUT': 120.0,
+    'MAX_WAITING': 32,
+}
+
+
+class WorkerPoolError(Exception):
+    """Erreur du pool de workers QGIS"""
+
+
+class WorkerPoolSaturated(WorkerPoolError):
+    """Tous les workers sont occupés et la file d'attente est pleine"""
+
+
+class JobCancelled(WorkerPoolError):
+    """Tâche interrompue par une annulation"""
+
+
+class WorkerJobError(WorkerPoolError):
+    """Erreur levée par une tâche dans un worker"""
+
+    def __init__(self, error_type, message, remote_traceback=None):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+        self.message = message
+        self.remote_traceback = remote_traceback
+
+
+def get_pool_config():
+    """Configuration du pool fusionnée avec les valeurs par défaut"""
+    config = dict(DEFAULT_POOL_CONFIG)
+    config.update(getattr(settings, 'QGIS_WORKER_POOL', {}))
+    return config
+
+
+def _resident_memory_mb():
+    """Mémoire résidente du processus courant en Mo"""
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker_main(conn, max_jobs, max_memory_mb):
+    """Boucle principale d'un worker QGIS"""
+    from .qgis_manager import get_qgis_manager, get_startup_config
+    from . import tasks
+
+    manager = get_qgis_manager()
+    attempts = get_startup_config()['WORKER_INIT_ATTEMPTS']
+    success, error = manager.initialize()
+    for _ in range(attempts - 1):
+        if success:
+            break
+        time.sleep(manager.retry_in())
+        success, error = manager.initialize()
+    conn.send({
+        'status': 'ready', 'success': success, 'error': error, 'pid': os.getpid(),
+        'timings': manager.timings,
+    })
+    if not success:
+        conn.close()
+        return
+
+    jobs_done = 0
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+
+        task_name, payload = message
+
+        def send_progress(data):
+            conn.send({'status': 'progress', 'data': data})
+
+        try:
+            reply = {'status': 'ok', 'result': tasks.run_task(manager, task_name, payload, send_progress)}
+        except Exception as e:
+            reply = {
+                'status': 'error',
+                'type': type(e).__name__,
+                'message': str(e),
+                'traceback': traceback.format_exc(),
+            }
+
+        jobs_done += 1
+        reply['recycle'] = jobs_done >= max_jobs or (
+            bool(max_memory_mb) and _resident_memory_mb() > max_memory_mb
+        )
+        conn.send(reply)
+        if reply['recycle']:
+            break
+    conn.close()
+
+
+class _Worker:
+    """Processus worker et son extrémité de canal côté parent"""
+
+    def __init__(self, context, max_jobs, max_memory_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, max_jobs, max_memory_mb),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.init_error = None
+        self.startup_timings = None
+        self._ready_lock = threading.Lock()
+        self.cancelled = False
+        self.jobs_done = 0
+        # Sessions à retirer du cache de projets, transmises avec la prochaine tâche
+        self.pending_evictions = []
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def _read_ready(self):
+        try:
+            message = self.conn.recv()
+        except (EOFError, OSError):
+            self.init_error = "processus arrêté pendant l'initialisation"
+            return
+        self.startup_timings = message.get('timings')
+        if message['success']:
+            self.ready = True
+        else:
+            self.init_error = message['error']
+
+    def wait_ready(self, timeout):
+        """Attendre la fin de l'initialisation QGIS du worker"""
+        with self._ready_lock:
+            if not self.ready and self.init_error is None:
+                if not self.conn.poll(timeout):
+                    raise WorkerPoolError(f"Le worker {self.pid} n'a pas démarré en {timeout}s")
+                self._read_ready()
+        if self.init_error is not None:
+            raise WorkerPoolError(f"Échec de l'initialisation QGIS du worker {self.pid}: {self.init_error}")
+
+    def check_ready(self):
+        """Relever sans attendre le message de fin d'initialisation ; vrai si QGIS est prêt"""
+        if self.ready:
+            return True
+        if not self._ready_lock.acquire(blocking=False):
+            return False
+        try:
+            if not self.ready and self.init_error is None and self.conn.poll(0):
+                self._read_ready()
+            return self.ready
+        finally:
+            self._ready_lock.release()
+
+    def call(self, task_name, payload, timeout, on_progress=None):
+        """Envoyer une tâche et attendre la réponse, en relayant sa progression"""
+        self.conn.send((task_name, payload))
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self.conn.poll(max(0, deadline - time.monotonic())):
+                raise WorkerPoolError(f"Tâche {task_name} interrompue après {timeout}s")
+            reply = self.conn.recv()
+            if reply['status'] != 'progress':
+                break
+            if on_progress is not None:
+                try:
+                    on_progress(reply['data'])
+                except Exception as e:
+                    logger.warning(f"Erreur du suivi de progression de {task_name}: {e}")
+        self.jobs_done += 1
+        return reply
+
+    def stop(self, timeout=5):
+        """Arrêter le worker proprement, puis de force si nécessaire"""
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self.conn.close()
+
+
+class QgisWorkerPool:
+    """Pool de N processus QGIS avec recyclage et contre-pression"""
+
+    def __init__(self, size, max_jobs_per_worker, max_memory_mb, acquire_timeout,
+                 job_timeout, startup_timeout, max_waiting):
+        self.size = max(1, size)
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_memory_mb = max_memory_mb
+        self.acquire_timeout = acquire_timeout
+        self.job_timeout = job_timeout
+        self.startup_timeout = startup_timeout
+        self.max_waiting = max_waiting
+
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._waiting = 0
+        self._started = False
+        self._active = {}
+        self._counters = {
+            'jobs': 0, 'failed': 0, 'recycled': 0, 'crashed': 0, 'cancelled': 0, 'rejected': 0
+        }
+
+    def start(self):
+        """Démarrer les workers ; l'initialisation QGIS se fait en parallèle"""
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+            self._started = True
+        logger.info(f"Pool QGIS démarré avec {self.size} workers")
+
+    def _spawn(self):
+        worker = _Worker(self._context, self.max_jobs_per_worker, self.max_memory_mb)
+        self._workers.add(worker)
+        return worker
+
+    def _replace(self, worker, reason):
+        """Remplacer un worker recyclé ou défaillant"""
+        worker.stop()
+        with self._lock:
+            self._workers.discard(worker)
+            self._counters[reason] += 1
+            replacement = self._spawn()
+        logger.info(f"Worker QGIS {worker.pid} remplacé par {replacement.pid} ({reason})")
+        self._idle.put(replacement)
+
+    def _acquire(self):
+        with self._lock:
+            if self.max_waiting is not None and self._waiting >= self.max_waiting:
+                self._counters['rejected'] += 1
+                raise WorkerPoolSaturated("File d'attente du pool QGIS pleine")
+            self._waiting += 1
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise WorkerPoolSaturated(f"Aucun worker QGIS disponible après {self.acquire_timeout}s")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def submit(self, task_name, payload, timeout=None, job_key=None, on_progress=None):
+        """Exécuter une tâche sur un worker libre et renvoyer son résultat"""
+        self.start()
+        worker = self._acquire()
+        while not worker.process.is_alive():
+            # Worker mort pendant qu'il attendait dans la file des libres
+            self._replace(worker, 'crashed')
+            worker = self._acquire()
+        with self._lock:
+            if job_key is not None:
+                self._active[job_key] = worker
+            evictions, worker.pending_evictions = worker.pending_evictions, []
+        if evictions:
+            payload = {**payload, 'evict_sessions': evictions}
+        try:
+            worker.wait_ready(self.startup_timeout)
+            reply = worker.call(task_name, payload, timeout or self.job_timeout, on_progress)
+        except (WorkerPoolError, EOFError, OSError) as e:
+            if worker.cancelled:
+                self._replace(worker, 'cancelled')
+                raise JobCancelled(f"Tâche {task_name} annulée") from e
+            self._replace(worker, 'crashed')
+            if isinstance(e, WorkerPoolError):
+                raise
+            raise WorkerPoolError(f"Le worker {worker.pid} s'est arrêté pendant {task_name}") from e
+        finally:
+            # Libération atomique vis-à-vis de `cancel` : une annulation arrivée
+            # après la réponse est vue ici, jamais par la tâche suivante
+            with self._lock:
+                if job_key is not None and self._active.get(job_key) is worker:
+                    del self._active[job_key]
+                cancelled = worker.cancelled
+
+        with self._lock:
+            self._counters['jobs'] += 1
+            if reply['status'] != 'ok':
+                self._counters['failed'] += 1
+        if cancelled:
+            self._replace(worker, 'cancelled')
+            raise JobCancelled(f"Tâche {task_name} annulée")
+        if reply['recycle']:
+            self._replace(worker, 'recycled')
+        elif not worker.process.is_alive():
+            self._replace(worker, 'crashed')
+        else:
+            self._idle.put(worker)
+
+        if reply['status'] != 'ok':
+            raise WorkerJobError(reply['type'], reply['message'], reply.get('traceback'))
+        return reply['result']
+
+    def cancel(self, job_key):
+        """Interrompre la tâche associée à `job_key` en arrêtant son worker"""
+        with self._lock:
+            worker = self._active.get(job_key)
+            if worker is None:
+                return False
+            worker.cancelled = True
+            worker.process.terminate()
+        return True
+
+    def revive(self):
+        """Remplacer les workers libres dont l'initialisation de QGIS a échoué"""
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in idle:
+            if not worker.check_ready() and worker.init_error is not None:
+                self._replace(worker, 'crashed')
+            else:
+                self._idle.put(worker)
+
+    def is_ready(self):
+        """Vrai dès qu'un worker a initialisé QGIS
+        
+        Un seul suffit : pendant le recyclage d'un worker, les autres servent.
+        """
+        with self._lock:
+            return self._started and any(w.check_ready() for w in self._workers)
+
+    def evict_sessions(self, session_ids):
+        """Faire oublier des sessions aux caches de projets des workers, sans les bloquer"""
+        with self._lock:
+            for worker in self._workers:
+                worker.pending_evictions.extend(session_ids)
+
+    def shutdown(self):
+        """Arrêter tous les workers"""
+        with self._lock:
+            workers, self._workers = list(self._workers), set()
+            self._started = False
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for worker in workers:
+            worker.stop()
+
+    def stats(self):
+        """Statistiques du pool pour le health check"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'alive': sum(1 for w in self._workers if w.process.is_alive()),
+                'ready': sum(1 for w in self._workers if w.check_ready()),
+                'idle': self._idle.qsize(),
+                'waiting': self._waiting,
+                **self._counters,
+                'startup_timings': {
+                    str(w.pid): w.startup_timings for w in self._workers if w.startup_timings
+                },
+            }
+
+
+def get_worker_pool():
+    """Obtenir le pool de workers global, ou None s'il est désactivé"""
+    global worker_pool
+    config = get_pool_config()
+    if not config['ENABLED']:
+        return None
+    if worker_pool is None:
+        with worker_pool_lock:
+            if worker_pool is None:
+                worker_pool = QgisWorkerPool(
+                    size=config['SIZE'],
+                    max_jobs_per_worker=config['MAX_JOBS_PER_WORKER'],
+                    max_memory_mb=config['MAX_MEMORY_MB'],
+                    acquire_timeout=config['ACQUIRE_TIMEOUT'],
+                    job_timeout=config['JOB_TIMEOUT'],
+                    startup_timeout=config['STARTUP_TIMEOUT'],
+                    max_waiting=config['MAX_WAITING'],
+                )
+                atexit.register(worker_pool.shutdown)
+    return worker_pool
+
+
+def run_qgis_task(task_name, payload, timeout=None, job_key=None, on_progress=None):
+    """Exécuter une tâche QGIS via le pool, ou en ligne si le pool est désactivé"""
+    started = time.perf_counter()
+    try:
+        return _run_qgis_task(task_name, payload, timeout, job_key, on_progress)
+    finally:
+        metrics.record_qgis_time(time.perf_counter() - started)
+
+
+async def arun_qgis_task(task_name, payload, timeout=None, job_key=None, on_progress=None):
+    """Version attendable de `run_qgis_task` pour les vues asynchrones
+    
+    Le thread emprunté ne fait qu'attendre la réponse du worker QGIS : la
+    boucle d'événements reste libre pour les autres requêtes.
+    """
+    return await sync_to_async(run_qgis_task, thread_sensitive=False)(
+        task_name, payload, timeout, job_key, on_progress
+    )
+
+
+def _run_qgis_task(task_name, payload, timeout, job_key, on_progress):
+    if job_key is not None:
+        payload = {**payload, 'job_key': job_key}
+
+    pool = get_worker_pool()
+    if pool is not None:
+        return pool.submit(task_name, payload, timeout=timeout, job_key=job_key, on_progress=on_progress)
+
+    from .qgis_manager import get_qgis_manager, initialize_qgis_if_needed
+    from . import tasks
+
+    success, error = initialize_qgis_if_needed()
+    if not success:
+        raise WorkerPoolError(f"Échec de l'initialisation de QGIS: {error}")
+    started = time.monotonic()
+    # Une seule QgsApplication pour tout le processus : les tâches en ligne,
+    # de session ou non, ne s'exécutent jamais en parallèle
+    with inline_lock:
+        result = tasks.run_task(get_qgis_manager(), task_name, payload, on_progress)
+    logger.debug(f"Tâche {task_name} exécutée en ligne en {time.monotonic() - started:.3f}s")
+    if job_key is not None and tasks.was_cancelled(job_key):
+        raise JobCancelled(f"Tâche {task_name} annulée")
+    return result
+
+
+def cancel_qgis_task(job_key):
+    """Annuler une tâche en cours identifiée par `job_key`"""
+    pool = get_worker_pool()
+    if pool is not None:
+        return pool.cancel(job_key)
+
+    from . import tasks
+    return tasks.cancel_feedback(job_key)
@@ -0,0 +1,69 @@
+"""
+Configuration gunicorn du mode production.
+
+    gunicorn -c gunicorn.conf.py flashcroquisapi.wsgi:application
+
+L'application n'est pas préchargée dans le maître : chaque worker gunicorn
+charge Django après le fork, puis démarre son propre pool de processus QGIS
+(`post_worker_init`). Rien de QGIS ni de Qt n'est donc hérité d'un fork.
+Les workers sont recyclés après `max_requests` requêtes (avec une gigue pour
+ne pas les redémarrer tous ensemble) et arrêtent leur pool en sortant.
+
+Chaque pool compte cpu_count // WEB_CONCURRENCY processus QGIS (au moins 1,
+QGIS_WORKER_POOL_SIZE pour le fixer) : WEB_CONCURRENCY × taille du pool
+processus QGIS au total, soit environ un par cœur.
+
+Pour servir les vues asynchrones de /api/async/ sans thread par client :
+
+    GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker \
+        gunicorn -c gunicorn.conf.py flashcroquisapi.asgi:application
+
+`/api/health/health/` répond 503 tant que QGIS n'est pas prêt dans le worker
+interrogé : à utiliser comme sonde de disponibilité.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+
+# WEB_CONCURRENCY est exporté pour que chaque worker dimensionne son pool QGIS
+# en conséquence (QGIS_WORKER_POOL['SIZE'] : cpu_count // WEB_CONCURRENCY)
+os.environ.setdefault('WEB_CONCURRENCY', '2')
+
+# Les vues attendent les workers QGIS : des threads par worker gardent les
+# requêtes légères (tuiles en cache, statuts de jobs) servies pendant un rendu
+workers = max(1, int(os.environ['WEB_CONCURRENCY']))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+preload_app = False
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 330))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    """Initialiser QGIS dans le worker dès son démarrage, sans attendre la première requête"""
+    from flashcroquisapi.qgis_manager import warm_up
+    warm_up()
+    worker.log.info(f"Worker {worker.pid}: initialisation de QGIS lancée")
+
+
+def worker_exit(server, worker):
+    """Remettre en file les jobs du worker, puis arrêter ses processus QGIS
+    
+    L'ordonnanceur est arrêté en premier : ses jobs `running` repassent
+    `pending` avant que l'arrêt du pool n'interrompe leurs tâches.
+    """
+    from flashcroquisapi import scheduler, worker_pool
+    if scheduler.job_scheduler is not None:
+        scheduler.job_scheduler.stop()
+    if worker_pool.worker_pool is not None:
+        worker_pool.worker_pool.shutdown()
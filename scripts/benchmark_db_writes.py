@@ -0,0 +1,101 @@
+"""
+Débit d'écriture concurrente selon la configuration de la base.
+
+Chaque scénario tourne dans un sous-processus sur une base neuve : N threads
+enchaînent les écritures du chemin chaud de l'API (création de couche, job de
+traitement créé puis mis à jour, fichier généré) et l'on compte les écritures
+par seconde et les erreurs « database is locked ».
+
+    python scripts/benchmark_db_writes.py [--threads 8] [--writes 200]
+
+Le scénario PostgreSQL n'est lancé que si POSTGRES_HOST est défini.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = [
+    ('SQLite (journal par défaut)', {'DB_ENGINE': 'sqlite', 'SQLITE_TUNING': '0'}),
+    ('SQLite (WAL + réglages)', {'DB_ENGINE': 'sqlite', 'SQLITE_TUNING': '1'}),
+    ('PostgreSQL (connexions persistantes)', {'DB_ENGINE': 'postgresql', 'DB_POOL': '0'}),
+    ('PostgreSQL (pool psycopg)', {'DB_ENGINE': 'postgresql', 'DB_POOL': '1'}),
+]
+
+
+def run_worker(threads, writes):
+    """Exécuter un scénario dans ce processus et afficher `écritures erreurs secondes`"""
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flashcroquisapi.settings')
+    os.environ['QGIS_WORKER_POOL_ENABLED'] = '0'
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import OperationalError, close_old_connections
+    from flashcroquisapi.models import ProjectSession, Layer, ProcessingJob, GeneratedFile
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    session = ProjectSession.objects.create(project_title='benchmark')
+    counts = {'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def writer(index):
+        done, errors = 0, 0
+        for i in range(writes):
+            try:
+                Layer.objects.create(session=session, layer_id=f"bench_{index}_{i}", name='bench')
+                job = ProcessingJob.objects.create(session=session, algorithm='native:buffer')
+                ProcessingJob.objects.filter(pk=job.pk).update(status='completed')
+                GeneratedFile.objects.create(
+                    session=session, name='bench.png', file_type='image', file_path=f"generated_files/{job.pk}.png"
+                )
+                done += 4
+            except OperationalError:
+                errors += 1
+        close_old_connections()
+        with lock:
+            counts['writes'] += done
+            counts['errors'] += errors
+
+    pool = [threading.Thread(target=writer, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    print(counts['writes'], counts['errors'], time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.threads, args.writes)
+        return
+
+    print(f"{args.threads} threads x {args.writes} itérations (4 écritures chacune)")
+    for label, env in SCENARIOS:
+        if env['DB_ENGINE'] == 'postgresql' and not os.environ.get('POSTGRES_HOST'):
+            continue
+        with tempfile.TemporaryDirectory() as work_dir:
+            scenario_env = {**os.environ, **env, 'DB_NAME': os.path.join(work_dir, 'bench.sqlite3')}
+            output = subprocess.run(
+                [sys.executable, __file__, '--worker', '--threads', str(args.threads), '--writes', str(args.writes)],
+                env=scenario_env, capture_output=True, text=True, check=True
+            ).stdout.split()
+        writes, errors, elapsed = int(output[0]), int(output[1]), float(output[2])
+        print(f"{label:<38} {writes / elapsed:8.0f} écritures/s  {errors:5d} erreurs  {elapsed:6.2f}s")
+
+
+if __name__ == '__main__':
+    main()
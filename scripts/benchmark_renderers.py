@@ -0,0 +1,91 @@
+"""
+Comparer le rendu JSON par défaut de DRF et FastJSONRenderer sur une réponse
+`standard_response` de 10 000 entités GeoJSON.
+
+    python scripts/benchmark_renderers.py [--features 10000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flashcroquisapi.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from flashcroquisapi import renderers  # noqa: E402
+from flashcroquisapi.utils import standard_response  # noqa: E402
+
+
+def build_payload(count):
+    """Enveloppe standard_response contenant `count` entités polygonales"""
+    features = []
+    for i in range(count):
+        x, y = -5.0 + (i % 100) * 0.01, 12.0 + (i // 100) * 0.01
+        features.append({
+            'type': 'Feature',
+            'id': i,
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[x, y], [x + 0.01, y], [x + 0.01, y + 0.01], [x, y + 0.01], [x, y]]],
+            },
+            'properties': {
+                'parcelle_id': str(uuid.uuid4()),
+                'section': f"S{i % 40:02d}",
+                'numero': i,
+                'surface': 1234.5678 + i,
+                'proprietaire': 'Kaboré Aminata',
+                'date_levee': datetime(2024, 1, 1 + i % 28, 10, 30),
+            },
+        })
+    return standard_response(
+        success=True,
+        data={'type': 'FeatureCollection', 'features': features},
+        message=f"{count} entités récupérées",
+        metadata={'session_id': uuid.uuid4(), 'count': count},
+    ).data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--features', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = build_payload(args.features)
+    candidates = [
+        ('JSONRenderer (DRF)', JSONRenderer()),
+        (f"FastJSONRenderer ({'orjson' if renderers.orjson else 'json'})", renderers.FastJSONRenderer()),
+    ]
+    if renderers.orjson is not None:
+        # Même rendu en forçant le repli sur la bibliothèque standard
+        orjson_module = renderers.orjson
+
+        class StdlibFastJSONRenderer(renderers.FastJSONRenderer):
+            def render(self, data, accepted_media_type=None, renderer_context=None):
+                renderers.orjson = None
+                try:
+                    return super().render(data, accepted_media_type, renderer_context)
+                finally:
+                    renderers.orjson = orjson_module
+
+        candidates.append(('FastJSONRenderer (json)', StdlibFastJSONRenderer()))
+
+    print(f"{args.features} entités, {args.repeat} répétitions")
+    baseline = None
+    for label, renderer in candidates:
+        size = len(renderer.render(payload, 'application/json', {}))
+        best = min(timeit.repeat(lambda: renderer.render(payload, 'application/json', {}), number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print(f"{label:<28} {best * 1000:8.1f} ms  {size / 1024:8.0f} Kio  x{baseline / best:.1f}")
+
+
+if __name__ == '__main__':
+    main()
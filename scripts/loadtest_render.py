@@ -0,0 +1,151 @@
+"""
+Débit de /api/map/render selon le nombre de workers gunicorn.
+
+Pour chaque nombre de workers, démarre gunicorn avec gunicorn.conf.py sur une
+base neuve, attend que la sonde /api/health/health/ réponde 200, puis envoie
+des rendus en parallèle pendant une durée fixe (cache de rendus désactivé)
+et affiche requêtes/s, latences p50/p95 et erreurs.
+
+    python scripts/loadtest_render.py [--workers 1,2,4] [--pool-size 1]
+                                      [--concurrency 16] [--duration 20]
+
+Avec --url, mesure un serveur déjà lancé au lieu d'en démarrer un.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def request(method, url, payload=None, timeout=330):
+    """Envoyer une requête JSON ; renvoie (statut, corps décodé)"""
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def wait_ready(base_url, workers, timeout):
+    """Attendre des réponses 200 consécutives de la sonde, le temps que chaque worker soit prêt"""
+    deadline = time.monotonic() + timeout
+    consecutive = 0
+    while time.monotonic() < deadline:
+        try:
+            status, _ = request('GET', f"{base_url}/api/health/health/", timeout=5)
+        except (urllib.error.URLError, ConnectionError):
+            status = None
+        consecutive = consecutive + 1 if status == 200 else 0
+        if consecutive >= 3 * workers:
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f"Serveur non prêt après {timeout}s")
+
+
+def load(base_url, session_id, concurrency, duration):
+    """Rendus en parallèle pendant `duration` secondes ; renvoie (latences, erreurs, durée)"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        i = 0
+        while time.monotonic() < deadline:
+            # Emprises distinctes : chaque requête est un vrai rendu
+            offset = (index * 1000 + i) * 1e-4
+            payload = {'session_id': session_id, 'width': 512, 'height': 512,
+                       'bbox': f"{-1 + offset},{-1 + offset},{1 + offset},{1 + offset}"}
+            started = time.perf_counter()
+            try:
+                status, _ = request('POST', f"{base_url}/api/map/render/", payload)
+            except (urllib.error.URLError, ConnectionError):
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def report(label, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    print(f"{label:<14} {len(latencies) / elapsed:8.1f} req/s  p50 {p50:7.0f} ms  p95 {p95:7.0f} ms  {errors:5d} erreurs")
+
+
+def measure(base_url, args):
+    status, body = request('POST', f"{base_url}/api/projects/", {'project_title': 'loadtest'})
+    if status != 201:
+        raise RuntimeError(f"Création de session impossible ({status})")
+    return load(base_url, body['session_id'], args.concurrency, args.duration)
+
+
+def run_server(workers, args):
+    """Démarrer gunicorn avec `workers` workers sur une base neuve et le mesurer"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = {
+            **os.environ,
+            'DB_NAME': os.path.join(work_dir, 'loadtest.sqlite3'),
+            'WEB_CONCURRENCY': str(workers),
+            'PORT': str(args.port),
+            'QGIS_WORKER_POOL_SIZE': str(args.pool_size),
+            'RENDER_CACHE_ENABLED': '0',
+            'GUNICORN_LOG_LEVEL': 'warning',
+        }
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput', '-v0'], cwd=ROOT, env=env, check=True)
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '',
+             'flashcroquisapi.wsgi:application'],
+            cwd=ROOT, env=env
+        )
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            wait_ready(base_url, workers, args.ready_timeout)
+            return measure(base_url, args)
+        finally:
+            server.terminate()
+            server.wait(timeout=90)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4', help="Nombres de workers gunicorn, séparés par des virgules")
+    parser.add_argument('--pool-size', type=int, default=1, help="Processus QGIS par worker gunicorn")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--port', type=int, default=18000)
+    parser.add_argument('--ready-timeout', type=float, default=180)
+    parser.add_argument('--url', help="Mesurer ce serveur déjà lancé (ex. http://127.0.0.1:10000)")
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} clients pendant {args.duration:.0f}s, rendus 512x512")
+    if args.url:
+        report(args.url, *measure(args.url.rstrip('/'), args))
+        return
+    for workers in [int(value) for value in args.workers.split(',')]:
+        report(f"{workers} workers", *run_server(workers, args))
+
+
+if __name__ == '__main__':
+    main()